@@ -0,0 +1,104 @@
+"""
+Рассылка событий комнат через channel layer.
+
+Все отправки идут в группу game_{room_id}, на которую подписаны
+GameConsumer/GameRoomConsumer и MuxConsumer с темой room:<id>; изменения
+списка комнат — в группу lobby (тема lobby). С многопроцессным слоем (Redis, см.
+CHANNEL_LAYERS в settings) событие доходит до сокетов во всех воркерах.
+
+Синхронный код (представления) вызывает broadcast_room_events один раз на
+запрос: все события отправляются за один переход в event loop, а не по
+async_to_sync на каждое сообщение. Разные группы обслуживаются параллельно,
+события одной группы — по порядку: получатели отбрасывают событие с seq не
+больше последнего доставленного, и обгон превратил бы его в потерю.
+
+Перед отправкой события комнат нумеруются (message['seq'], game.replay),
+чтобы переподключившийся клиент мог получить только пропущенное.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+from . import metrics, replay, ws_health
+
+logger = logging.getLogger(__name__)
+
+
+def room_group_name(room_id) -> str:
+    return f'game_{room_id}'
+
+
+LOBBY_GROUP = 'lobby'
+
+
+def lobby_event(room_id, status: str) -> tuple[str, dict]:
+    """Уведомление подписчикам лобби (MuxConsumer): комната появилась или изменилась."""
+    return LOBBY_GROUP, {'type': 'lobby_message', 'message': {'action': 'lobby_changed', 'room_id': int(room_id), 'status': status}}
+
+
+def room_event(room_id, message: dict) -> tuple[str, dict]:
+    """Событие для отправки в группу комнаты (обрабатывается GameConsumer.game_message)."""
+    return room_group_name(room_id), {'type': 'game_message', 'room_id': int(room_id), 'message': message}
+
+
+async def _timed_group_send(channel_layer, group, event):
+    action = event.get('message', {}).get('action', event.get('type'))
+    ws_health.before_group_send(channel_layer, group)
+    with metrics.CHANNEL_SEND_SECONDS.time(action):
+        await channel_layer.group_send(group, event)
+
+
+async def _send_group(channel_layer, group, events) -> int:
+    """События одной группы по очереди; ошибка одного не отменяет следующие."""
+    sent = 0
+    for event in events:
+        try:
+            await _timed_group_send(channel_layer, group, event)
+        except Exception as e:
+            logger.warning(f"group_send to {group} failed: {e!r}")
+        else:
+            sent += 1
+    return sent
+
+
+async def send_events(events) -> int:
+    """Отправляет пачку (группа, событие): группы параллельно, внутри группы по порядку. Возвращает число отправленных."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not events:
+        return 0
+
+    by_group: dict[str, list[dict]] = {}
+    for group, event in events:
+        by_group.setdefault(group, []).append(event)
+    results = await asyncio.gather(
+        *(_send_group(channel_layer, group, group_events) for group, group_events in by_group.items())
+    )
+    return sum(results)
+
+
+async def send_room_events(events) -> int:
+    """send_events с нумерацией событий комнат — для кода, уже работающего в event loop."""
+    events = list(events)
+    await database_sync_to_async(replay.sequence_events)(events)
+    return await send_events(events)
+
+
+def broadcast_room_events(events) -> int:
+    """Синхронная обертка над send_events для представлений и моделей."""
+    events = list(events)
+    if not events:
+        return 0
+    try:
+        replay.sequence_events(events)
+        return async_to_sync(send_events)(events)
+    except Exception as e:
+        # Рассылка не должна ломать ход: состояние уже сохранено в БД
+        logger.error(f"Failed to broadcast {len(events)} room events: {e}", exc_info=True)
+        return 0
+
+
+def broadcast_room_event(room_id, message: dict) -> int:
+    return broadcast_room_events([room_event(room_id, message)])
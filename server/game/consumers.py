@@ -1,14 +1,72 @@
-import json
+import asyncio
+import functools
+import typing
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
+from server.profiling import ProfiledConsumerMixin
 from .models import GameRoom
+from . import loop_lag, metrics, outbound, replay, sharding, spectators, wire, ws_health
+from .broadcast import LOBBY_GROUP, room_event, room_group_name, send_room_events
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Типы входящих сообщений для меток метрик (остальные — 'other')
+ROOM_MESSAGE_TYPES = frozenset({'ping'})
+GAME_MESSAGE_ACTIONS = frozenset({'join', 'play_card', 'move', 'status'})
+MUX_MESSAGE_ACTIONS = frozenset({'subscribe', 'unsubscribe', 'move', 'status', 'ping'})
+
+# Код закрытия соединения, вытесненного более новым соединением того же пользователя
+CLOSE_CODE_REPLACED = 4009
+# Код закрытия, если сессия принадлежит не тому пользователю, для которого открыт worker
+CLOSE_CODE_WRONG_USER = 4003
+
+
+class HealthTrackedMixin:
+    """Счетчики соединений и сообщений для game.ws_health."""
+    consumer_label = ''
+    _tracked = False
+    _tracked_room = None
+
+    async def accept(self, *args, **kwargs):
+        await super().accept(*args, **kwargs)
+        self._tracked = True
+        self._tracked_room = self.scope['url_route']['kwargs'].get('room_id')
+        ws_health.connection_opened(self.consumer_label, self._tracked_room, self)
+
+    async def websocket_receive(self, message):
+        ws_health.message_received(self.consumer_label)
+        await super().websocket_receive(message)
+
+    async def websocket_disconnect(self, message):
+        if self._tracked:
+            ws_health.connection_closed(self.consumer_label, self._tracked_room, self)
+            self._tracked = False
+            self._tracked_room = None
+        await super().websocket_disconnect(message)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        try:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+        except Exception as e:
+            ws_health.send_failed(self.consumer_label, e)
+            raise
+        ws_health.message_sent(self.consumer_label)
+
+    async def send_encoded(self, data):
+        """Кадр от game.wire: str уходит текстом, bytes — бинарным кадром."""
+        if isinstance(data, bytes):
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+
+class GameRoomConsumer(ProfiledConsumerMixin, HealthTrackedMixin, AsyncWebsocketConsumer):
+    consumer_label = 'room'
 
-class GameRoomConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.user = self.scope['user']
@@ -17,11 +75,12 @@ class GameRoomConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        self.codec = wire.negotiate(self.scope)
         await self.channel_layer.group_add(
             f"game_{self.room_id}",
             self.channel_name
         )
-        await self.accept()
+        await self.accept(subprotocol=self.codec.subprotocol)
         await self.update_activity()
         await self.check_room_status()
 
@@ -32,11 +91,16 @@ class GameRoomConsumer(AsyncWebsocketConsumer):
         )
         await self.check_room_status()
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        if data.get('type') == 'ping':
-            await self.update_activity()
-            await self.send(text_data=json.dumps({'type': 'pong'}))
+    async def receive(self, text_data=None, bytes_data=None):
+        data = wire.decode(text_data, bytes_data)
+        msg_type = data.get('type')
+        with metrics.WS_MESSAGE_SECONDS.time('room', msg_type if msg_type in ROOM_MESSAGE_TYPES else 'other'):
+            if msg_type == 'ping':
+                phases = metrics.PhaseTimer(metrics.PHASE_SECONDS, 'ping')
+                await self.update_activity()
+                phases.mark('update_activity')
+                await self.send_encoded(self.codec.encode({'type': 'pong'}))
+                phases.mark('send')
 
     @database_sync_to_async
     def update_activity(self):
@@ -61,45 +125,389 @@ class GameRoomConsumer(AsyncWebsocketConsumer):
         
         return 'active'
 
-class GameConsumer(AsyncWebsocketConsumer):
+class GameConsumer(ProfiledConsumerMixin, HealthTrackedMixin, AsyncWebsocketConsumer):
+    """
+    События комнаты и ходы по WebSocket. Клиент, переподключившийся с
+    ?last_seq=N, получает пропущенные события из game.replay или полное
+    состояние ('resync'), если они выпали из буфера.
+    """
+    consumer_label = 'game'
+    # Порядок и дубли событий комнаты (game.replay.SeqGate)
+    seq_gate = None
+    outbound = None
+
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'game_{self.room_id}'
+        self.codec = wire.negotiate(self.scope)
+        self.outbound = outbound.OutboundQueue(self.send_encoded, self.consumer_label, self.codec.encode)
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept(subprotocol=self.codec.subprotocol)
+        if self.room_id.isdigit():
+            await self.resume(self._requested_last_seq())
+
+    def _requested_last_seq(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        value = query.get('last_seq', [''])[0]
+        return int(value) if value.isdigit() else None
+
+    async def resume(self, last_seq):
+        user = self.scope.get('user')
+        messages, seq = await replay.resume(int(self.room_id), last_seq, user)
+        self.seq_gate = replay.SeqGate(int(self.room_id), seq, self.push, user)
+        for message in messages:
+            await self.push(message)
 
     async def disconnect(self, close_code):
+        if self.seq_gate is not None:
+            self.seq_gate.close()
+        if self.outbound is not None:
+            self.outbound.close()
+            self.outbound = None
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def push(self, message: dict):
+        """Отправка через исходящую очередь (game.outbound); медленный клиент отключается."""
+        if self.outbound is None:
+            return
+        if not self.outbound.put(message):
+            logger.warning(f"Closing slow WebSocket client in room {self.room_id}: {len(self.outbound)} messages queued")
+            self.outbound.close()
+            self.outbound = None
+            await self.close(code=outbound.CLOSE_CODE_TOO_SLOW)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = wire.decode(text_data, bytes_data)
         action = data.get('action')
 
-        if action == 'join':
-            await self.handle_join(data)
-        elif action == 'play_card':
-            await self.handle_play_card(data)
-        # ... другие действия
+        with metrics.WS_MESSAGE_SECONDS.time('game', action if action in GAME_MESSAGE_ACTIONS else 'other'):
+            if action == 'join':
+                await self.handle_join(data)
+            elif action == 'play_card':
+                await self.handle_play_card(data)
+            elif action in ('move', 'status'):
+                await self.handle_room_request(action, data)
+            # ... другие действия
 
     async def handle_join(self, data):
+        if loop_lag.shed('ws_join', loop_lag.TIER_REJECT):
+            await self.push({
+                'action': 'join_result', 'success': False, 'status': 503,
+                'error': 'Сервер перегружен, попробуйте через несколько секунд.',
+                'retry_after': loop_lag.retry_after(),
+            })
+            return
         # Логика присоединения к игре
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'game_message',
-                'message': {
-                    'action': 'player_joined',
-                    'player': data['player']
-                }
-            }
-        )
+        await send_room_events([room_event(self.room_id, {
+            'action': 'player_joined',
+            'player': data['player']
+        })])
+
+    async def game_message(self, event):
+        message = event['message']
+        seq = message.get('seq')
+        if seq is not None:
+            replay.buffer.record(event.get('room_id', int(self.room_id)), seq, message)
+            if self.seq_gate is not None:
+                await self.seq_gate.offer(seq, message)
+                return
+        await self.push(message)
+
+    async def handle_play_card(self, data):
+        await self.handle_room_request('move', {**data, 'action_type': 'play_card'})
+
+    async def handle_room_request(self, action, data):
+        """Ход или запрос состояния; выполняется на воркере-владельце комнаты (game.sharding)."""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.push({'action': f'{action}_result', 'success': False, 'error': 'Требуется авторизация.', 'status': 401})
+            return
+        if not self.room_id.isdigit():
+            # Маршрут ws/game/<room_id>/ пропускает любые \w+
+            await self.push({'action': f'{action}_result', 'success': False, 'error': 'Комната не найдена.', 'status': 404})
+            return
+
+        payload, status = await sharding.dispatch(action, self.room_id, user, data)
+        await self.push({'action': f'{action}_result', 'status': status, **payload})
+
+
+class SpectatorConsumer(ProfiledConsumerMixin, HealthTrackedMixin, AsyncWebsocketConsumer):
+    """
+    Трансляция партии зрителям: готовые кадры из группы spectate_{room_id}
+    уходят в сокет без повторной сериализации (game.spectators).
+    """
+    consumer_label = 'spectator'
+    sender = None
+
+    async def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        user = self.scope.get('user')
+        if not spectators.is_enabled() or user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        frame = await database_sync_to_async(spectators.current_frame)(self.room_id)
+        if frame is None:
+            await self.close()
+            return
+
+        self.group_name = spectators.spectator_group(self.room_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        self.sender = spectators.FrameSender(lambda text: self.send(text_data=text))
+        self.sender.push(frame)
+
+    async def disconnect(self, close_code):
+        if self.sender is not None:
+            self.sender.close()
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        # Зрители только слушают
+        pass
+
+    async def spectator_frame(self, event):
+        self.sender.push(event)
+
+
+# Открытые MuxConsumer по пользователям (в этом процессе), от старых к новым
+_user_connections: dict[int, list] = {}
+
+MUX_USERS = metrics.gauge(
+    'durak_mux_users',
+    'Users with an open multiplexed WebSocket in this worker.',
+    callback=lambda: len(_user_connections),
+)
+
+
+def parse_topic(topic) -> typing.Optional[tuple[str, typing.Optional[int]]]:
+    """'lobby' -> ('lobby', None); 'room:5' -> ('room', 5); 'spectate:5' -> ('spectate', 5)."""
+    if topic == 'lobby':
+        return 'lobby', None
+    kind, _, value = str(topic).partition(':')
+    if kind in ('room', 'spectate') and value.isdigit():
+        return kind, int(value)
+    return None
+
+
+class MuxConsumer(ProfiledConsumerMixin, HealthTrackedMixin, AsyncWebsocketConsumer):
+    """
+    Одно соединение пользователя на лобби и все комнаты (ws/mux/).
+
+    Клиент подписывается на темы сообщениями
+        {"action": "subscribe", "topic": "room:5", "last_seq": 12}
+        {"action": "unsubscribe", "topic": "room:5"}
+    Темы: lobby, room:<id> (события комнаты с досылкой по last_seq, как в
+    GameConsumer), spectate:<id> (кадры зрителя). Ходы и запросы состояния —
+    {"action": "move" | "status", "topic": "room:<id>", ...}. Входящие события
+    помечаются полем topic; кадры зрителя уходят готовым JSON
+    (action spectator_state) без topic.
+
+    Сессия и пользователь проверяются один раз при подключении; worker
+    браузера передает ожидаемого пользователя в ?user=<id>, и если сессия уже
+    другая (выход и вход под другим именем), соединение закрывается с кодом
+    4003. Если у пользователя больше MUX_MAX_CONNECTIONS_PER_USER соединений
+    в процессе, самое старое закрывается с кодом 4009.
+
+    Под нагрузкой (ступень TIER_THROTTLE, game.loop_lag) изменения лобби не
+    отправляются сразу: по каждой комнате остается последнее, и они уходят
+    пачкой через LOAD_SHED_COALESCE_SECONDS.
+    """
+    consumer_label = 'mux'
+    outbound = None
+    user_id = None
+    lobby_flush = None
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        expected_user = parse_qs(self.scope.get('query_string', b'').decode()).get('user', [''])[0]
+        if expected_user and expected_user != str(user.id):
+            await self.accept()
+            await self.close(code=CLOSE_CODE_WRONG_USER)
+            return
+
+        self.user_id = user.id
+        self.lobby_pending: dict[int, dict] = {}
+        self.topics: dict[str, str] = {}
+        self.seq_gates: dict[int, replay.SeqGate] = {}
+        self.spectator_senders: dict[int, spectators.FrameSender] = {}
+        self.codec = wire.negotiate(self.scope)
+        self.outbound = outbound.OutboundQueue(self.send_encoded, self.consumer_label, self.codec.encode)
+        await self.accept(subprotocol=self.codec.subprotocol)
+
+        connections = _user_connections.setdefault(self.user_id, [])
+        connections.append(self)
+        limit = getattr(settings, 'MUX_MAX_CONNECTIONS_PER_USER', 3)
+        while len(connections) > limit:
+            oldest = connections.pop(0)
+            logger.info(f"Closing replaced mux connection of user {self.user_id}")
+            await oldest.close(code=CLOSE_CODE_REPLACED)
+
+    async def disconnect(self, close_code):
+        if self.user_id is None:
+            return
+        connections = _user_connections.get(self.user_id, [])
+        if self in connections:
+            connections.remove(self)
+        if not connections:
+            _user_connections.pop(self.user_id, None)
+        for sender in self.spectator_senders.values():
+            sender.close()
+        for gate in self.seq_gates.values():
+            gate.close()
+        if self.lobby_flush is not None:
+            self.lobby_flush.cancel()
+            self.lobby_flush = None
+        if self.outbound is not None:
+            self.outbound.close()
+            self.outbound = None
+        for group in set(self.topics.values()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.topics.clear()
+
+    async def push(self, message):
+        if self.outbound is None:
+            return
+        if not self.outbound.put(message):
+            logger.warning(f"Closing slow mux client of user {self.user_id}: {len(self.outbound)} messages queued")
+            self.outbound.close()
+            self.outbound = None
+            await self.close(code=outbound.CLOSE_CODE_TOO_SLOW)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = wire.decode(text_data, bytes_data)
+        action = data.get('action')
+        topic = data.get('topic')
+
+        with metrics.WS_MESSAGE_SECONDS.time('mux', action if action in MUX_MESSAGE_ACTIONS else 'other'):
+            if action == 'subscribe':
+                await self.subscribe(topic, data.get('last_seq'))
+            elif action == 'unsubscribe':
+                await self.unsubscribe(topic)
+            elif action in ('move', 'status'):
+                await self.handle_room_request(action, topic, data)
+            elif action == 'ping':
+                await self.push({'action': 'pong'})
+            else:
+                await self.push({'action': 'error', 'topic': topic, 'error': f'Неизвестное действие: {action}'})
+
+    async def subscribe(self, topic, last_seq=None):
+        parsed = parse_topic(topic)
+        if parsed is None:
+            await self.push({'action': 'subscribe_result', 'topic': topic, 'success': False, 'error': 'Неизвестная тема.'})
+            return
+        if topic in self.topics:
+            await self.push({'action': 'subscribe_result', 'topic': topic, 'success': True})
+            return
+        if len(self.topics) >= getattr(settings, 'MUX_MAX_TOPICS', 20):
+            await self.push({'action': 'subscribe_result', 'topic': topic, 'success': False, 'error': 'Слишком много подписок.'})
+            return
+
+        kind, room_id = parsed
+        frame = None
+        if kind == 'spectate':
+            frame = await database_sync_to_async(spectators.current_frame)(room_id) if spectators.is_enabled() else None
+            if frame is None:
+                await self.push({'action': 'subscribe_result', 'topic': topic, 'success': False, 'error': 'Трансляция недоступна.'})
+                return
+            group = spectators.spectator_group(room_id)
+        elif kind == 'room':
+            group = room_group_name(room_id)
+        else:
+            group = LOBBY_GROUP
+
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.topics[topic] = group
+        await self.push({'action': 'subscribe_result', 'topic': topic, 'success': True})
+
+        if kind == 'room':
+            last_seq = int(last_seq) if str(last_seq).isdigit() else None
+            user = self.scope.get('user')
+            messages, seq = await replay.resume(room_id, last_seq, user)
+            self.seq_gates[room_id] = replay.SeqGate(room_id, seq, functools.partial(self._push_topic, topic), user)
+            for message in messages:
+                await self._push_topic(topic, message)
+        elif kind == 'spectate':
+            sender = self.spectator_senders[room_id] = spectators.FrameSender(self.push)
+            sender.push(frame)
+
+    async def unsubscribe(self, topic):
+        group = self.topics.pop(topic, None)
+        if group is not None:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            parsed = parse_topic(topic)
+            if parsed[0] == 'room':
+                gate = self.seq_gates.pop(parsed[1], None)
+                if gate is not None:
+                    gate.close()
+            elif parsed[0] == 'spectate':
+                sender = self.spectator_senders.pop(parsed[1], None)
+                if sender is not None:
+                    sender.close()
+            else:
+                self.lobby_pending.clear()
+        await self.push({'action': 'unsubscribe_result', 'topic': topic, 'success': True})
+
+    async def handle_room_request(self, action, topic, data):
+        parsed = parse_topic(topic)
+        if parsed is None or parsed[0] != 'room':
+            await self.push({'action': f'{action}_result', 'topic': topic, 'success': False, 'error': 'Ожидалась тема room:<id>.', 'status': 400})
+            return
+        payload, status = await sharding.dispatch(action, parsed[1], self.scope['user'], data)
+        await self.push({'action': f'{action}_result', 'topic': topic, 'status': status, **payload})
 
     async def game_message(self, event):
-        await self.send(text_data=json.dumps(event['message']))
\ No newline at end of file
+        room_id = event.get('room_id')
+        topic = f'room:{room_id}'
+        if topic not in self.topics:
+            return
+        message = event['message']
+        seq = message.get('seq')
+        if seq is not None:
+            replay.buffer.record(room_id, seq, message)
+            gate = self.seq_gates.get(room_id)
+            if gate is not None:
+                await gate.offer(seq, message)
+                return
+        await self._push_topic(topic, message)
+
+    async def _push_topic(self, topic, message):
+        await self.push({'topic': topic, **message})
+
+    async def spectator_frame(self, event):
+        sender = self.spectator_senders.get(event.get('room_id'))
+        if sender is not None:
+            sender.push(event)
+
+    async def lobby_message(self, event):
+        if 'lobby' not in self.topics:
+            return
+        message = event['message']
+        # Пока есть отложенные изменения, новые встают за ними, а не обгоняют
+        if self.lobby_pending or loop_lag.shed('lobby_event', loop_lag.TIER_THROTTLE):
+            self.lobby_pending.pop(message['room_id'], None)
+            self.lobby_pending[message['room_id']] = message
+            if self.lobby_flush is None:
+                self.lobby_flush = asyncio.get_running_loop().create_task(self.flush_lobby())
+            return
+        await self.push({'topic': 'lobby', **message})
+
+    async def flush_lobby(self):
+        """Отправляет отложенные изменения лобби: по одному последнему на комнату."""
+        try:
+            await asyncio.sleep(getattr(settings, 'LOAD_SHED_COALESCE_SECONDS', 1.0))
+            pending, self.lobby_pending = self.lobby_pending, {}
+            for message in pending.values():
+                await self.push({'topic': 'lobby', **message})
+        finally:
+            self.lobby_flush = None
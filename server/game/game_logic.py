@@ -1,8 +1,11 @@
 from __future__ import annotations
 import random
 import os
+import time
 from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
+from . import metrics, snapshots, timers
 from .models import Game, GameRoom
 from players.models import Player
 import typing
@@ -10,11 +13,21 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+
+class StaleGameStateError(Exception):
+    """Состояние партии в БД изменилось после загрузки (конкурентный ход)."""
+
+
 class DurakGame:
-    def __init__(self, room: GameRoom):
+    def __init__(self, room: GameRoom, players: typing.Optional[list[Player]] = None,
+                 game_model: typing.Optional[Game] = None):
+        """
+        players и game_model позволяют собрать партию из заранее загруженных
+        данных (массовое восстановление, см. game.snapshots) без запросов к БД.
+        """
         self.room = room
         self.game_model_instance: typing.Optional[Game] = None
-        self.players: list[Player] = list(room.players.all().order_by('id'))
+        self.players: list[Player] = players if players is not None else list(room.players.all().order_by('id'))
         
         self.player_hands_data: dict[str, list[dict]] = {str(p.id): [] for p in self.players}
         self.deck: list[dict] = []
@@ -24,7 +37,10 @@ class DurakGame:
         self.attacker_index: int = 0
         self.defender_index: int = (self.attacker_index + 1) % len(self.players) if self.players else 0
         
-        self._load_game_state_if_exists()
+        if game_model is not None:
+            self._apply_game_model(game_model)
+        else:
+            self._load_game_state_if_exists()
 
     def _generate_deck(self) -> list[dict]:
         suits = ['hearts', 'diamonds', 'clubs', 'spades']
@@ -36,45 +52,49 @@ class DurakGame:
     def _load_game_state_if_exists(self):
         """Loads game state from the database if a Game record exists for this room."""
         try:
-            self.game_model_instance = Game.objects.get(room=self.room)
-            self.deck = list(self.game_model_instance.deck)
-            self.trump_suit = self.game_model_instance.trump_suit
-            self.table = list(self.game_model_instance.table)
-            self.player_hands_data = dict(self.game_model_instance.player_hands)
-            self.trump_card_revealed = self.game_model_instance.trump_card_revealed
-
-            if self.game_model_instance.current_turn:
-                try:
-                    current_turn_user_id = self.game_model_instance.current_turn.id
-                    self.attacker_index = next(i for i, p in enumerate(self.players) if p.id == current_turn_user_id)
-                except (StopIteration, AttributeError):
-                    logger.warning(f"Current turn player {self.game_model_instance.current_turn_id} not found in room {self.room.id} players. Re-determining attacker.")
-                    self._set_initial_attacker_defender()
-            else:
-                self._set_initial_attacker_defender() 
-            
-            self.defender_index = (self.attacker_index + 1) % len(self.players) if self.players else 0
-
-            for player_user in self.players:
-                if str(player_user.id) not in self.player_hands_data:
-                    self.player_hands_data[str(player_user.id)] = []
-            logger.info(f"DurakGame state loaded from DB for room {self.room.id}")
-
+            game_model = Game.objects.get(room=self.room)
         except Game.DoesNotExist:
-            logger.info(f"No existing Game model for room {self.room.id}. DurakGame in pre-init state.")
-            pass
+            logger.debug("No existing Game model for room %s. DurakGame in pre-init state.", self.room.id)
+            return
+        self._apply_game_model(game_model)
+
+    def _apply_game_model(self, game_model: Game):
+        """Переносит состояние из строки Game в поля движка."""
+        self.game_model_instance = game_model
+        self.deck = list(self.game_model_instance.deck)
+        self.trump_suit = self.game_model_instance.trump_suit
+        self.table = list(self.game_model_instance.table)
+        self.player_hands_data = dict(self.game_model_instance.player_hands)
+        self.trump_card_revealed = self.game_model_instance.trump_card_revealed
+
+        if self.game_model_instance.current_turn_id:
+            try:
+                current_turn_user_id = self.game_model_instance.current_turn_id
+                self.attacker_index = next(i for i, p in enumerate(self.players) if p.id == current_turn_user_id)
+            except (StopIteration, AttributeError):
+                logger.warning("Current turn player %s not found in room %s players. Re-determining attacker.", self.game_model_instance.current_turn_id, self.room.id)
+                self._set_initial_attacker_defender()
+        else:
+            self._set_initial_attacker_defender() 
+        
+        self.defender_index = (self.attacker_index + 1) % len(self.players) if self.players else 0
+
+        for player_user in self.players:
+            if str(player_user.id) not in self.player_hands_data:
+                self.player_hands_data[str(player_user.id)] = []
+        logger.debug("DurakGame state loaded from DB for room %s", self.room.id)
 
     def initialize_new_game_setup(self):
         if self.game_model_instance:
-            logger.warning(f"initialize_new_game_setup called for room {self.room.id}, but Game model already exists. Skipping.")
+            logger.warning("initialize_new_game_setup called for room %s, but Game model already exists. Skipping.", self.room.id)
             return
 
         min_players = getattr(self.room, 'min_players_for_start', 2) 
         if not self.players or len(self.players) < min_players:
-             logger.error(f"Not enough players ({len(self.players)}) to initialize game for room {self.room.id}. Needs {min_players}.")
+             logger.error("Not enough players (%d) to initialize game for room %s. Needs %s.", len(self.players), self.room.id, min_players)
              return
 
-        logger.info(f"Initializing new game setup for room {self.room.id} with {len(self.players)} players.")
+        logger.info("Initializing new game setup for room %s with %d players.", self.room.id, len(self.players))
         self.deck = self._generate_deck()
         self.player_hands_data = {str(p.id): [] for p in self.players}
         
@@ -86,7 +106,8 @@ class DurakGame:
             status=GameRoom.STATUS_PLAYING,
         )
         self.save_game_state()
-        logger.info(f"New game setup complete and saved for room {self.room.id}. Trump: {self.trump_suit}. Attacker: {self.players[self.attacker_index].username if self.players else 'N/A'}")
+        logger.info("New game setup complete and saved for room %s. Trump: %s. Attacker: %s",
+                    self.room.id, self.trump_suit, self.players[self.attacker_index].username if self.players else 'N/A')
 
 
     def _set_initial_attacker_defender(self):
@@ -139,24 +160,41 @@ class DurakGame:
             self.trump_card_revealed = self.deck[0] 
             self.trump_suit = self.trump_card_revealed['suit']
         elif self.player_hands_data and any(self.player_hands_data.values()):
-            logger.warning(f"Deck empty after initial deal for room {self.room.id}. Trump may not be set from deck.")
+            logger.warning("Deck empty after initial deal for room %s. Trump may not be set from deck.", self.room.id)
             if not self.trump_suit: 
-                 logger.error(f"CRITICAL: No trump suit could be determined for room {self.room.id}")
+                 logger.error("CRITICAL: No trump suit could be determined for room %s", self.room.id)
         else: 
             self.trump_suit = None
             self.trump_card_revealed = None
-            logger.error(f"Cannot determine trump: deck empty and no cards dealt for room {self.room.id}.")
+            logger.error("Cannot determine trump: deck empty and no cards dealt for room %s.", self.room.id)
 
 
     def _get_player_hand(self, player_user_obj: Player) -> list[dict]:
         return self.player_hands_data.get(str(player_user_obj.id), [])
 
+    @staticmethod
+    def card_id_of(card: dict) -> str:
+        """Устойчивый id карты ('rank-suit'); в отличие от индекса в руке не меняется между ходами."""
+        return card.get('id', f"{card['rank']}-{card['suit']}")
+
+    def hand_index_of(self, player_user_obj: Player, card_id: str) -> typing.Optional[int]:
+        for i, card in enumerate(self._get_player_hand(player_user_obj)):
+            if self.card_id_of(card) == card_id:
+                return i
+        return None
+
+    def table_index_of(self, attack_card_id: str) -> typing.Optional[int]:
+        for i, pair in enumerate(self.table):
+            if pair.get('attack_card') and self.card_id_of(pair['attack_card']) == attack_card_id:
+                return i
+        return None
+
     def _remove_card_from_hand(self, player_user_obj: Player, card_index_in_hand: int) -> typing.Optional[dict]:
         hand = self._get_player_hand(player_user_obj)
         if 0 <= card_index_in_hand < len(hand):
             removed_card = hand.pop(card_index_in_hand)
             return removed_card
-        logger.warning(f"Invalid card index {card_index_in_hand} for hand of player {player_user_obj.id}")
+        logger.warning("Invalid card index %s for hand of player %s", card_index_in_hand, player_user_obj.id)
         return None
     
     def _add_cards_to_hand(self, player_user_obj: Player, cards_to_add: list[dict]):
@@ -264,7 +302,7 @@ class DurakGame:
         if removed_card:
             self.table.append({'attack_card': removed_card, 'defense_card': None, 'attacker_id': attacking_player_user.id})
         else:
-            logger.error(f"Failed to remove card at index {card_hand_index} for attack by {attacking_player_user.id}")
+            logger.error("Failed to remove card at index %s for attack by %s", card_hand_index, attacking_player_user.id)
             return {'success': False, 'message': "Внутренняя ошибка: не удалось корректно снять карту с руки."}
         
         self.save_game_state()
@@ -326,7 +364,7 @@ class DurakGame:
                 else:
                     return {'success': True, 'message': "Карта отбита.", 'all_defended': False}
             else:
-                 logger.error(f"Internal error removing defense card for player {defending_player_user.id}")
+                 logger.error("Internal error removing defense card for player %s", defending_player_user.id)
                  return {'success': False, 'message': "Внутренняя ошибка при удалении карты защиты."}
         else:
             return {'success': False, 'message': "Этой картой нельзя отбиться."}
@@ -352,7 +390,7 @@ class DurakGame:
                         player_instance = p_user 
                         players_involved_in_round_needing_cards.append(player_instance)
                     except Player.DoesNotExist:
-                        logger.error(f"Player with ID {p_user.id} not found for dealing cards.")
+                        logger.error("Player with ID %s not found for dealing cards.", p_user.id)
 
 
         defender_user = self.players[self.defender_index]
@@ -523,7 +561,7 @@ class DurakGame:
                      card_data_to_append = {
                         'rank': card_in_hand['rank'],
                         'suit': card_in_hand['suit'],
-                        'id': card_in_hand.get('id', f"{card_in_hand['rank']}-{card_in_hand['suit']}"), 
+                        'id': self.card_id_of(card_in_hand),
                         'image_url': self._get_card_image_url(card_in_hand),
                         'hand_index': card_idx_in_hand
                     }
@@ -555,9 +593,10 @@ class DurakGame:
 
     def save_game_state(self, game_over_result: typing.Optional[dict] = None):
         if not self.game_model_instance:
-            logger.warning(f"Attempted to save game state for room {self.room.id}, but no Game model instance exists.")
+            logger.warning("Attempted to save game state for room %s, but no Game model instance exists.", self.room.id)
             return 
 
+        started = time.perf_counter()
         with transaction.atomic():
             game = self.game_model_instance 
 
@@ -573,19 +612,22 @@ class DurakGame:
 
             if is_game_truly_over:
                 game.status = GameRoom.STATUS_FINISHED
-                self.room.status = GameRoom.STATUS_FINISHED 
                 
                 winner_obj: typing.Optional[Player] = game_over_result.get('winner')
                 loser_obj: typing.Optional[Player] = game_over_result.get('loser')  
                 is_draw = game_over_result.get('is_draw', False)
 
+                # Расчет партии (балансы, статистика, таблица лидеров) выполняет end_game.
+                # Статус комнаты меняется внутри него: если выставить FINISHED заранее,
+                # end_game посчитает партию уже завершенной и пропустит расчет.
                 if hasattr(self.room, 'end_game_from_logic'): 
                     self.room.end_game_from_logic(winner=winner_obj, loser=loser_obj, is_draw=is_draw, final_pot_value=None) 
                 elif hasattr(self.room, 'end_game'): 
-                     self.room.end_game(winner=winner_obj) 
+                     self.room.end_game(winner=winner_obj, loser=loser_obj, is_draw=is_draw) 
                 else: 
                     if winner_obj and not self.room.winner: 
                         self.room.winner = winner_obj
+                self.room.status = GameRoom.STATUS_FINISHED 
                 
                 self.room.save(update_fields=['status', 'winner'] if winner_obj and not is_draw else ['status'])
 
@@ -596,8 +638,33 @@ class DurakGame:
                     for p_user in self.players: # p_user is Player
                         if not self._get_player_hand(p_user) and not self.room.winner:
                             self.room.winner = p_user 
-                            logger.info(f"Player {p_user.username} is out of cards (deck not empty), marked as potential winner for room {self.room.id}.")
+                            logger.info("Player %s is out of cards (deck not empty), marked as potential winner for room %s.", p_user.username, self.room.id)
                             break 
                 self.room.save(update_fields=['status', 'winner'] if self.room.winner else ['status'])
             
-            game.save()
\ No newline at end of file
+            # Оптимистичная блокировка: запись проходит, только если версия в БД
+            # та же, что была при загрузке. Иначе кто-то сохранил ход раньше,
+            # и вся транзакция (включая расчет партии) откатывается.
+            loaded_version = game.version
+            updated = Game.objects.filter(pk=game.pk, version=loaded_version).update(
+                current_turn=game.current_turn,
+                status=game.status,
+                trump_suit=game.trump_suit,
+                trump_card_revealed=game.trump_card_revealed,
+                deck=game.deck,
+                table=game.table,
+                player_hands=game.player_hands,
+                version=loaded_version + 1,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                raise StaleGameStateError(f"Game state for room {self.room.id} changed since version {loaded_version}")
+            game.version = loaded_version + 1
+
+            metrics.GAME_SAVE_SECONDS.observe(time.perf_counter() - started)
+
+            if snapshots.is_enabled():
+                transaction.on_commit(lambda: snapshots.record_game(self))
+            if timers.is_enabled():
+                room_id, version, playing = self.room.id, game.version, game.status == GameRoom.STATUS_PLAYING
+                transaction.on_commit(lambda: timers.turn_timers.game_saved(room_id, version, playing))
@@ -0,0 +1,70 @@
+"""
+Идемпотентные ходы: повтор запроса с тем же action_id не применяется второй раз.
+
+Клиент присылает с ходом собственный action_id (строка до ACTION_ID_MAX_LENGTH
+символов, например UUID) и при таймауте или обрыве повторяет запрос с тем же
+id, не перечитывая состояние. Результат успешного хода сохраняется после
+коммита в кэше Django (CACHES['default']) на MOVE_DEDUP_TTL секунд; повтор
+получает исходный ответ с duplicate=True.
+
+С CACHE_BACKEND=redis кэш общий для всех процессов, поэтому повтор находит
+результат, на какой бы воркер он ни попал, и переживает смену владельца
+комнаты и перезапуск. С locmem (один процесс, разработка) результат живет в
+памяти процесса. Все ходы — и повторы — проходят через sharding.dispatch: с
+шардированием (ROOM_SHARDING=1) они выполняются на воркере-владельце по
+очереди, и проверка с записью не гоняются друг с другом. Без шардирования
+два одновременных повтора на разных воркерах могут оба не найти записи —
+тогда ход проверяется заново, а карты указываются по id, и уже сыгранной
+карты в руке просто не окажется.
+"""
+import hashlib
+import typing
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+ACTION_ID_MAX_LENGTH = 64
+
+MOVE_DUPLICATES = metrics.counter(
+    'durak_move_duplicates',
+    'Moves answered from the action id cache instead of being applied again.',
+)
+
+
+def action_id(data: dict) -> typing.Optional[str]:
+    """action_id из параметров хода; ValueError, если он неправильный."""
+    value = data.get('action_id')
+    if value is None:
+        return None
+    if not isinstance(value, (str, int)) or isinstance(value, bool):
+        raise ValueError('action_id должен быть строкой.')
+    value = str(value)
+    if not value or len(value) > ACTION_ID_MAX_LENGTH:
+        raise ValueError(f'action_id должен содержать от 1 до {ACTION_ID_MAX_LENGTH} символов.')
+    return value
+
+
+class MoveResultCache:
+    """Результаты ходов в кэше Django: (комната, пользователь, action_id) -> payload на ttl секунд."""
+
+    key_prefix = 'move_result'
+
+    def __init__(self, ttl: int = 600):
+        self.ttl = ttl
+
+    def _key(self, room_id: int, user_id: int, action_id: str) -> str:
+        # action_id приходит от клиента: в ключ идет хеш, а не сама строка
+        digest = hashlib.blake2b(action_id.encode(), digest_size=16).hexdigest()
+        return f'{self.key_prefix}:{room_id}:{user_id}:{digest}'
+
+    def get(self, room_id: int, user_id: int, action_id: str) -> typing.Optional[dict]:
+        payload = cache.get(self._key(room_id, user_id, action_id))
+        return dict(payload) if payload is not None else None
+
+    def put(self, room_id: int, user_id: int, action_id: str, payload: dict):
+        cache.set(self._key(room_id, user_id, action_id), dict(payload), self.ttl)
+
+
+results = MoveResultCache(ttl=getattr(settings, 'MOVE_DEDUP_TTL', 600))
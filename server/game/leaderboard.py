@@ -0,0 +1,82 @@
+"""
+Таблица лидеров.
+
+Записи LeaderboardEntry обновляются инкрементально при расчете партии
+(GameRoom.end_game), поэтому чтение рейтинга — это проход по индексу
+(score, games_played, player), а не пересчет по всей таблице игроков.
+"""
+from django.db.models import Q
+
+from .models import LeaderboardEntry
+from .pagination import keyset_q
+
+# Порядок мест в таблице. Должен совпадать с индексом leaderboard_rank_idx.
+LEADERBOARD_ORDERING = ['-score', '-games_played', 'player_id']
+
+
+def compute_score(player) -> float:
+    """Показатель, по которому упорядочена таблица лидеров: рейтинг Elo (game.rating)."""
+    return round(player.rating, 4)
+
+
+def entry_key(entry) -> list:
+    """Значения полей LEADERBOARD_ORDERING для записи (для курсора и ранга)."""
+    return [entry.score, entry.games_played, entry.player_id]
+
+
+def record_game_results(players) -> None:
+    """
+    Синхронизирует записи таблицы лидеров с уже обновленной статистикой игроков.
+
+    Вызывается внутри транзакции расчета партии: один SELECT по игрокам
+    комнаты, затем bulk_update/bulk_create.
+    """
+    players = list(players)
+    if not players:
+        return
+
+    entries = {
+        e.player_id: e
+        for e in LeaderboardEntry.objects.filter(player_id__in=[p.id for p in players])
+    }
+    to_create, to_update = [], []
+    for player in players:
+        entry = entries.get(player.id)
+        if entry is None:
+            entry = LeaderboardEntry(player=player)
+            to_create.append(entry)
+        else:
+            to_update.append(entry)
+        entry.games_played = player.games_played
+        entry.games_won = player.games_won
+        entry.win_rate = player.win_rate
+        entry.score = compute_score(player)
+
+    if to_update:
+        LeaderboardEntry.objects.bulk_update(to_update, ['games_played', 'games_won', 'win_rate', 'score'])
+    if to_create:
+        LeaderboardEntry.objects.bulk_create(to_create)
+
+
+def _ahead_of_q(key) -> Q:
+    """Условие "запись стоит в таблице выше, чем запись с ключом key"."""
+    flipped = [f[1:] if f.startswith('-') else f'-{f}' for f in LEADERBOARD_ORDERING]
+    return keyset_q(flipped, key)
+
+
+def rank_queryset(entry):
+    """Записи, стоящие выше entry: три диапазона по индексу leaderboard_rank_idx."""
+    return LeaderboardEntry.objects.filter(_ahead_of_q(entry_key(entry)))
+
+
+def rank_of(entry) -> int:
+    """
+    Место записи в таблице (с 1): COUNT записей, стоящих выше.
+
+    Счет идет только по индексу leaderboard_rank_idx без чтения таблицы, но
+    проходит все записи выше — O(место), а не O(log n): игроку в конце
+    таблицы это дороже, чем лидеру. Для текущих размеров таблицы этого
+    хватает; отдельные счетчики по диапазонам рейтинга пришлось бы обновлять
+    при каждом расчете партии.
+    """
+    return rank_queryset(entry).count() + 1
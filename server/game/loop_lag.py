@@ -0,0 +1,140 @@
+"""
+Задержка event loop и ступенчатый сброс необязательной работы.
+
+Все WebSocket-соединения воркера daphne обслуживает один asyncio-цикл. Если
+его блокирует очередь database_sync_to_async или тяжелое кодирование JSON,
+тормозят все комнаты воркера. LoopLagMonitor раз в LOOP_LAG_INTERVAL секунд
+засыпает и измеряет, насколько позже запланированного он проснулся.
+
+Сглаженная задержка (пик с затуханием) сравнивается с порогами LOOP_LAG_TIERS:
+  1 throttle — лобби опрашивается реже (poll_after в room_search);
+  2 coalesce — обновления зрителей склеиваются в окно coalesce_window();
+               истекшие таймеры ходов откладываются, а не срабатывают разом;
+  3 reject   — новые входы в комнаты на этом воркере отклоняются с
+               retry_after (join_game, create_room, действие join).
+Ступень снижается, только когда задержка упала ниже порога, умноженного на
+LOOP_LAG_RECOVERY_RATIO, — чтобы не переключаться туда-обратно.
+"""
+import asyncio
+import logging
+import random
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+TIER_NORMAL = 0
+TIER_THROTTLE = 1
+TIER_COALESCE = 2
+TIER_REJECT = 3
+TIER_NAMES = {TIER_NORMAL: 'normal', TIER_THROTTLE: 'throttle', TIER_COALESCE: 'coalesce', TIER_REJECT: 'reject'}
+
+# Затухание сглаженной задержки за одно измерение
+LAG_DECAY = 0.9
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    'durak_event_loop_lag_seconds',
+    'Event loop scheduling delay per measurement.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOAD_SHED_EVENTS = metrics.counter(
+    'durak_load_shed',
+    'Optional work shed because of event loop lag.',
+    ('action',),
+)
+
+
+class LoopLagMonitor:
+    def __init__(self):
+        self.lag = 0.0
+        self.tier = TIER_NORMAL
+        self._task = None
+
+    @property
+    def thresholds(self) -> dict:
+        return getattr(settings, 'LOOP_LAG_TIERS', {TIER_THROTTLE: 0.05, TIER_COALESCE: 0.2, TIER_REJECT: 0.5})
+
+    def start(self):
+        interval = getattr(settings, 'LOOP_LAG_INTERVAL', 0.05)
+        if interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(interval))
+        logger.info(f"Loop lag monitor started: interval {interval}s, tiers {self.thresholds}")
+
+    async def _run(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.observe(max(0.0, loop.time() - expected))
+
+    def observe(self, lag: float):
+        LOOP_LAG_SECONDS.observe(lag)
+        self.lag = max(lag, self.lag * LAG_DECAY)
+        self._update_tier()
+
+    def _update_tier(self):
+        recovery = getattr(settings, 'LOOP_LAG_RECOVERY_RATIO', 0.5)
+        tier = TIER_NORMAL
+        for level, threshold in sorted(self.thresholds.items()):
+            # Текущую и нижние ступени держим до снижения ниже порога * recovery
+            limit = threshold * recovery if level <= self.tier else threshold
+            if self.lag >= limit:
+                tier = level
+        if tier != self.tier:
+            log = logger.warning if tier > self.tier else logger.info
+            log(f"Event loop lag {self.lag * 1000:.0f} ms: load shedding {TIER_NAMES[self.tier]} -> {TIER_NAMES[tier]}")
+            self.tier = tier
+
+
+monitor = LoopLagMonitor()
+
+LOOP_LAG = metrics.gauge(
+    'durak_event_loop_lag_smoothed_seconds',
+    'Smoothed event loop lag used for load shedding.',
+    callback=lambda: monitor.lag,
+)
+LOAD_SHED_TIER = metrics.gauge(
+    'durak_load_shed_tier',
+    'Current load shedding tier: 0 normal, 1 throttle, 2 coalesce, 3 reject.',
+    callback=lambda: monitor.tier,
+)
+
+
+def tier() -> int:
+    return monitor.tier
+
+
+def shed(action: str, at_tier: int) -> bool:
+    """True, если необязательную работу action нужно сбросить на текущей ступени."""
+    if monitor.tier < at_tier:
+        return False
+    LOAD_SHED_EVENTS.labels(action).inc()
+    return True
+
+
+def lobby_poll_seconds() -> int:
+    if monitor.tier >= TIER_THROTTLE:
+        return getattr(settings, 'LOAD_SHED_LOBBY_POLL_SECONDS', 15)
+    return getattr(settings, 'LOBBY_POLL_SECONDS', 5)
+
+
+def coalesce_window() -> float:
+    """Окно склейки обновлений зрителей (0 — отправлять сразу)."""
+    return getattr(settings, 'LOAD_SHED_COALESCE_SECONDS', 1.0) if monitor.tier >= TIER_COALESCE else 0.0
+
+
+def retry_after() -> int:
+    return getattr(settings, 'LOAD_SHED_RETRY_AFTER', 10)
+
+
+def timer_grace() -> float:
+    """
+    Отсрочка истекшего таймера хода под нагрузкой: игроки не успевали ходить
+    из-за задержки воркера. Разброс не дает отложенным таймерам сработать в
+    один тик.
+    """
+    base = getattr(settings, 'LOAD_SHED_TIMER_GRACE', 5.0)
+    return random.uniform(base, 2 * base)
@@ -0,0 +1,311 @@
+import json
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from game.game_logic import DurakGame
+from game.leaderboard import compute_score
+from game.models import Game, GameRoom, LeaderboardEntry, PlayerActivity
+from players.models import Player
+
+DEFAULT_STATUS_MIX = 'finished=0.85,cancelled=0.05,playing=0.05,waiting=0.05'
+BET_AMOUNTS = [0, 0, 10, 50, 100, 500]
+
+
+def parse_status_mix(value):
+    mix = {}
+    for part in value.split(','):
+        status, _, weight = part.partition('=')
+        status = status.strip()
+        if status not in dict(GameRoom.STATUS_CHOICES):
+            raise CommandError(f'Unknown room status in --status-mix: {status!r}')
+        try:
+            mix[status] = float(weight)
+        except ValueError:
+            raise CommandError(f'Bad weight for {status!r} in --status-mix: {weight!r}')
+    if not mix or sum(mix.values()) <= 0:
+        raise CommandError('--status-mix must have a positive total weight')
+    return mix
+
+
+def deal(players):
+    """Настоящая раздача движком DurakGame без обращения к БД: колода, руки, козырь, атакующий."""
+    engine = DurakGame(GameRoom(id=0), players=players, game_model=Game())
+    engine.deck = engine._generate_deck()
+    engine.player_hands_data = {str(p.id): [] for p in players}
+    engine._initialize_hands_and_trump()
+    engine._set_initial_attacker_defender()
+    return engine
+
+
+class Command(BaseCommand):
+    help = ('Generates a large synthetic dataset (players, rooms in every status, Game states, '
+            'PlayerActivity history) for benchmarking at production scale')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=10000)
+        parser.add_argument('--rooms', type=int, default=100000)
+        parser.add_argument('--status-mix', default=DEFAULT_STATUS_MIX,
+                            help=f'Room status weights, default "{DEFAULT_STATUS_MIX}"')
+        parser.add_argument('--days', type=int, default=180, help='Spread room history over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rooms per insert batch')
+        parser.add_argument('--prefix', default='synth', help='Username prefix of generated players')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='On PostgreSQL use executemany instead of COPY')
+        parser.add_argument('--purge', action='store_true',
+                            help='Delete previously generated data with this prefix and exit')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['purge']:
+            self._purge(prefix)
+            return
+        if options['players'] < 4:
+            raise CommandError('--players must be at least 4')
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+
+        self.prefix = prefix
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.batch_size = options['batch_size']
+        self.counts: dict[str, int] = {}
+        started = time.monotonic()
+
+        mix = parse_status_mix(options['status_mix'])
+        player_ids, rooms = self._plan(options['players'], options['rooms'], mix, options['days'])
+        self.stdout.write(f"Planned {len(rooms)} rooms for {len(player_ids)} players in {time.monotonic() - started:.1f}s")
+
+        with transaction.atomic():
+            self._create_players(player_ids, rooms, prefix)
+            for i in range(0, len(rooms), self.batch_size):
+                self._write_rooms(rooms[i:i + self.batch_size])
+            self._create_leaderboard(player_ids)
+            if self.use_copy:
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(no_style(), [Player, GameRoom]):
+                        cursor.execute(sql)
+
+        elapsed = time.monotonic() - started
+        total = sum(self.counts.values())
+        for table, n in self.counts.items():
+            self.stdout.write(f"  {table:<28} {n:>10}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s, "
+            f"{'COPY' if self.use_copy else 'batched INSERT'}). "
+            f"Run `manage.py recompute_ratings` to derive ratings from the generated history."
+        ))
+
+    def _plan(self, n_players, n_rooms, mix, days):
+        """Статусы, места, победители и время комнат; id назначаются заранее для вставки без RETURNING."""
+        first_player = (Player.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        first_room = (GameRoom.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        player_ids = list(range(first_player, first_player + n_players))
+        # Игрок может сидеть только в одной незавершенной комнате (current_room)
+        free_for_active = player_ids[:]
+        random.shuffle(free_for_active)
+
+        now = timezone.now()
+        span = days * 86400
+        statuses = random.choices(list(mix), weights=list(mix.values()), k=n_rooms)
+        rooms = []
+        for offset, status in enumerate(statuses):
+            max_players = random.choice([2, 2, 2, 3, 4])
+            if status == GameRoom.STATUS_WAITING:
+                n_seats = random.randint(1, max_players - 1)
+            elif status == GameRoom.STATUS_CANCELLED:
+                n_seats = random.randint(0, 1)
+            else:
+                n_seats = max_players
+
+            active = status in (GameRoom.STATUS_WAITING, GameRoom.STATUS_PLAYING)
+            if active and len(free_for_active) >= n_seats:
+                seats = [free_for_active.pop() for _ in range(n_seats)]
+            else:
+                active = False
+                seats = random.sample(player_ids, n_seats)
+
+            if active:
+                created_at = now - timedelta(seconds=random.randint(5, 1800))
+            else:
+                created_at = now - timedelta(seconds=random.randint(1800, span))
+            room = {
+                'id': first_room + offset,
+                'status': status,
+                'seats': seats,
+                'creator': seats[0] if seats else random.choice(player_ids),
+                'max_players': max_players,
+                'bet': random.choice(BET_AMOUNTS),
+                'created_at': created_at,
+                'seated': active,
+                'winner': None,
+                'loser': None,
+                'finished_at': None,
+            }
+            if status == GameRoom.STATUS_FINISHED:
+                room['finished_at'] = created_at + timedelta(seconds=random.randint(120, 2400))
+                if random.random() >= 0.02:
+                    room['winner'], room['loser'] = random.sample(seats, 2)
+            rooms.append(room)
+        return player_ids, rooms
+
+    def _create_players(self, player_ids, rooms, prefix):
+        stats = {pid: [0, 0] for pid in player_ids}
+        current_room = {}
+        for room in rooms:
+            if room['status'] == GameRoom.STATUS_FINISHED:
+                for pid in room['seats']:
+                    stats[pid][0] += 1
+                if room['winner']:
+                    stats[room['winner']][1] += 1
+            elif room['seated']:
+                for pid in room['seats']:
+                    current_room[pid] = room['id']
+
+        password = make_password(None)
+        joined = timezone.now() - timedelta(days=365)
+        self.players = [
+            Player(
+                id=pid, username=f'{prefix}_{pid}', password=password, date_joined=joined,
+                cash=random.randint(0, 20000), games_played=stats[pid][0], games_won=stats[pid][1],
+                current_room_id=current_room.get(pid),
+            )
+            for pid in player_ids
+        ]
+        self.players_by_id = {p.id: p for p in self.players}
+        # current_room ссылается на комнаты, которые вставляются ниже: ограничения FK отложены до коммита
+        Player.objects.bulk_create(self.players, batch_size=self.batch_size)
+        self.counts[Player._meta.db_table] = len(self.players)
+
+    def _write_rooms(self, rooms):
+        room_rows, seat_rows, game_rows, activity_rows = [], [], [], []
+        for room in rooms:
+            status = room['status']
+            created_at = room['created_at']
+            last_activity = room['finished_at'] or created_at + timedelta(seconds=random.randint(1, 600))
+            room_rows.append((
+                room['id'], f"Игра {self.prefix}_{room['creator']}", room['creator'], room['max_players'], room['bet'],
+                status, room['winner'], room['loser'], created_at, last_activity, room['finished_at'],
+            ))
+            seat_rows.extend((room['id'], pid) for pid in room['seats'])
+
+            for pid in room['seats']:
+                is_active = room['seated'] and random.random() < 0.8
+                last_ping = last_activity - timedelta(seconds=random.randint(0, 300))
+                activity_rows.append((pid, room['id'], is_active, last_ping))
+
+            if status in (GameRoom.STATUS_PLAYING, GameRoom.STATUS_FINISHED):
+                game_rows.append(self._game_row(room, last_activity))
+
+        self._insert(GameRoom, ['id', 'name', 'creator', 'max_players', 'bet_amount', 'status',
+                                'winner', 'loser', 'created_at', 'last_activity', 'finished_at'], room_rows)
+        self._insert(GameRoom.players.through, ['gameroom', 'player'], seat_rows)
+        self._insert(Game, ['room', 'current_turn', 'status', 'trump_suit', 'trump_card_revealed', 'deck',
+                            'table', 'player_hands', 'version', 'created_at', 'updated_at'], game_rows)
+        self._insert(PlayerActivity, ['player', 'room', 'is_active', 'last_ping'], activity_rows)
+
+    def _game_row(self, room, updated_at):
+        engine = deal([self.players_by_id[pid] for pid in room['seats']])
+        attacker = engine.players[engine.attacker_index]
+        hands = engine.player_hands_data
+        table = []
+        if room['status'] == GameRoom.STATUS_PLAYING:
+            current_turn = attacker.id
+            version = random.randint(1, 60)
+            if random.random() < 0.5:
+                # Открытая атака: атакующий выложил младшую некозырную карту
+                hand = hands[str(attacker.id)]
+                card = min(hand, key=lambda c: (c['suit'] == engine.trump_suit, engine.card_value(c['rank'])))
+                hand.remove(card)
+                table = [{'attack_card': card, 'defense_card': None}]
+        else:
+            # Конец партии: колода разобрана, карты остались только у проигравшего
+            current_turn = None
+            version = random.randint(20, 120)
+            engine.deck = []
+            loser = room['loser']
+            hands = {
+                pid: (cards[:random.randint(1, len(cards))] if int(pid) == loser else [])
+                for pid, cards in hands.items()
+            }
+        return (
+            room['id'], current_turn, room['status'], engine.trump_suit, engine.trump_card_revealed,
+            engine.deck, table, hands, version, room['created_at'], updated_at,
+        )
+
+    def _create_leaderboard(self, player_ids):
+        entries = [
+            LeaderboardEntry(player_id=p.id, games_played=p.games_played, games_won=p.games_won,
+                             win_rate=p.win_rate, score=compute_score(p))
+            for p in self.players if p.games_played
+        ]
+        LeaderboardEntry.objects.bulk_create(entries, batch_size=self.batch_size)
+        self.counts[LeaderboardEntry._meta.db_table] = len(entries)
+
+    def _insert(self, model, field_names, rows):
+        """
+        Вставка строк в обход bulk_create: auto_now/auto_now_add не перезаписывают
+        сгенерированное время, а на PostgreSQL строки идут одним COPY.
+        """
+        if not rows:
+            return
+        fields = [model._meta.get_field(name) for name in field_names]
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+        json_columns = [i for i, f in enumerate(fields) if isinstance(f, models.JSONField)]
+
+        conn = connections[DEFAULT_DB_ALIAS]
+        with conn.cursor() as cursor:
+            if self.use_copy:
+                with cursor.cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+                    for row in rows:
+                        if json_columns:
+                            row = list(row)
+                            for i in json_columns:
+                                row[i] = json.dumps(row[i])
+                        copy.write_row(row)
+            else:
+                prepare = [(i, (lambda v, f=fields[i]: f.get_db_prep_save(v, conn))) for i in json_columns]
+                prepare += [
+                    (i, conn.ops.adapt_datetimefield_value)
+                    for i, f in enumerate(fields) if isinstance(f, models.DateTimeField)
+                ]
+                if prepare:
+                    prepared = []
+                    for row in rows:
+                        row = list(row)
+                        for i, convert in prepare:
+                            row[i] = convert(row[i])
+                        prepared.append(row)
+                    rows = prepared
+                placeholders = ', '.join(['%s'] * len(fields))
+                cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+        self.counts[model._meta.db_table] = self.counts.get(model._meta.db_table, 0) + len(rows)
+
+    def _purge(self, prefix):
+        started = time.monotonic()
+        players = Player.objects.filter(username__startswith=f'{prefix}_')
+        rooms = GameRoom.objects.filter(creator__in=players)
+        with transaction.atomic():
+            # Зависимые таблицы удаляются одним DELETE каждая, чтобы каскад не загружал строки в память
+            deleted = {
+                'activity': PlayerActivity.objects.filter(room__in=rooms).delete()[0],
+                'games': Game.objects.filter(room__in=rooms).delete()[0],
+                'seats': GameRoom.players.through.objects.filter(gameroom__in=rooms).delete()[0],
+                'leaderboard': LeaderboardEntry.objects.filter(player__in=players).delete()[0],
+            }
+            players.update(current_room=None)
+            GameRoom.objects.filter(winner__in=players).update(winner=None)
+            GameRoom.objects.filter(loser__in=players).update(loser=None)
+            deleted['rooms'] = rooms.delete()[0]
+            deleted['players'] = players.delete()[0]
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {deleted} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,313 @@
+import asyncio
+import contextlib
+import json
+import random
+import re
+import time
+import uuid
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+
+from players.models import Player
+
+RANK_VALUES = {'6': 6, '7': 7, '8': 8, '9': 9, '10': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14}
+ROOM_URL = re.compile(r'/game/(\d+)/')
+
+
+class Stats:
+    """Задержки и ошибки по эндпоинтам."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    @staticmethod
+    def _percentile(sorted_values, q):
+        if not sorted_values:
+            return 0.0
+        idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+        return sorted_values[idx]
+
+    def report(self, elapsed):
+        rows = []
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            errors = self.errors.get(endpoint, 0)
+            rows.append(
+                f"{endpoint:<14} {len(values):>7} {len(values) / elapsed:>8.1f} "
+                f"{self._percentile(values, 0.5) * 1000:>8.1f} {self._percentile(values, 0.9) * 1000:>8.1f} "
+                f"{self._percentile(values, 0.99) * 1000:>8.1f} {values[-1] * 1000:>8.1f} "
+                f"{errors:>6} {errors / len(values) * 100:>6.2f}%"
+            )
+        header = f"{'endpoint':<14} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>6} {'err %':>7}"
+        return '\n'.join([header] + rows)
+
+
+class LoadClient:
+    """Игрок-бот: сессия, CSRF и запросы к ASGI-приложению в этом процессе."""
+
+    def __init__(self, app, player, session_key, stats, timeout):
+        self.app = app
+        self.player = player
+        self.stats = stats
+        self.timeout = timeout
+        self.csrf = get_random_string(32)
+        self.cookie = f'sessionid={session_key}; csrftoken={self.csrf}'.encode()
+        self.ws = None
+
+    async def http(self, endpoint, method, path, body=b'', content_type=None, extra_headers=()):
+        headers = [(b'cookie', self.cookie), (b'x-csrftoken', self.csrf.encode()), (b'host', b'localhost')]
+        if content_type:
+            headers.append((b'content-type', content_type.encode()))
+        headers.extend(extra_headers)
+        communicator = HttpCommunicator(self.app, method, path, body=body, headers=headers)
+        started = time.perf_counter()
+        try:
+            response = await communicator.get_response(timeout=self.timeout)
+        except Exception:
+            self.stats.record(endpoint, time.perf_counter() - started, False)
+            raise
+        finally:
+            # Django закрывает ответ уже после отправки тела: дожидаемся приложения
+            # (wait отменяет его по таймауту), иначе его задачи остаются висеть
+            # до закрытия цикла — "Task was destroyed but it is pending!"
+            with contextlib.suppress(Exception):
+                await communicator.wait(self.timeout)
+        self.stats.record(endpoint, time.perf_counter() - started, response['status'] < 400)
+        return response
+
+    async def post_json(self, endpoint, path, data):
+        response = await self.http(endpoint, 'POST', path, json.dumps(data).encode(), 'application/json')
+        return response['status'], json.loads(response['body'] or b'{}')
+
+    async def connect_ws(self, room_id):
+        self.ws = WebsocketCommunicator(self.app, f'/ws/game/{room_id}/', headers=[(b'cookie', self.cookie), (b'host', b'localhost')])
+        connected, _ = await self.ws.connect(timeout=self.timeout)
+        if not connected:
+            raise RuntimeError(f'WebSocket connect refused for room {room_id}')
+
+    async def ws_request(self, endpoint, action, data):
+        """Запрос через GameConsumer; широковещательные события по пути пропускаются."""
+        started = time.perf_counter()
+        await self.ws.send_to(text_data=json.dumps({'action': action, **data}))
+        try:
+            while True:
+                message = json.loads(await self.ws.receive_from(timeout=self.timeout))
+                if message.get('action') == f'{action}_result':
+                    break
+        except Exception:
+            self.stats.record(endpoint, time.perf_counter() - started, False)
+            raise
+        status = message.pop('status', 200)
+        self.stats.record(endpoint, time.perf_counter() - started, status < 400)
+        return status, message
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.disconnect()
+            self.ws = None
+
+
+def _beats(attack, defense, trump):
+    if defense['suit'] == attack['suit']:
+        return RANK_VALUES[defense['rank']] > RANK_VALUES[attack['rank']]
+    return defense['suit'] == trump and attack['suit'] != trump
+
+
+def choose_move(state, player_id):
+    """Допустимый ход бота по состоянию партии или None, если ход не его."""
+    me = next((p for p in state['players'] if p['id'] == player_id), None)
+    if me is None:
+        return None
+    hand = me['cards']
+    trump = state['trump_suit']
+    table = state['table']
+    low_first = sorted(hand, key=lambda c: (c['suit'] == trump, RANK_VALUES[c['rank']]))
+
+    if player_id == state['defender_id']:
+        unbeaten = next((i for i, pair in enumerate(table) if not pair.get('defense_card')), None)
+        if unbeaten is None:
+            return None
+        attack = table[unbeaten]['attack_card']
+        defense = next((c for c in low_first if _beats(attack, c, trump)), None)
+        if defense is None:
+            return {'action_type': 'take'}
+        return {'action_type': 'defend', 'attack_card_table_index': unbeaten, 'defense_card_hand_index': defense['hand_index']}
+
+    if player_id == state['attacker_id']:
+        if not table:
+            return {'action_type': 'attack', 'card_indices': [low_first[0]['hand_index']]} if low_first else None
+        if any(not pair.get('defense_card') for pair in table):
+            return None
+        ranks = {pair['attack_card']['rank'] for pair in table} | {pair['defense_card']['rank'] for pair in table}
+        defender = next(p for p in state['players'] if p['id'] == state['defender_id'])
+        throw_in = next((c for c in low_first if c['rank'] in ranks and c['suit'] != trump), None)
+        unbeaten_slots = defender['card_count'] - sum(1 for pair in table if not pair.get('defense_card'))
+        if throw_in and len(table) < 6 and unbeaten_slots > 0 and random.random() < 0.5:
+            return {'action_type': 'attack', 'card_indices': [throw_in['hand_index']]}
+        return {'action_type': 'pass_bito'}
+    return None
+
+
+def is_stalled(state):
+    """Движок не пропускает вышедших игроков: атакующий без карт при пустом столе ходить не может."""
+    attacker = next((p for p in state['players'] if p['id'] == state['attacker_id']), None)
+    return not state['table'] and attacker is not None and attacker['card_count'] == 0
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест: боты создают комнаты и играют партии через ASGI-приложение в этом процессе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=40)
+        parser.add_argument('--table-size', type=int, default=2, choices=[2, 3, 4])
+        parser.add_argument('--transport', choices=['http', 'ws'], default='http',
+                            help='Ходы и статус через HTTP-представления или через GameConsumer')
+        parser.add_argument('--think-ms', type=int, default=20, help='Пауза бота между опросами состояния')
+        parser.add_argument('--duration', type=float, default=120, help='Ограничение времени теста, секунд')
+        parser.add_argument('--max-moves', type=int, default=400, help='Ходов на партию, после которых бот сдается')
+        parser.add_argument('--request-timeout', type=float, default=10)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep-data', action='store_true', help='Не удалять созданных игроков и комнаты')
+
+    def handle(self, *args, **options):
+        from server.asgi import application
+
+        if options['users'] < options['table_size']:
+            raise CommandError('--users must be at least --table-size')
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+
+        run_id = uuid.uuid4().hex[:6]
+        password = make_password(None)
+        Player.objects.bulk_create([
+            Player(username=f'loadtest_{run_id}_{i}', password=password, cash=10000)
+            for i in range(options['users'] - options['users'] % options['table_size'])
+        ])
+        players = list(Player.objects.filter(username__startswith=f'loadtest_{run_id}_').order_by('id'))
+        sessions = {}
+        for player in players:
+            session = SessionStore()
+            session['_auth_user_id'] = str(player.pk)
+            session['_auth_user_backend'] = 'django.contrib.auth.backends.ModelBackend'
+            session['_auth_user_hash'] = player.get_session_auth_hash()
+            session.create()
+            sessions[player.pk] = session.session_key
+        self.stdout.write(f"Created {len(players)} players (run {run_id}), transport={options['transport']}")
+
+        stats = Stats()
+        results = {'games': 0, 'finished': 0, 'stalled': 0, 'moves': 0, 'failed': 0}
+        started = time.perf_counter()
+        try:
+            async_to_sync(self._run)(application, players, sessions, stats, results, options)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(stats.report(elapsed))
+            self.stdout.write(
+                f"\n{results['finished']}/{results['games']} games finished, {results['stalled']} stalled, "
+                f"{results['failed']} tables failed, "
+                f"{results['moves']} moves in {elapsed:.1f}s ({results['moves'] / elapsed:.1f} moves/s)"
+            )
+            if not options['keep_data']:
+                from django.contrib.sessions.models import Session
+                Session.objects.filter(session_key__in=sessions.values()).delete()
+                Player.objects.filter(id__in=[p.id for p in players]).delete()
+
+    async def _run(self, app, players, sessions, stats, results, options):
+        size = options['table_size']
+        deadline = time.monotonic() + options['duration']
+        clients = [LoadClient(app, p, sessions[p.pk], stats, options['request_timeout']) for p in players]
+        tables = [clients[i:i + size] for i in range(0, len(clients), size)]
+        await asyncio.gather(*(self._table(table, results, options, deadline) for table in tables))
+
+    async def _table(self, table, results, options, deadline):
+        creator = table[0]
+        results['games'] += 1
+        try:
+            body = urlencode({'name': f'lt {creator.player.username}', 'max_players': len(table), 'bet_amount': 10}).encode()
+            response = await creator.http('create_room', 'POST', '/game/create/', body, 'application/x-www-form-urlencoded')
+            location = dict(response['headers']).get(b'Location', b'').decode()
+            match = ROOM_URL.search(location)
+            if response['status'] != 302 or not match:
+                raise RuntimeError(f'create_room failed: {response["status"]} {location}')
+            room_id = int(match.group(1))
+
+            for client in table[1:]:
+                await client.http('join_game', 'POST', f'/game/join/{room_id}/', extra_headers=[(b'x-requested-with', b'XMLHttpRequest')])
+            if options['transport'] == 'ws':
+                await asyncio.gather(*(client.connect_ws(room_id) for client in table))
+
+            plays = [asyncio.ensure_future(self._play(client, room_id, results, options, deadline)) for client in table]
+            try:
+                outcomes = set(await asyncio.gather(*plays))
+            finally:
+                # Если один бот упал, остальные не должны пережить стол
+                for play in plays:
+                    play.cancel()
+                await asyncio.gather(*plays, return_exceptions=True)
+            if 'finished' in outcomes:
+                results['finished'] += 1
+            elif 'stalled' in outcomes:
+                results['stalled'] += 1
+                self.stderr.write(f"Room {room_id} stalled: attacker has no cards and no legal move")
+        except Exception as e:
+            results['failed'] += 1
+            self.stderr.write(f"Table of {creator.player.username} failed: {e!r}")
+        finally:
+            for client in table:
+                await client.close()
+
+    async def _idle(self, client, think):
+        """Ждет своей очереди: по WebSocket — до следующего события комнаты, по HTTP — паузу."""
+        if client.ws is None:
+            await asyncio.sleep(think)
+            return
+        # receive_nothing не отменяет приложение по таймауту и не забирает событие из очереди
+        await client.ws.receive_nothing(timeout=max(think, 0.5), interval=0.005)
+
+    async def _play(self, client, room_id, results, options, deadline):
+        """Играет за одного бота: 'finished', 'stalled' или None (лимит времени или ходов)."""
+        think = options['think_ms'] / 1000
+        moves = 0
+        while time.monotonic() < deadline and moves < options['max_moves']:
+            if options['transport'] == 'ws':
+                status, payload = await client.ws_request('ws_status', 'status', {})
+            else:
+                response = await client.http('game_status', 'GET', f'/game/status/{room_id}/')
+                status, payload = response['status'], json.loads(response['body'] or b'{}')
+            if status != 200:
+                await self._idle(client, think)
+                continue
+
+            state = payload['game_state']
+            if state['is_game_over'] or state['status'] != 'playing':
+                return 'finished' if state['is_game_over'] or state['status'] == 'finished' else None
+            if is_stalled(state):
+                return 'stalled'
+
+            move = choose_move(state, client.player.id)
+            if move is None:
+                await self._idle(client, think)
+                continue
+
+            if options['transport'] == 'ws':
+                status, result = await client.ws_request('ws_move', 'move', move)
+            else:
+                status, result = await client.post_json('make_move', f'/game/room/{room_id}/make_move/', move)
+            if status == 200 and result.get('success'):
+                moves += 1
+                results['moves'] += 1
+            else:
+                await self._idle(client, think)
+        return None
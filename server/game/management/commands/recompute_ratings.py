@@ -0,0 +1,86 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from game.models import GameRoom, LeaderboardEntry
+from game import rating
+from players.models import Player
+
+
+class Command(BaseCommand):
+    help = 'Recomputes all player ratings from finished game history (NumPy-vectorized)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k-factor', type=float, default=rating.K_FACTOR)
+        parser.add_argument('--initial-rating', type=float, default=rating.INITIAL_RATING)
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk_update when writing ratings back')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Compute ratings and print a summary without saving')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+        except ImportError:
+            raise CommandError('recompute_ratings requires NumPy (pip install numpy).')
+
+        started = time.monotonic()
+        finished = GameRoom.objects.filter(status=GameRoom.STATUS_FINISHED)
+
+        seats_by_room: dict[int, list[int]] = {}
+        through = GameRoom.players.through.objects.filter(gameroom__status=GameRoom.STATUS_FINISHED)
+        for room_id, player_id in through.values_list('gameroom_id', 'player_id').order_by('gameroom_id', 'player_id').iterator(chunk_size=20000):
+            seats_by_room.setdefault(room_id, []).append(player_id)
+
+        player_ids = list(Player.objects.order_by('id').values_list('id', flat=True))
+        position = {pid: i for i, pid in enumerate(player_ids)}
+
+        rows_idx, rows_scores = [], []
+        history = finished.order_by(F('finished_at').asc(nulls_first=True), 'id')\
+                          .values_list('id', 'winner_id', 'loser_id')
+        for room_id, winner_id, loser_id in history.iterator(chunk_size=20000):
+            seats = seats_by_room.get(room_id, [])
+            if len(seats) < 2:
+                continue
+            scores = rating.game_scores(seats, winner_id=winner_id, loser_id=loser_id)
+            pad = 4 - len(seats)
+            rows_idx.append([position[p] for p in seats] + [-1] * pad)
+            rows_scores.append(scores + [0.0] * pad)
+
+        self.stdout.write(f"Loaded {len(rows_idx)} games for {len(player_ids)} players in {time.monotonic() - started:.1f}s")
+
+        replay_started = time.monotonic()
+        ratings = rating.replay_ratings(
+            np.array(rows_idx, dtype=np.int64).reshape(-1, 4),
+            np.array(rows_scores, dtype=np.float64).reshape(-1, 4),
+            len(player_ids),
+            initial=options['initial_rating'],
+            k_factor=options['k_factor'],
+        )
+        self.stdout.write(f"Replayed ratings in {time.monotonic() - replay_started:.1f}s")
+
+        if options['dry_run']:
+            top = np.argsort(-ratings)[:10]
+            for i in top:
+                self.stdout.write(f"  player {player_ids[i]}: {ratings[i]:.1f}")
+            self.stdout.write('Dry run, nothing saved.')
+            return
+
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            Player.objects.bulk_update(
+                [Player(id=pid, rating=float(ratings[i])) for i, pid in enumerate(player_ids)],
+                ['rating'],
+                batch_size=batch_size,
+            )
+            entries = [
+                LeaderboardEntry(id=entry_id, score=round(float(ratings[position[pid]]), 4))
+                for entry_id, pid in LeaderboardEntry.objects.values_list('id', 'player_id')
+            ]
+            LeaderboardEntry.objects.bulk_update(entries, ['score'], batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved ratings for {len(player_ids)} players in {time.monotonic() - started:.1f}s"
+        ))
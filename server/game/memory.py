@@ -0,0 +1,244 @@
+"""
+Учет памяти по комнатам и снимки tracemalloc.
+
+room_memory() приблизительно (рекурсивный sys.getsizeof) оценивает, сколько
+байт держит каждая живая комната в этом процессе:
+  shard_engine — горячая партия DurakGame в sharding.router.live_rooms.
+             Есть только при ROOM_SHARDING=1: без шардирования партия
+             читается из БД на каждый запрос и между запросами не живет,
+             а consumer-ы партий не держат — тогда поле всегда 0;
+  consumers — экземпляры consumer-ов, подключенных к комнате (ws_health);
+  queued   — сообщения в очередях их каналов (только InMemoryChannelLayer).
+Общие объекты (channel layer, классы, модули, функции) не считаются, объект,
+достижимый из нескольких частей одной комнаты, считается один раз.
+
+Tracemalloc: start() включает трассировку (MEMORY_TRACE_FRAMES кадров стека),
+snapshot() запоминает базовый снимок, diff() сравнивает текущее состояние с
+ним. Аллокации группируются по модулю: берется ближайший к месту аллокации
+кадр из модулей MEMORY_TRACE_MODULES (game.game_logic, game.consumers,
+channels.layers, ...), иначе модуль самого места аллокации.
+"""
+import gc
+import sys
+import threading
+import tracemalloc
+import types
+
+from django.conf import settings
+
+from . import sharding, ws_health
+
+# Не заходим внутрь: общие для процесса объекты и код
+_OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                 types.MethodType, types.CodeType, types.FrameType, threading.Thread)
+# Предел обхода одного корня, чтобы случайная ссылка на глобальный граф не повесила запрос
+MAX_OBJECTS_PER_ROOT = 200000
+
+
+def deep_sizeof(obj, seen: set, exclude_ids=frozenset()) -> int:
+    """Сумма sys.getsizeof по графу объектов; seen общий для связанных корней."""
+    total = 0
+    stack = [obj]
+    visited = 0
+    while stack and visited < MAX_OBJECTS_PER_ROOT:
+        current = stack.pop()
+        oid = id(current)
+        if oid in seen or oid in exclude_ids or isinstance(current, _OPAQUE_TYPES):
+            continue
+        seen.add(oid)
+        visited += 1
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif isinstance(current, (str, bytes, int, float, bool)) or current is None:
+            continue
+        else:
+            if hasattr(current, '__dict__'):
+                stack.append(current.__dict__)
+            for slot in getattr(type(current), '__slots__', ()):
+                value = getattr(current, slot, None)
+                if value is not None:
+                    stack.append(value)
+            # asyncio.Queue и deque хранят элементы не в __dict__
+            if hasattr(current, '__iter__') and type(current).__module__ == 'collections':
+                stack.extend(current)
+    return total
+
+
+def _channel_layer():
+    from channels.layers import get_channel_layer
+    return get_channel_layer()
+
+
+def room_memory(top: int = None) -> dict:
+    layer = _channel_layer()
+    channels = getattr(layer, 'channels', None)
+    exclude = frozenset({id(layer), id(settings._wrapped)})
+
+    engines = {str(room_id): game for room_id, game in sharding.router.live_rooms.items()}
+    consumers = ws_health.live_consumers()
+    room_ids = {str(r) for r in engines} | set(consumers)
+
+    rooms = []
+    for room in room_ids:
+        seen: set = set()
+        engine = engines.get(room)
+        shard_engine_bytes = deep_sizeof(engine, seen, exclude) if engine is not None else 0
+
+        room_consumers = consumers.get(room, [])
+        consumer_bytes = sum(deep_sizeof(c, seen, exclude) for c in room_consumers)
+
+        queued_messages, queued_bytes = 0, None
+        if channels is not None:
+            queued_bytes = 0
+            for consumer in room_consumers:
+                queue = channels.get(getattr(consumer, 'channel_name', None))
+                if queue is None:
+                    continue
+                items = list(queue._queue)
+                queued_messages += len(items)
+                queued_bytes += sum(deep_sizeof(item, seen, exclude) for item in items)
+
+        rooms.append({
+            'room_id': room,
+            'shard_engine_bytes': shard_engine_bytes,
+            'consumers': len(room_consumers),
+            'consumer_bytes': consumer_bytes,
+            'queued_messages': queued_messages,
+            'queued_bytes': queued_bytes,
+            'total_bytes': shard_engine_bytes + consumer_bytes + (queued_bytes or 0),
+        })
+
+    rooms.sort(key=lambda r: -r['total_bytes'])
+    totals = {
+        'rooms': len(rooms),
+        'total_bytes': sum(r['total_bytes'] for r in rooms),
+        'sharding': sharding.is_enabled(),
+        'shard_engines': len(engines),
+        'consumers': sum(r['consumers'] for r in rooms),
+        'queued_messages': sum(r['queued_messages'] for r in rooms),
+        'max_rss_bytes': _max_rss(),
+        'gc_objects': len(gc.get_objects()),
+    }
+    if rooms:
+        totals['avg_room_bytes'] = totals['total_bytes'] // len(rooms)
+    return {'totals': totals, 'rooms': rooms[:top] if top else rooms}
+
+
+def _max_rss():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss в килобайтах на Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# --- tracemalloc ---
+
+_baseline = None
+_lock = threading.Lock()
+
+
+def _module_for_file(filename: str, files: dict) -> str:
+    return files.get(filename, filename)
+
+
+def _module_files() -> dict:
+    files = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path:
+            files[path] = name
+    return files
+
+
+def _group_key(traceback, files, prefixes) -> str:
+    # Traceback упорядочен от внешнего вызова к месту аллокации — идем с конца
+    for frame in reversed(traceback):
+        module = _module_for_file(frame.filename, files)
+        if module in prefixes or module.startswith(tuple(p + '.' for p in prefixes)):
+            return module
+    return _module_for_file(traceback[-1].filename, files)
+
+
+def _grouped(stats, limit):
+    files = _module_files()
+    prefixes = tuple(getattr(settings, 'MEMORY_TRACE_MODULES', ('game', 'players', 'server', 'channels')))
+    groups: dict[str, list] = {}
+    for stat in stats:
+        key = _group_key(stat.traceback, files, prefixes)
+        size_diff = getattr(stat, 'size_diff', stat.size)
+        count_diff = getattr(stat, 'count_diff', stat.count)
+        group = groups.setdefault(key, [0, 0, 0, 0])
+        group[0] += stat.size
+        group[1] += stat.count
+        group[2] += size_diff
+        group[3] += count_diff
+    rows = [
+        {'module': module, 'size_bytes': size, 'count': count, 'size_diff_bytes': size_diff, 'count_diff': count_diff}
+        for module, (size, count, size_diff, count_diff) in groups.items()
+    ]
+    rows.sort(key=lambda r: (-abs(r['size_diff_bytes']), -r['size_bytes']))
+    return rows[:limit]
+
+
+def _take():
+    snapshot = tracemalloc.take_snapshot()
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        # Базовый снимок и статистика, которые держит сам этот модуль
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ))
+
+
+def tracing_status() -> dict:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'tracing': tracemalloc.is_tracing(),
+        'frames': tracemalloc.get_traceback_limit(),
+        'traced_bytes': current,
+        'traced_peak_bytes': peak,
+        'has_baseline': _baseline is not None,
+    }
+
+
+def start(frames: int = None):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames or getattr(settings, 'MEMORY_TRACE_FRAMES', 25))
+    return tracing_status()
+
+
+def stop():
+    global _baseline
+    with _lock:
+        _baseline = None
+        tracemalloc.stop()
+    return tracing_status()
+
+
+def snapshot(limit: int = 30) -> dict:
+    """Новый базовый снимок; возвращает текущее распределение памяти по модулям."""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('tracemalloc не запущен: сначала action=start.')
+    with _lock:
+        _baseline = _take()
+        stats = _baseline.statistics('traceback')
+    return {**tracing_status(), 'modules': _grouped(stats, limit)}
+
+
+def diff(limit: int = 30) -> dict:
+    """Рост памяти по модулям с момента базового снимка."""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('tracemalloc не запущен: сначала action=start.')
+    with _lock:
+        if _baseline is None:
+            raise RuntimeError('Нет базового снимка: сначала action=snapshot.')
+        stats = _take().compare_to(_baseline, 'traceback')
+    return {**tracing_status(), 'modules': _grouped(stats, limit)}
@@ -0,0 +1,283 @@
+"""
+Метрики процесса в текстовом формате Prometheus (эндпоинт /metrics).
+
+Гистограммы с фиксированными корзинами: наблюдение — bisect по корзинам и
+два инкремента под коротким локом, без аллокаций на горячем пути. Метрики
+живут в памяти процесса; при нескольких воркерах daphne каждый отдает свои,
+а суммирует их сборщик (Prometheus добавляет метку instance).
+"""
+import abc
+import bisect
+import threading
+import time
+import typing
+
+# Секунды: от 0.5 мс до 10 с
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _HistogramChild:
+    __slots__ = ('_buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _Metric(abc.ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, typing.Any] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Значение для одного набора меток."""
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _samples(self) -> typing.Iterable[str]:
+        """Строки выборок в формате Prometheus."""
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self, *labelvalues):
+        """with HISTOGRAM.time('move', 'load'): ... — наблюдает длительность блока."""
+        return _Timer(self.labels(*labelvalues))
+
+    def _samples(self):
+        bounds = [repr(b) for b in self.buckets] + ['+Inf']
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {child.sum}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {child.count}'
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield f'{self.name}_total{_format_labels(self.labelnames, key)} {child.value}'
+
+
+class _GaugeChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение. callback (без меток или со словарем {метки: значение})
+    вычисляет значение в момент сбора вместо хранения.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def _samples(self):
+        if self.callback is not None:
+            values = self.callback()
+            items = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            items = [(key, child.value) for key, child in list(self._children.items())]
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+
+
+class _Timer:
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class PhaseTimer:
+    """
+    Последовательные фазы одной операции:
+
+        phases = PhaseTimer(PHASE_SECONDS, 'move', action_type)
+        ...; phases.mark('load')
+        ...; phases.mark('check')
+
+    Каждая метка наблюдает время с предыдущей метки.
+    """
+    __slots__ = ('_histogram', '_op', '_label', '_last')
+
+    def __init__(self, histogram: Histogram, op: str, label: str = ''):
+        self._histogram = histogram
+        self._op = op
+        self._label = label or ''
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self._histogram.labels(self._op, phase, self._label).observe(now - self._last)
+        self._last = now
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in list(self._metrics.values())) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def counter(name, documentation, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), callback=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+
+# --- Метрики приложения ---
+
+PHASE_SECONDS = histogram(
+    'durak_phase_seconds',
+    'Duration of operation phases (move, status, lobby, ping, timeout).',
+    ('op', 'phase', 'action'),
+)
+GAME_SAVE_SECONDS = histogram(
+    'durak_game_save_seconds',
+    'Duration of DurakGame.save_game_state including settlement on game over.',
+)
+WS_MESSAGE_SECONDS = histogram(
+    'durak_ws_message_seconds',
+    'Time to handle one inbound WebSocket message.',
+    ('consumer', 'type'),
+)
+CHANNEL_SEND_SECONDS = histogram(
+    'durak_channel_send_seconds',
+    'Duration of channel layer group_send calls.',
+    ('action',),
+)
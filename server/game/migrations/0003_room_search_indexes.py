@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gameroom',
+            index=models.Index(fields=['status', 'created_at'], name='gameroom_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gameroom',
+            index=models.Index(fields=['status', 'bet_amount'], name='gameroom_status_bet_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playeractivity',
+            index=models.Index(fields=['room', 'is_active', 'last_ping'], name='activity_room_active_ping_idx'),
+        ),
+    ]
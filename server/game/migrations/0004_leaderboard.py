@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_leaderboard(apps, schema_editor):
+    """Создает записи таблицы лидеров для игроков, уже сыгравших партии."""
+    Player = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    LeaderboardEntry = apps.get_model('game', 'LeaderboardEntry')
+    batch = []
+    for player in Player.objects.filter(games_played__gt=0).iterator(chunk_size=2000):
+        batch.append(LeaderboardEntry(
+            player_id=player.id,
+            games_played=player.games_played,
+            games_won=player.games_won,
+            win_rate=player.games_won / player.games_played * 100,
+            # Сглаженный процент побед — показатель таблицы до перехода на Elo;
+            # 0005_rating_history сбрасывает его, рейтинг считает recompute_ratings
+            score=round((player.games_won + 5) / (player.games_played + 10) * 100, 4),
+        ))
+        if len(batch) >= 2000:
+            LeaderboardEntry.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        LeaderboardEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_room_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=0, help_text='Показатель для сортировки таблицы лидеров')),
+                ('win_rate', models.FloatField(default=0, help_text='Процент побед')),
+                ('games_played', models.PositiveIntegerField(default=0)),
+                ('games_won', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись таблицы лидеров',
+                'verbose_name_plural': 'Таблица лидеров',
+                'indexes': [models.Index(fields=['-score', '-games_played', 'player'], name='leaderboard_rank_idx'), models.Index(fields=['-win_rate', '-games_played'], name='leaderboard_win_rate_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def reset_leaderboard_scores(apps, schema_editor):
+    """Показатель таблицы лидеров теперь рейтинг; до пересчета у всех начальный."""
+    LeaderboardEntry = apps.get_model('game', 'LeaderboardEntry')
+    LeaderboardEntry.objects.update(score=1500.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_leaderboard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gameroom',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, help_text='Время расчета партии (для пересчета рейтингов по истории)', null=True),
+        ),
+        migrations.AddField(
+            model_name='gameroom',
+            name='loser',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lost_game_rooms', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='gameroom',
+            index=models.Index(fields=['status', 'finished_at'], name='gameroom_status_finished_idx'),
+        ),
+        migrations.RunPython(reset_leaderboard_scores, migrations.RunPython.noop),
+    ]
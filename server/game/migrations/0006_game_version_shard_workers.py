@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_rating_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worker_id', models.CharField(max_length=100, unique=True)),
+                ('channel_name', models.CharField(help_text='Канал channel layer, на который пересылаются запросы комнат', max_length=200)),
+                ('heartbeat_at', models.DateTimeField(db_index=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Воркер шардирования',
+                'verbose_name_plural': 'Воркеры шардирования',
+            },
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Номер версии состояния, растет при каждом сохранении'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_game_version_shard_workers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomEventSequence',
+            fields=[
+                ('room_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('seq', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Номер события комнаты',
+                'verbose_name_plural': 'Номера событий комнат',
+            },
+        ),
+    ]
@@ -51,14 +51,30 @@ class GameRoom(models.Model):
         on_delete=models.SET_NULL,
         related_name='won_game_rooms'
     )
+    loser = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='lost_game_rooms'
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     last_activity = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True, help_text="Время расчета партии (для пересчета рейтингов по истории)")
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Игровая комната"
         verbose_name_plural = "Игровые комнаты"
+        indexes = [
+            # Лобби и поиск: фильтр по статусу + сортировка по времени создания
+            models.Index(fields=['status', 'created_at'], name='gameroom_status_created_idx'),
+            # Поиск комнат по диапазону ставки
+            models.Index(fields=['status', 'bet_amount'], name='gameroom_status_bet_idx'),
+            # Хронологический проход по истории партий (recompute_ratings)
+            models.Index(fields=['status', 'finished_at'], name='gameroom_status_finished_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name or f'Комната #{self.id}'} ({self.get_status_display()})"
@@ -89,15 +105,16 @@ class GameRoom(models.Model):
         """Начинает игру, если условия соблюдены."""
         from .game_logic import DurakGame 
         if self.status != self.STATUS_WAITING:
-            logger.warning(f"Attempt to start game for room {self.id} not in WAITING status (current: {self.status})")
+            logger.warning("Attempt to start game for room %s not in WAITING status (current: %s)", self.id, self.status)
             return False
         
-        if self.players.count() < self.min_players_for_start:
-            logger.warning(f"Attempt to start game {self.id} with {self.players.count()} players, needs {self.min_players_for_start}.")
+        players_count = self.players.count()
+        if players_count < self.min_players_for_start:
+            logger.warning("Attempt to start game %s with %s players, needs %s.", self.id, players_count, self.min_players_for_start)
             return False
         
-        if self.players.count() > self.max_players:
-            logger.warning(f"Attempt to start game {self.id} with {self.players.count()} players, but max is {self.max_players}.")
+        if players_count > self.max_players:
+            logger.warning("Attempt to start game %s with %s players, but max is %s.", self.id, players_count, self.max_players)
             return False
 
         try:
@@ -111,68 +128,84 @@ class GameRoom(models.Model):
                     
                     # Проверка, что initialize_new_game_setup действительно создал game_model_instance
                     if not game_logic_instance.game_model_instance:
-                        logger.error(f"Failed to initialize game_model_instance for room {self.id} after calling initialize_new_game_setup.")
+                        logger.error("Failed to initialize game_model_instance for room %s after calling initialize_new_game_setup.", self.id)
                         # Транзакция будет отменена из-за исключения или явного return False
                         return False 
                 else:
-                    logger.warning(f"Game model instance (ID: {game_logic_instance.game_model_instance.id}) already exists for room {self.id} which is in WAITING status. This is unusual. Proceeding to set room to PLAYING.")
+                    logger.warning("Game model instance (ID: %s) already exists for room %s which is in WAITING status. This is unusual. Proceeding to set room to PLAYING.", game_logic_instance.game_model_instance.id, self.id)
                 
-                self.status = self.STATUS_PLAYING
-                self.save(update_fields=['status'])
+                # save_game_state уже перевел эту же комнату в PLAYING
+                if self.status != self.STATUS_PLAYING:
+                    self.status = self.STATUS_PLAYING
+                    self.save(update_fields=['status'])
                 
                 # Логируем ID созданной или существующей Game модели для отладки
                 game_instance_id_log = game_logic_instance.game_model_instance.id if game_logic_instance.game_model_instance else 'None (Error!)'
-                logger.info(f"Game started successfully for room {self.id}. Game instance ID: {game_instance_id_log}")
+                logger.info("Game started successfully for room %s. Game instance ID: %s", self.id, game_instance_id_log)
                 
                 # Здесь обычно отправляется WebSocket уведомление игрокам о начале игры
                 return True
         except Exception as e:
-            logger.error(f"Error starting game for room {self.id}: {e}", exc_info=True)
+            logger.error("Error starting game for room %s: %s", self.id, e, exc_info=True)
             # Транзакция будет отменена автоматически при исключении
             return False
 
     def end_game(self, winner=None, loser=None, is_draw=False):
         """Завершает игру, обновляет статусы и балансы."""
         if self.status == self.STATUS_FINISHED: # Уже завершена
-            logger.info(f"Game room {self.id} is already finished. Skipping end_game call.")
+            logger.info("Game room %s is already finished. Skipping end_game call.", self.id)
             return
 
         with transaction.atomic():
             self.status = self.STATUS_FINISHED
+            self.finished_at = timezone.now()
             if winner and not is_draw: # Устанавливаем победителя только если он есть и это не ничья
                 self.winner = winner
+            if loser and not is_draw:
+                self.loser = loser
             
-            # Сохраняем статус и победителя комнаты
-            update_fields_room = ['status']
+            # Сохраняем статус, победителя и проигравшего комнаты
+            update_fields_room = ['status', 'finished_at']
             if self.winner_id: # Если self.winner был установлен
                 update_fields_room.append('winner')
+            if self.loser_id:
+                update_fields_room.append('loser')
             self.save(update_fields=update_fields_room)
 
             # Обновление статистики и балансов игроков
-            all_players_in_room = list(self.players.all()) # Получаем всех, кто был в комнате
-
-            if not is_draw and winner and self.bet_amount > 0:
-                total_pot = self.bet_amount * len(all_players_in_room) # Ставка каждого игрока
-                winner.cash += total_pot
-                winner.games_won += 1
-                winner.save(update_fields=['cash', 'games_won'])
-                logger.info(f"Player {winner.username} won {total_pot} in room {self.id}")
-                
-            elif is_draw and self.bet_amount > 0: # Если ничья, возвращаем ставки
-                for player_obj in all_players_in_room:
-                    player_obj.cash += self.bet_amount # Возвращаем ставку
-                    player_obj.save(update_fields=['cash'])
-                logger.info(f"Draw in room {self.id}. Bets ({self.bet_amount}) returned to players.")
-            
-            # Обновляем игры сыграно и сбрасываем current_room
+            all_players_in_room = list(self.players.all().order_by('id')) # Получаем всех, кто был в комнате
+            winner_id = winner.id if winner and not is_draw else None
+
+            from .rating import update_ratings_for_game
+            update_ratings_for_game(
+                all_players_in_room,
+                winner=winner if not is_draw else None,
+                loser=self.loser if not is_draw else None,
+                is_draw=is_draw,
+            )
+            total_pot = self.bet_amount * len(all_players_in_room) # Ставка каждого игрока
+
             for player_obj in all_players_in_room:
                 player_obj.games_played += 1
-                if player_obj.current_room == self:
+                if player_obj.id == winner_id:
+                    player_obj.games_won += 1
+                    if self.bet_amount > 0:
+                        player_obj.cash += total_pot
+                        logger.info("Player %s won %s in room %s", player_obj.username, total_pot, self.id)
+                elif is_draw and self.bet_amount > 0: # Если ничья, возвращаем ставки
+                    player_obj.cash += self.bet_amount
+                if player_obj.current_room_id == self.id:
                     player_obj.current_room = None
                 # Сохраняем изменения для каждого игрока
-                player_obj.save(update_fields=['games_played', 'current_room'])
+                player_obj.save(update_fields=['cash', 'games_played', 'games_won', 'rating', 'current_room'])
+
+            if is_draw and self.bet_amount > 0:
+                logger.info("Draw in room %s. Bets (%s) returned to players.", self.id, self.bet_amount)
+
+            from .leaderboard import record_game_results
+            record_game_results(all_players_in_room)
             
-            logger.info(f"Game {self.id} ended. Winner: {winner.username if winner and not is_draw else 'Draw' if is_draw else 'N/A (No winner/No bets)'}")
+            logger.info("Game %s ended. Winner: %s", self.id, winner.username if winner and not is_draw else 'Draw' if is_draw else 'N/A (No winner/No bets)')
             # Очистка активности игроков для этой комнаты
             PlayerActivity.objects.filter(room=self).delete()
 
@@ -180,7 +213,7 @@ class GameRoom(models.Model):
     def cancel_game(self):
         """Отменяет ожидающую игру и возвращает ставки."""
         if self.status != self.STATUS_WAITING:
-            logger.warning(f"Attempt to cancel room {self.id} not in WAITING status (current: {self.status})")
+            logger.warning("Attempt to cancel room %s not in WAITING status (current: %s)", self.id, self.status)
             return
 
         with transaction.atomic():
@@ -190,16 +223,16 @@ class GameRoom(models.Model):
             if self.bet_amount > 0:
                 for player_obj in self.players.all():
                     player_obj.cash += self.bet_amount
-                    if player_obj.current_room == self:
+                    if player_obj.current_room_id == self.id:
                         player_obj.current_room = None
                     player_obj.save(update_fields=['cash', 'current_room'])
             else: # Если ставок не было, все равно обнуляем current_room
                  for player_obj in self.players.all():
-                    if player_obj.current_room == self:
+                    if player_obj.current_room_id == self.id:
                         player_obj.current_room = None
                     player_obj.save(update_fields=['current_room'])
             
-            logger.info(f"Game room {self.id} cancelled.")
+            logger.info("Game room %s cancelled.", self.id)
             PlayerActivity.objects.filter(room=self).delete()
 
 
@@ -213,12 +246,13 @@ class GameRoom(models.Model):
                 last_ping__gte=timezone.now() - timezone.timedelta(seconds=timeout_seconds)
             ).exists()
 
-            if not recent_activity_exists and self.players.count() > 0:
-                logger.info(f"Canceling inactive waiting room {self.id} due to player inactivity.")
+            players_count = self.players.count()
+            if not recent_activity_exists and players_count > 0:
+                logger.info("Canceling inactive waiting room %s due to player inactivity.", self.id)
                 self.cancel_game()
                 return True
-            elif self.players.count() == 0 and (timezone.now() - self.created_at).total_seconds() > timeout_seconds:
-                logger.info(f"Deleting empty and old waiting room {self.id}.")
+            elif players_count == 0 and (timezone.now() - self.created_at).total_seconds() > timeout_seconds:
+                logger.info("Deleting empty and old waiting room %s.", self.id)
                 self.delete()
                 return True
         return False
@@ -251,6 +285,7 @@ class Game(models.Model):
     deck = models.JSONField(default=list, help_text="Список карт в колоде")
     table = models.JSONField(default=list, help_text="Список карт на столе (атака/защита)")
     player_hands = models.JSONField(default=dict, help_text="Словарь {player_id: [карты]} для рук игроков")
+    version = models.PositiveIntegerField(default=0, help_text="Номер версии состояния, растет при каждом сохранении")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -263,6 +298,71 @@ class Game(models.Model):
         return f"Игра для комнаты #{self.room.id} ({self.get_status_display()})"
 
 
+class ShardWorker(models.Model):
+    """
+    Живой воркер в режиме шардирования комнат (game.sharding).
+    Воркеры периодически обновляют heartbeat_at; по списку живых строится
+    кольцо консистентного хеширования room_id -> воркер-владелец.
+    """
+    worker_id = models.CharField(max_length=100, unique=True)
+    channel_name = models.CharField(max_length=200, help_text="Канал channel layer, на который пересылаются запросы комнат")
+    heartbeat_at = models.DateTimeField(db_index=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Воркер шардирования"
+        verbose_name_plural = "Воркеры шардирования"
+
+    def __str__(self):
+        return f"{self.worker_id} ({self.channel_name})"
+
+
+class RoomEventSequence(models.Model):
+    """
+    Последний номер события, разосланного в группу комнаты (game.replay).
+    Отдельная таблица, а не поле GameRoom: GameRoom.save() перезаписывает все
+    поля и затирал бы счетчик устаревшим значением. Внешнего ключа нет, чтобы
+    событие удаляемой комнаты (player_left) могло получить номер.
+    """
+    room_id = models.PositiveIntegerField(primary_key=True)
+    seq = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Номер события комнаты"
+        verbose_name_plural = "Номера событий комнат"
+
+    def __str__(self):
+        return f"Комната #{self.room_id}: {self.seq}"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Строка таблицы лидеров. Обновляется инкрементально при расчете партии
+    (GameRoom.end_game), чтобы рейтинг читался по индексу без пересчета.
+    """
+    player = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='leaderboard_entry'
+    )
+    score = models.FloatField(default=0, help_text="Показатель для сортировки таблицы лидеров")
+    win_rate = models.FloatField(default=0, help_text="Процент побед")
+    games_played = models.PositiveIntegerField(default=0)
+    games_won = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Запись таблицы лидеров"
+        verbose_name_plural = "Таблица лидеров"
+        indexes = [
+            models.Index(fields=['-score', '-games_played', 'player'], name='leaderboard_rank_idx'),
+            models.Index(fields=['-win_rate', '-games_played'], name='leaderboard_win_rate_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.player.username}: {self.score}"
+
+
 class PlayerActivity(models.Model):
     """
     Отслеживание активности игрока в комнате (для WebSockets, определения неактивных и т.д.)
@@ -277,6 +377,10 @@ class PlayerActivity(models.Model):
         ordering = ['-last_ping']
         verbose_name = "Активность игрока"
         verbose_name_plural = "Активности игроков"
+        indexes = [
+            # Проверка недавней активности в комнате (clean_up_inactive_waiting_room)
+            models.Index(fields=['room', 'is_active', 'last_ping'], name='activity_room_active_ping_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.is_active:
@@ -0,0 +1,138 @@
+"""
+Исходящая очередь WebSocket-соединения.
+
+GameConsumer не ждет отправки каждого события в сокет: сообщения кладутся
+в ограниченную очередь, а отдельная задача пишет их по порядку. Обработчик
+событий группы сразу освобождается, канал соединения в channel layer не
+переполняется, и InMemoryChannelLayer не выбрасывает молча сообщения
+медленного клиента, а рассылка в комнату не ждет его сокета.
+
+Пока медленный клиент не забрал старое state_changed комнаты, новое
+заменяет его: в очереди остается только последнее уведомление о
+состоянии, а остальные события (вход и выход игроков, ответы на запросы)
+идут в исходном порядке. Если самое старое сообщение ждет дольше
+WS_OUTBOUND_LAG_BUDGET секунд или очередь длиннее WS_OUTBOUND_MAX_MESSAGES,
+соединение закрывается: клиент переподключится с last_seq и получит
+пропущенное из game.replay.
+"""
+import asyncio
+import collections
+import json
+import time
+import typing
+
+from django.conf import settings
+
+from . import metrics
+
+# Код закрытия для клиентов, не успевающих читать
+CLOSE_CODE_TOO_SLOW = 4008
+
+# Уведомления, из которых клиенту нужно только последнее
+COALESCED_ACTIONS = frozenset({'state_changed'})
+
+OUTBOUND_COALESCED = metrics.counter(
+    'durak_ws_outbound_coalesced',
+    'Outbound messages replaced by a newer state update before sending.',
+    ('consumer',),
+)
+OUTBOUND_SLOW_CLOSED = metrics.counter(
+    'durak_ws_outbound_slow_closed',
+    'Connections closed for exceeding the outbound lag budget.',
+    ('consumer',),
+)
+OUTBOUND_LAG_SECONDS = metrics.histogram(
+    'durak_ws_outbound_lag_seconds',
+    'Time a message waited in the per-connection outbound queue.',
+    ('consumer',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+def _coalesce_key(message) -> typing.Optional[tuple]:
+    if isinstance(message, dict) and message.get('action') in COALESCED_ACTIONS:
+        return message['action'], message.get('room_id')
+    return None
+
+
+class OutboundQueue:
+    """
+    send — корутина отправки кадра в сокет; encode — словарь -> str (текстовый
+    кадр) или bytes (бинарный, game.wire); label — метка consumer-а для метрик.
+    Уже закодированные сообщения (str, например кадры зрителей) уходят как есть.
+    """
+
+    def __init__(self, send: typing.Callable[[typing.Union[str, bytes]], typing.Awaitable],
+                 label: str = '', encode: typing.Callable[[dict], typing.Union[str, bytes]] = json.dumps):
+        self._send = send
+        self._encode = encode
+        self.label = label
+        self.max_messages = getattr(settings, 'WS_OUTBOUND_MAX_MESSAGES', 512)
+        self.lag_budget = getattr(settings, 'WS_OUTBOUND_LAG_BUDGET', 10.0)
+        # Элементы — [время постановки, сообщение или None, если его заменили]
+        self._queue: collections.deque = collections.deque()
+        self._latest: dict[tuple, list] = {}
+        self._pending = 0
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return self._pending
+
+    def put(self, message: typing.Union[dict, str]) -> bool:
+        """Ставит сообщение в очередь. False — клиент превысил бюджет, соединение нужно закрыть."""
+        if self.is_lagging():
+            OUTBOUND_SLOW_CLOSED.labels(self.label).inc()
+            return False
+
+        entry = [time.monotonic(), message]
+        key = _coalesce_key(message)
+        if key is not None:
+            superseded = self._latest.get(key)
+            if superseded is not None and superseded[1] is not None:
+                superseded[1] = None
+                self._pending -= 1
+                OUTBOUND_COALESCED.labels(self.label).inc()
+            self._latest[key] = entry
+        self._queue.append(entry)
+        self._pending += 1
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+        return True
+
+    def is_lagging(self) -> bool:
+        if self._pending >= self.max_messages:
+            return True
+        oldest = self._oldest()
+        return oldest is not None and time.monotonic() - oldest > self.lag_budget
+
+    def _oldest(self) -> typing.Optional[float]:
+        # Замененные элементы в голове очереди больше не нужны
+        while self._queue and self._queue[0][1] is None:
+            self._queue.popleft()
+        return self._queue[0][0] if self._queue else None
+
+    async def _drain(self):
+        while self._oldest() is not None:
+            queued_at, message = self._queue.popleft()
+            self._pending -= 1
+            key = _coalesce_key(message)
+            if key is not None and self._latest.get(key, (None, None))[1] is message:
+                del self._latest[key]
+            OUTBOUND_LAG_SECONDS.labels(self.label).observe(time.monotonic() - queued_at)
+            try:
+                await self._send(message if isinstance(message, str) else self._encode(message))
+            except Exception:
+                # Сокет закрыт: ошибку учел ws_health, остальное отправлять некуда
+                self._queue.clear()
+                self._latest.clear()
+                self._pending = 0
+                return
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._queue.clear()
+        self._latest.clear()
+        self._pending = 0
@@ -0,0 +1,69 @@
+"""
+Keyset (курсорная) пагинация.
+
+Вместо OFFSET/среза по номеру страницы клиент передает курсор — значения
+полей сортировки последней полученной записи. Следующая страница выбирается
+условием "строго после курсора", поэтому запрос идет по индексу и не
+зависит от того, насколько далеко пролистан список.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+
+def encode_cursor(values) -> str:
+    """Кодирует значения полей сортировки в непрозрачную строку для клиента."""
+    raw = json.dumps([str(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, expected_len: int):
+    """Возвращает список значений курсора или None, если курсор поврежден."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != expected_len:
+        return None
+    return values
+
+
+def keyset_q(ordering, values) -> Q:
+    """
+    Строит условие "запись идет после курсора" для упорядочивания ordering.
+
+    Для ordering=['-created_at', '-id'] и значений (t, 5) получится
+    created_at < t OR (created_at = t AND id < 5).
+    """
+    condition = Q()
+    equal_prefix = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+        equal_prefix &= Q(**{name: value})
+    return condition
+
+
+def paginate_keyset(queryset, ordering, cursor, page_size, key_func):
+    """
+    Возвращает (записи страницы, курсор следующей страницы или None).
+
+    key_func(obj) должен возвращать значения полей ordering для записи.
+    Невалидный курсор трактуется как начало списка.
+    """
+    values = decode_cursor(cursor, len(ordering))
+    queryset = queryset.order_by(*ordering)
+    if values is not None:
+        queryset = queryset.filter(keyset_q(ordering, values))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(key_func(items[-1]))
+    return items, next_cursor
@@ -0,0 +1,136 @@
+"""
+Рейтинг силы игроков (многопользовательский Elo).
+
+Партия в "Дурака" на 2–4 игрока раскладывается на попарные сравнения:
+проигравший (дурак) уступает всем, победитель (вышедший первым, если известен)
+выигрывает у всех, остальные между собой играют вничью. Для каждой пары
+считается обычное ожидание Elo, а сумма отклонений масштабируется на
+K / (n - 1), чтобы шаг рейтинга не зависел от числа игроков за столом.
+
+Онлайн-обновление (update_ratings_for_game) и пакетный пересчет
+(replay_ratings, NumPy) используют одну и ту же формулу.
+"""
+import typing
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+ELO_SCALE = 400.0
+
+SCORE_WIN = 1.0
+SCORE_NEUTRAL = 0.5
+SCORE_LOSS = 0.0
+
+
+def game_scores(player_ids, winner_id=None, loser_id=None, is_draw=False) -> list[float]:
+    """Итоговые очки игроков партии в порядке player_ids."""
+    if is_draw:
+        return [SCORE_NEUTRAL] * len(player_ids)
+    scores = []
+    for pid in player_ids:
+        if pid == loser_id:
+            scores.append(SCORE_LOSS)
+        elif pid == winner_id:
+            scores.append(SCORE_WIN)
+        else:
+            scores.append(SCORE_NEUTRAL)
+    return scores
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / ELO_SCALE))
+
+
+def rating_deltas(ratings: typing.Sequence[float], scores: typing.Sequence[float],
+                  k_factor: float = K_FACTOR) -> list[float]:
+    """Изменения рейтингов участников одной партии."""
+    n = len(ratings)
+    if n < 2:
+        return [0.0] * n
+    k = k_factor / (n - 1)
+    deltas = []
+    for i in range(n):
+        total = 0.0
+        for j in range(n):
+            if i == j:
+                continue
+            actual = 0.5 if scores[i] == scores[j] else float(scores[i] > scores[j])
+            total += actual - expected_score(ratings[i], ratings[j])
+        deltas.append(k * total)
+    return deltas
+
+
+def update_ratings_for_game(players, winner=None, loser=None, is_draw=False) -> None:
+    """Обновляет player.rating на месте (сохранение — забота вызывающего)."""
+    players = list(players)
+    scores = game_scores(
+        [p.id for p in players],
+        winner_id=winner.id if winner else None,
+        loser_id=loser.id if loser else None,
+        is_draw=is_draw,
+    )
+    deltas = rating_deltas([p.rating for p in players], scores)
+    for player, delta in zip(players, deltas):
+        player.rating = player.rating + delta
+
+
+def assign_waves(games_players: typing.Sequence[typing.Sequence[int]]) -> list[int]:
+    """
+    Распределяет партии (в хронологическом порядке) по "волнам".
+
+    Партия попадает в волну сразу после последней волны, где участвовал любой
+    из ее игроков. В одной волне игроки не повторяются, а для каждого игрока
+    порядок его партий сохраняется, поэтому пересчет волнами дает тот же
+    результат, что и последовательный.
+    """
+    last_wave: dict[int, int] = {}
+    waves = []
+    for players in games_players:
+        wave = 1 + max((last_wave.get(p, -1) for p in players), default=-1)
+        for p in players:
+            last_wave[p] = wave
+        waves.append(wave)
+    return waves
+
+
+def replay_ratings(player_idx, scores, n_players: int, initial: float = INITIAL_RATING,
+                   k_factor: float = K_FACTOR):
+    """
+    Векторизованный пересчет рейтингов по истории партий.
+
+    player_idx — массив (games, 4) индексов игроков (0..n_players-1), -1 для
+    пустых мест; scores — массив (games, 4) очков из game_scores. Партии
+    должны идти в хронологическом порядке. Возвращает массив рейтингов.
+    """
+    import numpy as np
+
+    player_idx = np.asarray(player_idx, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    ratings = np.full(n_players, float(initial), dtype=np.float64)
+    if len(player_idx) == 0:
+        return ratings
+
+    mask = player_idx >= 0
+    seats = mask.sum(axis=1)
+    waves = np.asarray(assign_waves([row[row >= 0].tolist() for row in player_idx]), dtype=np.int64)
+
+    # Исходы пар не зависят от рейтингов — считаем их один раз для всех партий.
+    pair_mask = mask[:, :, None] & mask[:, None, :]
+    pair_mask &= ~np.eye(player_idx.shape[1], dtype=bool)[None, :, :]
+    actual = np.where(scores[:, :, None] > scores[:, None, :], 1.0, 0.0)
+    actual = np.where(scores[:, :, None] == scores[:, None, :], 0.5, actual)
+    k = np.where(seats > 1, k_factor / np.maximum(seats - 1, 1), 0.0)
+
+    order = np.argsort(waves, kind='stable')
+    boundaries = np.flatnonzero(np.diff(waves[order])) + 1
+    safe_idx = np.where(mask, player_idx, 0)
+
+    for batch in np.split(order, boundaries):
+        idx = safe_idx[batch]
+        current = ratings[idx]
+        expected = 1.0 / (1.0 + 10 ** ((current[:, None, :] - current[:, :, None]) / ELO_SCALE))
+        diff = np.where(pair_mask[batch], actual[batch] - expected, 0.0).sum(axis=2)
+        deltas = diff * k[batch][:, None]
+        m = mask[batch]
+        ratings[idx[m]] += deltas[m]
+
+    return ratings
@@ -0,0 +1,251 @@
+"""
+Номера событий комнат и буфер для возобновления WebSocket-сессий.
+
+Каждое событие группы game_{room_id} получает номер seq — общий для всех
+процессов счетчик в таблице RoomEventSequence (один upsert на пачку событий
+комнаты). Последние REPLAY_BUFFER_EVENTS событий каждой комнаты хранятся в
+кольцевом буфере процесса: туда пишет и процесс-отправитель, и каждый
+GameConsumer, получивший событие из группы, поэтому буфер воркера полон,
+пока в комнате есть хотя бы один его сокет.
+
+Клиент, потерявший соединение, переподключается к
+ws/game/<room_id>/?last_seq=N и получает только пропущенные события. Если
+их уже нет в буфере этого воркера (разрыв длиннее буфера, комната
+вытеснена из LRU, клиент попал на другой воркер), отправляется полное
+состояние — как при первом открытии страницы.
+
+Номера выдаются в БД раньше, чем события уходят в группу, поэтому от двух
+процессов-отправителей события могут прийти не по порядку. SeqGate
+придерживает событие с пропуском перед ним до REPLAY_GAP_WAIT_SECONDS и,
+если пропущенное так и не пришло, досылает его как при переподключении.
+"""
+import asyncio
+import collections
+import logging
+import threading
+import typing
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connections, router
+
+from . import metrics
+from .models import RoomEventSequence
+
+logger = logging.getLogger(__name__)
+
+REPLAY_EVENTS = metrics.counter(
+    'durak_replay_events',
+    'Room events replayed to resuming WebSocket clients.',
+)
+REPLAY_RESUMES = metrics.counter(
+    'durak_replay_resumes',
+    'WebSocket resume attempts by outcome.',
+    ('outcome',),
+)
+REPLAY_GAPS = metrics.counter(
+    'durak_replay_gaps',
+    'Gaps in room event numbers seen by a socket, by how they were closed.',
+    ('outcome',),
+)
+
+
+class RoomEventBuffer:
+    """Кольцевые буферы (seq, message) по комнатам; вытеснение комнат по LRU."""
+
+    def __init__(self, events_per_room: int = 256, max_rooms: int = 10000):
+        self.events_per_room = events_per_room
+        self.max_rooms = max_rooms
+        self._rooms: collections.OrderedDict[int, collections.deque] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, room_id: int, seq: int, message: dict):
+        with self._lock:
+            events = self._rooms.get(room_id)
+            if events is None:
+                events = self._rooms[room_id] = collections.deque(maxlen=self.events_per_room)
+                while len(self._rooms) > self.max_rooms:
+                    self._rooms.popitem(last=False)
+            else:
+                self._rooms.move_to_end(room_id)
+
+            if not events or seq > events[-1][0]:
+                events.append((seq, message))
+                return
+            if seq < events[0][0] and len(events) == events.maxlen:
+                return
+            # Событие пришло не по порядку (несколько отправителей) или уже записано
+            if any(s == seq for s, _ in events):
+                return
+            items = sorted([*events, (seq, message)], key=lambda item: item[0])
+            events.clear()
+            events.extend(items[-self.events_per_room:])
+
+    def since(self, room_id: int, last_seq: int, upto: int) -> typing.Optional[list[dict]]:
+        """События last_seq+1..upto без пропусков или None, если буфер их не покрывает."""
+        if upto <= last_seq:
+            return []
+        with self._lock:
+            events = self._rooms.get(room_id)
+            if not events:
+                return None
+            missed = [(seq, message) for seq, message in events if last_seq < seq <= upto]
+        if [seq for seq, _ in missed] != list(range(last_seq + 1, upto + 1)):
+            return None
+        return [message for _, message in missed]
+
+    def forget(self, room_id: int):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+
+buffer = RoomEventBuffer(
+    events_per_room=getattr(settings, 'REPLAY_BUFFER_EVENTS', 256),
+    max_rooms=getattr(settings, 'REPLAY_BUFFER_ROOMS', 10000),
+)
+
+
+def allocate(room_id: int, count: int) -> int:
+    """Резервирует count номеров для комнаты; возвращает последний из них."""
+    alias = router.db_for_write(RoomEventSequence)
+    connection = connections[alias]
+    table = connection.ops.quote_name(RoomEventSequence._meta.db_table)
+    # INSERT ... ON CONFLICT ... RETURNING есть и в PostgreSQL, и в SQLite 3.35+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (room_id, seq) VALUES (%s, %s) "
+            f"ON CONFLICT (room_id) DO UPDATE SET seq = {table}.seq + excluded.seq RETURNING seq",
+            [room_id, count],
+        )
+        return cursor.fetchone()[0]
+
+
+def current_seq(room_id: int) -> int:
+    alias = router.db_for_write(RoomEventSequence)
+    seq = RoomEventSequence.objects.using(alias).filter(room_id=room_id).values_list('seq', flat=True).first()
+    return seq or 0
+
+
+def sequence_events(events) -> None:
+    """
+    Проставляет message['seq'] событиям комнат (room_event) и запоминает их
+    в буфере. Остальные события (кадры зрителей) не трогает.
+    """
+    by_room: dict[int, list[dict]] = {}
+    for _group, event in events:
+        if event.get('type') == 'game_message' and event.get('room_id') is not None:
+            by_room.setdefault(event['room_id'], []).append(event['message'])
+    for room_id, messages in by_room.items():
+        try:
+            last = allocate(room_id, len(messages))
+        except Exception as e:
+            # Без номера событие все равно уходит: клиент при разрыве получит полное состояние
+            logger.warning(f"Failed to allocate event seq for room {room_id}: {e!r}")
+            continue
+        for seq, message in enumerate(messages, start=last - len(messages) + 1):
+            message['seq'] = seq
+            buffer.record(room_id, seq, message)
+
+
+async def resume(room_id: int, last_seq: typing.Optional[int], user) -> tuple[list[dict], int]:
+    """
+    Сообщения для подключившегося клиента и номер, с которого отсекать дубли.
+    Номер текущего события читается после group_add: все, что новее, придет
+    из группы, а совпадения с досланным отсекаются по возвращенному номеру.
+    """
+    upto = await database_sync_to_async(current_seq)(room_id)
+    if last_seq is None:
+        # Новое подключение: клиент узнает, с какого номера продолжать
+        return [{'action': 'session', 'seq': upto}], 0
+
+    missed = buffer.since(room_id, last_seq, upto)
+    if missed is not None:
+        REPLAY_RESUMES.labels('replayed').inc()
+        REPLAY_EVENTS.inc(len(missed))
+        return missed, upto
+
+    REPLAY_RESUMES.labels('resync').inc()
+    payload = {}
+    if user is not None and user.is_authenticated:
+        from . import sharding
+        payload, status = await sharding.dispatch('status', room_id, user, {})
+        payload = {**payload, 'status': status}
+    # Состояние загружено после чтения upto и уже включает события до него
+    return [{'action': 'resync', 'seq': upto, **payload}], upto
+
+
+class SeqGate:
+    """
+    Порядок событий одной комнаты для одного сокета.
+
+    Дубли (seq <= last_seq) отбрасываются, следующее по номеру событие
+    отправляется сразу вместе с придержанными за ним. Событие с пропуском
+    перед ним ждет пропущенное REPLAY_GAP_WAIT_SECONDS; если оно не пришло,
+    недостающее берется как при переподключении (resume: буфер или resync),
+    а не теряется. last_seq = 0 — номера еще нет (новое подключение), первое
+    событие принимается как есть.
+    """
+
+    def __init__(self, room_id: int, last_seq: int, deliver, user=None):
+        self.room_id = room_id
+        self.last_seq = last_seq
+        self._deliver = deliver
+        self._user = user
+        self._held: dict[int, dict] = {}
+        self._gap_task: typing.Optional[asyncio.Task] = None
+
+    async def offer(self, seq: int, message: dict):
+        if seq <= self.last_seq or seq in self._held:
+            return
+        if self.last_seq and seq > self.last_seq + 1:
+            self._held[seq] = message
+            if self._gap_task is None:
+                self._gap_task = asyncio.create_task(self._close_gap())
+            return
+        self.last_seq = seq
+        await self._deliver(message)
+        await self._drain()
+
+    async def _drain(self):
+        while self.last_seq + 1 in self._held:
+            self.last_seq += 1
+            await self._deliver(self._held.pop(self.last_seq))
+        if not self._held and self._gap_task is not None and self._gap_task is not asyncio.current_task():
+            # Пропущенное событие пришло само
+            REPLAY_GAPS.labels('filled').inc()
+            self._gap_task.cancel()
+            self._gap_task = None
+
+    async def _close_gap(self):
+        await asyncio.sleep(getattr(settings, 'REPLAY_GAP_WAIT_SECONDS', 0.5))
+        try:
+            messages, upto = await resume(self.room_id, self.last_seq, self._user)
+        except Exception as e:
+            # Досылка не удалась: отдаем то, что есть, клиент при разрыве получит полное состояние
+            logger.error(f"Failed to close event gap in room {self.room_id} after seq {self.last_seq}: {e}", exc_info=True)
+            REPLAY_GAPS.labels('skipped').inc()
+            messages, upto = [], max(self._held)
+        else:
+            REPLAY_GAPS.labels('resumed').inc()
+        self._gap_task = None
+
+        for message in messages:
+            # Пока шел resume, часть событий могла дойти и уже отправлена
+            if message.get('action') == 'resync' or message.get('seq', 0) > self.last_seq:
+                await self._deliver(message)
+        self.last_seq = max(self.last_seq, upto)
+        held, self._held = self._held, {}
+        for seq in sorted(held):
+            if seq > self.last_seq:
+                self._held[seq] = held[seq]
+            elif not messages:
+                await self._deliver(held[seq])
+        await self._drain()
+        if self._held and self._gap_task is None:
+            self._gap_task = asyncio.create_task(self._close_gap())
+
+    def close(self):
+        if self._gap_task is not None:
+            self._gap_task.cancel()
+            self._gap_task = None
+        self._held.clear()
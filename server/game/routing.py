@@ -3,4 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/game/(?P<room_id>\w+)/$', consumers.GameConsumer.as_asgi()),
+    re_path(r'ws/mux/$', consumers.MuxConsumer.as_asgi()),
+    re_path(r'ws/spectate/(?P<room_id>\d+)/$', consumers.SpectatorConsumer.as_asgi()),
 ]
\ No newline at end of file
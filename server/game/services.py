@@ -0,0 +1,308 @@
+"""
+Игровые операции, общие для HTTP-представлений, WebSocket-потребителей и
+пересылки между воркерами (game.sharding).
+
+Функции возвращают пару (payload, http_status): payload сериализуем в JSON
+и может быть передан через channel layer без изменений.
+"""
+import logging
+import typing
+
+from django.db import transaction
+
+from server.logging_utils import log_context, new_id
+
+from . import idempotency, metrics, spectators
+from .broadcast import broadcast_room_events, lobby_event, room_event
+from .game_logic import DurakGame, StaleGameStateError
+from .models import GameRoom
+
+logger = logging.getLogger(__name__)
+
+# Допустимые action_type; остальные попадают в метрики как 'unknown'
+MOVE_ACTIONS = frozenset({'play_card', 'attack', 'defend', 'pass_bito', 'take'})
+
+
+def _error(message, status):
+    return {'success': False, 'error': message}, status
+
+
+def _int_param(data, name):
+    value = data.get(name)
+    if value is None:
+        return None
+    return int(value)
+
+
+def _card_in_hand(game: DurakGame, user, card_id) -> int:
+    """Позиция карты в руке по ее устойчивому id; LookupError, если карты нет."""
+    index = game.hand_index_of(user, str(card_id))
+    if index is None:
+        raise LookupError(f'Карты {card_id} нет у вас в руке.')
+    return index
+
+
+def _hand_index(game: DurakGame, user, data: dict, id_name: str, index_name: str):
+    """Карта по id (id_name), а для старых клиентов — по индексу в руке (index_name)."""
+    card_id = data.get(id_name)
+    if card_id is None:
+        return _int_param(data, index_name)
+    return _card_in_hand(game, user, card_id)
+
+
+def _state_events(game: DurakGame, message: dict) -> list:
+    """state_changed для игроков и кадр для зрителей; строится после коммита, чтобы не кэшировать откаченную версию."""
+    events = [room_event(game.room.id, message)]
+    if message.get('is_game_over'):
+        events.append(lobby_event(game.room.id, GameRoom.STATUS_FINISHED))
+    if spectators.is_enabled():
+        events.append(spectators.spectator_event(game))
+    return events
+
+
+def _jsonable_result(result: dict) -> dict:
+    """Результат DurakGame может содержать объекты Player (winner/loser) — заменяем их именами."""
+    clean = {}
+    for key, value in result.items():
+        if key in ('winner', 'loser'):
+            clean[f'{key}_username'] = value.username if value else None
+        else:
+            clean[key] = value
+    return clean
+
+
+def load_room_game(room_id) -> typing.Optional[DurakGame]:
+    """Загружает комнату и состояние партии из БД. None, если комнаты нет."""
+    room = GameRoom.objects.select_related('creator', 'winner').filter(id=room_id).first()
+    if room is None:
+        return None
+    return DurakGame(room)
+
+
+def is_game_player(game: DurakGame, user) -> bool:
+    return any(p.id == user.id for p in game.players)
+
+
+def apply_move(game: DurakGame, user, data: dict) -> tuple[dict, int]:
+    """Проверяет параметры хода и применяет его к загруженной партии."""
+    action_type = data.get('action_type')
+    response_data = {'success': False, 'message': 'Неизвестное действие или ошибка.'}
+
+    if action_type == 'play_card':
+        try:
+            card_hand_index = _hand_index(game, user, data, 'card_id', 'card_hand_index')
+        except (TypeError, ValueError):
+            return _error('Индекс карты должен быть числом.', 400)
+        except LookupError as e:
+            return _error(str(e), 400)
+        if card_hand_index is None:
+            return _error('Не указан индекс карты для хода.', 400)
+        result = game.play_card(user, card_hand_index)
+
+    elif action_type == 'attack':
+        card_ids = data.get('card_ids')
+        card_indices_raw = data.get('card_indices') if card_ids is None else card_ids
+        if card_indices_raw is None or not isinstance(card_indices_raw, list):
+            return _error('Не указаны карты для атаки (ожидался список).', 400)
+        try:
+            if card_ids is not None:
+                card_indices = [_card_in_hand(game, user, card_id) for card_id in card_ids]
+            else:
+                card_indices = [int(idx) for idx in card_indices_raw]
+        except (TypeError, ValueError):
+            return _error('Индексы карт должны быть числами.', 400)
+        except LookupError as e:
+            return _error(str(e), 400)
+        if not card_indices:
+            return _error('Список карт для атаки пуст.', 400)
+        result = game.attack(user, card_indices[0])
+
+    elif action_type == 'defend':
+        try:
+            if data.get('attack_card_id') is not None:
+                attack_card_table_index = game.table_index_of(str(data['attack_card_id']))
+                if attack_card_table_index is None:
+                    return _error(f"Карты {data['attack_card_id']} нет на столе.", 400)
+            else:
+                attack_card_table_index = _int_param(data, 'attack_card_table_index')
+            defense_card_hand_index = _hand_index(game, user, data, 'defense_card_id', 'defense_card_hand_index')
+        except (TypeError, ValueError):
+            return _error('Индексы карт должны быть числами.', 400)
+        except LookupError as e:
+            return _error(str(e), 400)
+        if attack_card_table_index is None or defense_card_hand_index is None:
+            return _error('Не указаны карты для защиты.', 400)
+        result = game.defend(user, attack_card_table_index, defense_card_hand_index)
+
+    elif action_type == 'pass_bito':
+        result = game.pass_or_bito_action(user)
+
+    elif action_type == 'take':
+        result = game.take_cards_action(user)
+
+    else:
+        logger.warning("Неизвестный action_type '%s' от пользователя %s в комнате %s", action_type, user.username, game.room.id)
+        return _error('Неизвестный тип действия.', 400)
+
+    response_data.update(_jsonable_result(result))
+    return response_data, 200
+
+
+def perform_move(room_id, user, data: dict, game: typing.Optional[DurakGame] = None) -> tuple[dict, int]:
+    """
+    Выполняет ход игрока в транзакции и рассылает событие после коммита.
+
+    game — уже загруженная партия (горячее состояние воркера-владельца);
+    без него партия читается из БД. При конкурентной записи
+    (StaleGameStateError) возвращается 409, изменения откатываются.
+    Повтор хода с тем же action_id получает сохраненный ответ (game.idempotency).
+    """
+    with log_context(room_id=room_id, move_id=new_id()):
+        try:
+            action_id = idempotency.action_id(data)
+        except ValueError as e:
+            return _error(str(e), 400)
+        if action_id is not None:
+            cached = idempotency.results.get(int(room_id), user.id, action_id)
+            if cached is not None:
+                idempotency.MOVE_DUPLICATES.inc()
+                logger.info("Duplicate move %s by %s in room %s, returning stored result.", action_id, user.username, room_id)
+                return {**cached, 'duplicate': True}, 200
+        return _perform_move(room_id, user, data, game, action_id)
+
+
+def _perform_move(room_id, user, data: dict, game: typing.Optional[DurakGame] = None,
+                  action_id: typing.Optional[str] = None) -> tuple[dict, int]:
+    action_type = data.get('action_type')
+    phases = metrics.PhaseTimer(metrics.PHASE_SECONDS, 'move', action_type if action_type in MOVE_ACTIONS else 'unknown')
+    try:
+        with transaction.atomic():
+            if game is None:
+                game = load_room_game(room_id)
+                if game is None:
+                    return _error('Комната не найдена.', 404)
+            phases.mark('load')
+
+            if not is_game_player(game, user):
+                return _error('Вы не являетесь участником этой игры.', 403)
+            if game.room.status != GameRoom.STATUS_PLAYING:
+                return _error('Игра не активна.', 400)
+            if not game.game_model_instance:
+                logger.warning("perform_move: Game model instance for room %s not found/initialized in DurakGame.", room_id)
+                return _error('Состояние игры не найдено или не инициализировано в DurakGame.', 500)
+            phases.mark('check')
+
+            payload, status = apply_move(game, user, data)
+            phases.mark('apply')
+
+            if payload.get('success'):
+                message = {
+                    'action': 'state_changed',
+                    'room_id': game.room.id,
+                    'action_type': data.get('action_type'),
+                    'is_game_over': bool(payload.get('game_over')),
+                }
+                transaction.on_commit(lambda: broadcast_room_events(_state_events(game, message)))
+                if action_id is not None:
+                    payload['action_id'] = action_id
+                    transaction.on_commit(lambda: idempotency.results.put(game.room.id, user.id, action_id, payload))
+        phases.mark('commit')
+        return payload, status
+
+    except StaleGameStateError:
+        logger.info("Concurrent update of game state in room %s, move by %s rejected.", room_id, user.username)
+        return _error('Состояние игры изменилось. Обновите состояние и повторите ход.', 409)
+    except Exception as e:
+        logger.error("Ошибка при обработке хода в комнате %s игроком %s: %s", room_id, user.username, e, exc_info=True)
+        return _error('Внутренняя ошибка сервера при обработке хода.', 500)
+
+
+def game_status(room_id, user, game: typing.Optional[DurakGame] = None) -> tuple[dict, int]:
+    """Состояние партии, видимое игроку user."""
+    phases = metrics.PhaseTimer(metrics.PHASE_SECONDS, 'status')
+    try:
+        if game is None:
+            game = load_room_game(room_id)
+            if game is None:
+                return _error('Комната не найдена.', 404)
+        phases.mark('load')
+
+        if not is_game_player(game, user):
+            return _error('Вы не участник этой игры.', 403)
+
+        game_state = game.get_game_state(for_player_user_obj=user)
+        phases.mark('render')
+        return {'success': True, 'game_state': game_state}, 200
+    except Exception as e:
+        logger.error("Ошибка при получении статуса игры для комнаты %s: %s", room_id, e)
+        return _error('Ошибка при получении состояния игры.', 500)
+
+
+def _timeout_move(game: DurakGame) -> typing.Optional[tuple[str, typing.Callable[[], dict]]]:
+    """Действие по умолчанию за игрока, который не успел походить."""
+    attacker = game.players[game.attacker_index]
+    defender = game.players[game.defender_index]
+    if not game.table:
+        # Пустой стол: атакующий выкладывает младшую карту (козыри — последними)
+        hand = game._get_player_hand(attacker)
+        if not hand:
+            return None
+        index = min(range(len(hand)), key=lambda i: (hand[i]['suit'] == game.trump_suit, game.card_value(hand[i]['rank'])))
+        return 'play_card', lambda: game.attack(attacker, index)
+    if any(not pair.get('defense_card') for pair in game.table):
+        return 'take', lambda: game.take_cards_action(defender)
+    return 'pass_bito', lambda: game.pass_or_bito_action(attacker)
+
+
+def perform_turn_timeout(room_id, expected_version: int, game: typing.Optional[DurakGame] = None) -> tuple[dict, int]:
+    """
+    Выполняет действие по умолчанию, если партия все еще в версии
+    expected_version (см. game.timers). Иначе ход уже сделан — ничего не делает.
+    """
+    with log_context(room_id=room_id, move_id=new_id()):
+        return _perform_turn_timeout(room_id, expected_version, game)
+
+
+def _perform_turn_timeout(room_id, expected_version: int, game: typing.Optional[DurakGame] = None) -> tuple[dict, int]:
+    phases = metrics.PhaseTimer(metrics.PHASE_SECONDS, 'timeout')
+    try:
+        with transaction.atomic():
+            if game is None:
+                game = load_room_game(room_id)
+                if game is None:
+                    return _error('Комната не найдена.', 404)
+            phases.mark('load')
+
+            model = game.game_model_instance
+            if not model or game.room.status != GameRoom.STATUS_PLAYING or not game.players:
+                return {'success': False, 'skipped': True}, 200
+            if model.version < expected_version:
+                # Партия в памяти отстала от БД — пусть вызывающий перечитает ее
+                raise StaleGameStateError(f"Game in room {room_id} is behind version {expected_version}")
+            timeout_move = _timeout_move(game) if model.version == expected_version else None
+            if timeout_move is None:
+                return {'success': False, 'skipped': True}, 200
+
+            action_type, move = timeout_move
+            payload = {'success': False, 'action_type': action_type}
+            payload.update(_jsonable_result(move()))
+            if payload.get('success'):
+                payload['action_type'] = action_type
+                message = {
+                    'action': 'state_changed',
+                    'room_id': game.room.id,
+                    'action_type': action_type,
+                    'timed_out': True,
+                    'is_game_over': bool(payload.get('game_over')),
+                }
+                transaction.on_commit(lambda: broadcast_room_events(_state_events(game, message)))
+        phases.mark('apply')
+        return payload, 200
+
+    except StaleGameStateError:
+        logger.info("Turn timeout in room %s raced with a move, skipped.", room_id)
+        return _error('Состояние игры изменилось.', 409)
+    except Exception as e:
+        logger.error("Ошибка при обработке таймаута хода в комнате %s: %s", room_id, e, exc_info=True)
+        return _error('Внутренняя ошибка сервера при обработке таймаута хода.', 500)
+
@@ -0,0 +1,394 @@
+"""
+Шардирование комнат по воркерам (ROOM_SHARDING=1).
+
+Каждый процесс daphne регистрируется в таблице ShardWorker и периодически
+обновляет heartbeat. По списку живых воркеров строится кольцо
+консистентного хеширования; владелец комнаты — воркер, на которого
+указывает hash(room_id). Ходы и запросы статуса, пришедшие на другой
+воркер, пересылаются владельцу через channel layer (запрос/ответ), так что
+горячее состояние партии (DurakGame) живет в памяти одного процесса и не
+перечитывается из БД на каждый ход.
+
+При входе или уходе воркера кольцо перестраивается на следующем heartbeat,
+и воркер выбрасывает из памяти комнаты, которые ему больше не принадлежат
+(новый владелец загрузит их из БД). Запись в БД остается сквозной и
+защищена версией Game.version, поэтому кратковременное расхождение колец
+у двух воркеров приводит лишь к 409 и перезагрузке, а не к потере хода.
+
+Для нескольких процессов нужен общий channel layer (CHANNEL_LAYER_BACKEND=redis).
+"""
+import asyncio
+import bisect
+import collections
+import hashlib
+import logging
+import os
+import socket
+import threading
+import typing
+import uuid
+import weakref
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from . import loop_lag, services, snapshots, timers
+from .models import ShardWorker
+
+logger = logging.getLogger(__name__)
+
+WORKERS_GROUP = 'shard_workers'
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'ROOM_SHARDING', False)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Кольцо консистентного хеширования с виртуальными узлами."""
+
+    def __init__(self, nodes=(), vnodes: int = 64):
+        self.vnodes = vnodes
+        self.nodes = frozenset(nodes)
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    def owner(self, key) -> typing.Optional[str]:
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._nodes[idx]
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class LiveRooms:
+    """
+    LRU горячих партий (DurakGame), принадлежащих этому воркеру.
+    Используется и из event loop, и из потока database_sync_to_async.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._games: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, room_id):
+        with self._lock:
+            game = self._games.get(room_id)
+            if game is not None:
+                self._games.move_to_end(room_id)
+            return game
+
+    def put(self, room_id, game):
+        with self._lock:
+            self._games[room_id] = game
+            self._games.move_to_end(room_id)
+            while len(self._games) > self.max_size:
+                self._games.popitem(last=False)
+
+    def evict(self, room_id):
+        with self._lock:
+            self._games.pop(room_id, None)
+
+    def room_ids(self):
+        with self._lock:
+            return list(self._games)
+
+    def items(self):
+        with self._lock:
+            return list(self._games.items())
+
+    def __len__(self):
+        return len(self._games)
+
+
+class ShardRouter:
+    """Состояние шардирования одного процесса: кольцо, канал, горячие партии."""
+
+    def __init__(self):
+        self.worker_id = _setting('SHARD_WORKER_ID', '') or f'{socket.gethostname()}-{os.getpid()}'
+        self.channel_name: typing.Optional[str] = None
+        self.ring = HashRing()
+        self.channels: dict[str, str] = {}
+        self.live_rooms = LiveRooms(_setting('SHARD_LIVE_ROOMS_MAX', 5000))
+        self._pending: dict[str, asyncio.Future] = {}
+        # Блокировка живет, пока ее держит или ждет хотя бы один запрос
+        self._room_locks: 'weakref.WeakValueDictionary[int, asyncio.Lock]' = weakref.WeakValueDictionary()
+        self._start_lock: typing.Optional[asyncio.Lock] = None
+        self._started = False
+        self._tasks: list[asyncio.Task] = []
+
+    # --- Членство в кольце ---
+
+    async def ensure_started(self):
+        if self._started:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            layer = get_channel_layer()
+            self.channel_name = await layer.new_channel(prefix='shard.')
+            await self._heartbeat_once()
+            await self._restore_snapshots()
+            self._tasks = [
+                asyncio.create_task(self._listen()),
+                asyncio.create_task(self._heartbeat_loop()),
+            ]
+            self._started = True
+            logger.info("Shard worker %s started on channel %s, ring size %s", self.worker_id, self.channel_name, len(self.ring))
+
+    @database_sync_to_async
+    def _register_and_list_workers(self):
+        now = timezone.now()
+        ShardWorker.objects.update_or_create(
+            worker_id=self.worker_id,
+            defaults={'channel_name': self.channel_name, 'heartbeat_at': now},
+        )
+        alive_after = now - timezone.timedelta(seconds=_setting('SHARD_WORKER_TTL', 15))
+        return dict(ShardWorker.objects.filter(heartbeat_at__gte=alive_after).values_list('worker_id', 'channel_name'))
+
+    @database_sync_to_async
+    def _prune_workers(self):
+        """Удаляет строки воркеров, переставших слать heartbeat."""
+        alive_after = timezone.now() - timezone.timedelta(seconds=_setting('SHARD_WORKER_TTL', 15))
+        return ShardWorker.objects.filter(heartbeat_at__lt=alive_after).delete()[0]
+
+    async def _heartbeat_once(self):
+        # Членство в группе истекает у channel layer (group_expiry в redis),
+        # поэтому подтверждаем его вместе с heartbeat
+        await get_channel_layer().group_add(WORKERS_GROUP, self.channel_name)
+        workers = await self._register_and_list_workers()
+        if set(workers) != self.ring.nodes:
+            self._rebalance(workers)
+            await self._prune_workers()
+        self.channels = workers
+
+    def _rebalance(self, workers: dict):
+        previous = self.ring.nodes
+        self.ring = HashRing(workers, vnodes=_setting('SHARD_VNODES', 64))
+        dropped = [room_id for room_id in self.live_rooms.room_ids() if not self.owns(room_id)]
+        for room_id in dropped:
+            self.live_rooms.evict(room_id)
+        logger.info("Shard ring changed: %s -> %s; released %s rooms", sorted(previous), sorted(workers), len(dropped))
+
+    async def _restore_snapshots(self):
+        """Поднимает в память свои комнаты из локального журнала до приема трафика."""
+        if not snapshots.is_enabled():
+            if snapshots.is_configured():
+                logger.warning("SNAPSHOT_DIR is set but SHARD_WORKER_ID is empty; snapshot log disabled")
+            return
+        games = await database_sync_to_async(snapshots.recover)()
+        owned = [room_id for room_id in games if self.owns(room_id)]
+        for room_id in owned:
+            self.live_rooms.put(room_id, games[room_id])
+        logger.info("Shard worker %s warmed %s rooms from snapshot log", self.worker_id, len(owned))
+
+    async def _heartbeat_loop(self):
+        interval = _setting('SHARD_HEARTBEAT_SECONDS', 5)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._heartbeat_once()
+            except Exception as e:
+                logger.error("Shard heartbeat failed for %s: %s", self.worker_id, e, exc_info=True)
+
+    def owner_of(self, room_id) -> typing.Optional[str]:
+        return self.ring.owner(room_id)
+
+    def owns(self, room_id) -> bool:
+        owner = self.owner_of(room_id)
+        return owner is None or owner == self.worker_id
+
+    # --- Обработка запросов ---
+
+    async def dispatch(self, kind: str, room_id: int, user, data: dict) -> tuple[dict, int]:
+        await self.ensure_started()
+        owner = self.owner_of(room_id)
+        user_id = user.id if user is not None else None
+        if owner is None or owner == self.worker_id or owner not in self.channels:
+            return await self.handle_local(kind, room_id, user_id, data)
+        return await self._forward(self.channels[owner], kind, room_id, user_id, data)
+
+    async def _forward(self, owner_channel, kind, room_id, user_id, data):
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await get_channel_layer().send(owner_channel, {
+                'type': 'shard.request',
+                'request_id': request_id,
+                'reply_to': self.channel_name,
+                'kind': kind,
+                'room_id': room_id,
+                'user_id': user_id,
+                'data': data,
+            })
+            reply = await asyncio.wait_for(future, _setting('SHARD_FORWARD_TIMEOUT', 5))
+            return reply['payload'], reply['status']
+        except asyncio.TimeoutError:
+            logger.warning("Shard owner %s did not answer %s for room %s", owner_channel, kind, room_id)
+            return {'success': False, 'error': 'Сервер комнаты временно недоступен, повторите запрос.'}, 503
+        finally:
+            self._pending.pop(request_id, None)
+
+    def _room_lock(self, room_id) -> asyncio.Lock:
+        lock = self._room_locks.get(room_id)
+        if lock is None:
+            lock = self._room_locks[room_id] = asyncio.Lock()
+        return lock
+
+    async def handle_local(self, kind, room_id, user_id, data):
+        # Ходы в одной комнате выполняются строго по очереди
+        async with self._room_lock(room_id):
+            return await database_sync_to_async(self._handle_sync)(kind, room_id, user_id, data)
+
+    def _handle_sync(self, kind, room_id, user_id, data, retry=True):
+        from players.models import Player
+
+        game = self.live_rooms.get(room_id)
+        if game is None:
+            game = services.load_room_game(room_id)
+            if game is None:
+                return {'success': False, 'error': 'Комната не найдена.'}, 404
+
+        user = next((p for p in game.players if p.id == user_id), None) or Player(id=user_id)
+        if kind == 'move':
+            payload, status = services.perform_move(room_id, user, data, game=game)
+        elif kind == 'timeout':
+            payload, status = services.perform_turn_timeout(room_id, data['version'], game=game)
+        else:
+            payload, status = services.game_status(room_id, user, game=game)
+
+        if status in (409, 500):
+            # Память могла разойтись с БД — перечитываем партию. Повторяем только
+            # то, что безопасно выполнить дважды: статус и таймаут (он защищен
+            # expected_version). Ход отдаем клиенту с ошибкой — он пришлет его заново.
+            self.live_rooms.evict(room_id)
+            if retry and status == 409 and kind in ('status', 'timeout'):
+                return self._handle_sync(kind, room_id, user_id, data, retry=False)
+        elif game.game_model_instance and game.game_model_instance.status == game.room.STATUS_PLAYING:
+            self.live_rooms.put(room_id, game)
+        else:
+            self.live_rooms.evict(room_id)
+        return payload, status
+
+    async def _listen(self):
+        layer = get_channel_layer()
+        while True:
+            try:
+                message = await layer.receive(self.channel_name)
+            except Exception as e:
+                logger.error("Shard listener receive failed: %s", e, exc_info=True)
+                await asyncio.sleep(1)
+                continue
+
+            msg_type = message.get('type')
+            if msg_type == 'shard.request':
+                asyncio.create_task(self._answer(message))
+            elif msg_type == 'shard.reply':
+                future = self._pending.get(message['request_id'])
+                if future and not future.done():
+                    future.set_result(message)
+            elif msg_type == 'shard.invalidate':
+                self.live_rooms.evict(message['room_id'])
+
+    async def _answer(self, message):
+        try:
+            payload, status = await self.handle_local(message['kind'], message['room_id'], message['user_id'], message['data'])
+        except Exception as e:
+            logger.error("Shard request %s for room %s failed: %s", message.get('kind'), message.get('room_id'), e, exc_info=True)
+            payload, status = {'success': False, 'error': 'Внутренняя ошибка сервера.'}, 500
+        await get_channel_layer().send(message['reply_to'], {
+            'type': 'shard.reply',
+            'request_id': message['request_id'],
+            'payload': payload,
+            'status': status,
+        })
+
+
+router = ShardRouter()
+
+
+async def dispatch(kind: str, room_id, user, data: typing.Optional[dict] = None) -> tuple[dict, int]:
+    """
+    Выполняет ход ('move'), запрос статуса ('status') или таймаут хода
+    ('timeout', user=None, data={'version': ...}) у владельца комнаты.
+    Повторы хода тоже идут сюда, поэтому с шардированием попадают на того же
+    владельца и находят сохраненный результат (game.idempotency).
+    """
+    if not str(room_id).isdigit():
+        return {'success': False, 'error': 'Комната не найдена.'}, 404
+    if not is_enabled():
+        return await database_sync_to_async(_handle_unsharded)(kind, room_id, user, data)
+    return await router.dispatch(kind, int(room_id), user, data or {})
+
+
+def _handle_unsharded(kind, room_id, user, data):
+    if kind == 'move':
+        return services.perform_move(int(room_id), user, data or {})
+    if kind == 'timeout':
+        return services.perform_turn_timeout(int(room_id), data['version'])
+    return services.game_status(int(room_id), user)
+
+
+def dispatch_sync(kind: str, room_id, user, data: typing.Optional[dict] = None) -> tuple[dict, int]:
+    """Синхронный вариант dispatch для представлений."""
+    if not str(room_id).isdigit():
+        return {'success': False, 'error': 'Комната не найдена.'}, 404
+    if not is_enabled():
+        return _handle_unsharded(kind, room_id, user, data)
+    return async_to_sync(dispatch)(kind, room_id, user, data)
+
+
+def invalidate_room(room_id) -> None:
+    """Сообщает всем воркерам, что состояние комнаты изменено в обход владельца."""
+    if not is_enabled():
+        return
+    try:
+        async_to_sync(get_channel_layer().group_send)(WORKERS_GROUP, {'type': 'shard.invalidate', 'room_id': int(room_id)})
+    except Exception as e:
+        logger.warning("Failed to invalidate room %s on shard workers: %s", room_id, e)
+
+
+class ShardingMiddleware:
+    """
+    ASGI-обертка: до обработки первого запроса регистрирует воркер в кольце,
+    восстанавливает партии из журнала снимков (SNAPSHOT_DIR), запускает
+    таймеры ходов (game.timers) и монитор задержки цикла (game.loop_lag).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._started = False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] in ('http', 'websocket'):
+            if is_enabled():
+                await router.ensure_started()
+            if not self._started:
+                self._started = True
+                await self._startup()
+        return await self.app(scope, receive, send)
+
+    async def _startup(self):
+        loop_lag.monitor.start()
+        if is_enabled():
+            await timers.turn_timers.start(owns=router.owns)
+            return
+        await timers.turn_timers.start()
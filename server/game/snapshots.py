@@ -0,0 +1,269 @@
+"""
+Локальный журнал снимков живых партий (SNAPSHOT_DIR).
+
+Каждое зафиксированное сохранение партии (DurakGame.save_game_state)
+дописывается в append-only файл воркера, отображенный в память (mmap).
+Запись: заголовок <magic, длина, crc32> + JSON {room_id, version, live}.
+Завершенные партии записываются "надгробием" (live = false).
+
+Сжатие: когда сегмент заполнен или накопилось SNAPSHOT_COMPACT_EVERY
+записей, последние снимки всех живых комнат переписываются в новый файл,
+который атомарно (os.replace) заменяет старый.
+
+При старте воркер читает журнал, массово (несколькими запросами)
+загружает перечисленные комнаты и собирает из них горячие партии
+до приема трафика (см. game.sharding.ShardRouter.ensure_started).
+
+Журнал — подсказка для теплого старта, а не источник истины: запись
+делается после коммита, поэтому она никогда не новее БД, и партии всегда
+собираются из строк Game. Поэтому состояние партии в журнал не пишется —
+только номер комнаты и версия: из журнала берется список комнат воркера,
+чтобы загрузить их пачкой, а не по одной на первых ходах.
+
+Журнал ведется только при шардировании (ROOM_SHARDING=1) и постоянном
+SHARD_WORKER_ID: без шардирования горячих партий нет, а без постоянного
+имени воркер после рестарта не найдет свой файл.
+
+Журнал переживает падение процесса: данные в mmap остаются в page cache ОС.
+Для защиты от отключения питания включите SNAPSHOT_FSYNC.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import typing
+import zlib
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<HII')  # magic, длина данных, crc32 данных
+MAGIC = 0xD7A1
+
+
+def is_configured() -> bool:
+    return bool(getattr(settings, 'SNAPSHOT_DIR', None))
+
+
+def is_enabled() -> bool:
+    return (
+        is_configured()
+        and getattr(settings, 'ROOM_SHARDING', False)
+        and bool(getattr(settings, 'SHARD_WORKER_ID', ''))
+    )
+
+
+class SnapshotLog:
+    """Append-only журнал снимков в одном файле-сегменте, отображенном в память."""
+
+    def __init__(self, path, segment_bytes: int = 16 * 1024 * 1024, compact_every: int = 10000, fsync: bool = False):
+        self.path = str(path)
+        self.segment_bytes = segment_bytes
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._latest: dict[int, bytes] = {}
+        self._appends_since_compact = 0
+        self._file = None
+        self._mm: typing.Optional[mmap.mmap] = None
+        self._offset = 0
+        self._open(self.path)
+        self._offset = self._scan()
+
+    def _open(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self._file = open(path, mode)
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.segment_bytes:
+            self._file.truncate(self.segment_bytes)
+            size = self.segment_bytes
+        self._mm = mmap.mmap(self._file.fileno(), size)
+
+    def _close(self):
+        if self._mm is not None:
+            self._mm.close()
+        if self._file is not None:
+            self._file.close()
+        self._mm = self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _scan(self) -> int:
+        """Читает журнал до первой неполной/поврежденной записи. Возвращает позицию конца."""
+        offset = 0
+        size = len(self._mm)
+        while offset + HEADER.size <= size:
+            magic, length, crc = HEADER.unpack_from(self._mm, offset)
+            end = offset + HEADER.size + length
+            if magic != MAGIC or end > size:
+                break
+            data = self._mm[offset + HEADER.size:end]
+            if zlib.crc32(data) != crc:
+                logger.warning(f"Snapshot log {self.path}: corrupt record at offset {offset}, truncating")
+                break
+            try:
+                room_id = json.loads(data)['room_id']
+            except (ValueError, KeyError):
+                break
+            record = self._mm[offset:end]
+            if not json.loads(data).get('live'):
+                self._latest.pop(room_id, None)
+            else:
+                self._latest[room_id] = record
+            offset = end
+        return offset
+
+    @staticmethod
+    def _encode(room_id: int, version: int, live: bool) -> bytes:
+        data = json.dumps({'room_id': room_id, 'version': version, 'live': live}, separators=(',', ':')).encode()
+        return HEADER.pack(MAGIC, len(data), zlib.crc32(data)) + data
+
+    def append(self, room_id: int, version: int, live: bool = True):
+        """Дописывает запись о комнате (live=False — партия завершена, надгробие)."""
+        record = self._encode(room_id, version, live)
+        with self._lock:
+            if self._mm is None:
+                return
+            needs_room = self._offset + len(record) > len(self._mm)
+            if needs_room or self._appends_since_compact >= self.compact_every:
+                self._compact(min_free=len(record))
+            self._mm[self._offset:self._offset + len(record)] = record
+            self._offset += len(record)
+            self._appends_since_compact += 1
+            if live:
+                self._latest[room_id] = record
+            else:
+                self._latest.pop(room_id, None)
+            if self.fsync:
+                self._mm.flush()
+
+    def _compact(self, min_free: int = 0):
+        live = b''.join(self._latest.values())
+        size = self.segment_bytes
+        while len(live) + min_free > size // 2:
+            size *= 2
+        tmp_path = f'{self.path}.compact'
+        with open(tmp_path, 'w+b') as tmp:
+            tmp.truncate(size)
+            tmp.write(live)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._close()
+        os.replace(tmp_path, self.path)
+        self.segment_bytes = size
+        self._open(self.path)
+        self._offset = len(live)
+        self._appends_since_compact = 0
+        logger.info(f"Snapshot log {self.path} compacted: {len(self._latest)} rooms, {len(live)} bytes")
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def latest(self) -> dict[int, int]:
+        """Последние версии живых комнат: {room_id: version}."""
+        with self._lock:
+            records = list(self._latest.items())
+        return {room_id: json.loads(record[HEADER.size:])['version'] for room_id, record in records}
+
+
+_log: typing.Optional[SnapshotLog] = None
+_log_lock = threading.Lock()
+
+
+def get_log() -> typing.Optional[SnapshotLog]:
+    """Журнал этого процесса (имя файла — SHARD_WORKER_ID, постоянный у слота воркера)."""
+    global _log
+    if not is_enabled():
+        return None
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                path = os.path.join(settings.SNAPSHOT_DIR, f'{settings.SHARD_WORKER_ID}.snap')
+                _log = SnapshotLog(
+                    path,
+                    segment_bytes=getattr(settings, 'SNAPSHOT_SEGMENT_BYTES', 16 * 1024 * 1024),
+                    compact_every=getattr(settings, 'SNAPSHOT_COMPACT_EVERY', 10000),
+                    fsync=getattr(settings, 'SNAPSHOT_FSYNC', False),
+                )
+    return _log
+
+
+def record_game(game) -> None:
+    """Записывает комнату и версию партии после коммита ее сохранения."""
+    log = get_log()
+    if log is None or not game.game_model_instance:
+        return
+    from .models import GameRoom
+    room_id = game.room.id
+    version = game.game_model_instance.version
+    live = game.game_model_instance.status == GameRoom.STATUS_PLAYING
+    try:
+        log.append(room_id, version, live)
+    except Exception as e:
+        # Журнал — ускоритель рестарта, а не источник истины: ход уже в БД
+        logger.error(f"Failed to append snapshot for room {room_id}: {e}", exc_info=True)
+
+
+def restore_games(snapshots: dict[int, int]) -> dict:
+    """
+    Массово собирает партии DurakGame для комнат из журнала.
+
+    Три запроса на всю пачку (комнаты, игроки, строки Game) вместо трех на
+    комнату; состояние берется из БД. Комнаты, которые уже не играются,
+    получают надгробие в журнале.
+    """
+    from django.db.models import Prefetch
+
+    from players.models import Player
+    from .game_logic import DurakGame
+    from .models import Game, GameRoom
+
+    if not snapshots:
+        return {}
+
+    room_ids = list(snapshots)
+    rooms = GameRoom.objects.filter(id__in=room_ids, status=GameRoom.STATUS_PLAYING)\
+                            .select_related('creator', 'winner')\
+                            .prefetch_related(Prefetch('players', queryset=Player.objects.order_by('id')))
+    game_models = {g.room_id: g for g in Game.objects.filter(room_id__in=room_ids)}
+
+    restored = {}
+    for room in rooms:
+        game_model = game_models.get(room.id)
+        if game_model is None:
+            continue
+        restored[room.id] = DurakGame(room, players=list(room.players.all()), game_model=game_model)
+
+    log = get_log()
+    if log is not None:
+        for room_id in set(room_ids) - set(restored):
+            log.append(room_id, 0, live=False)
+    return restored
+
+
+_recovered = False
+
+
+def recover() -> dict:
+    """
+    Однократное восстановление при старте процесса: читает журнал и
+    собирает партии (см. restore_games). Повторные вызовы ничего не делают.
+    """
+    global _recovered
+    log = get_log()
+    if log is None or _recovered:
+        return {}
+    _recovered = True
+    snapshots = log.latest()
+    games = restore_games(snapshots)
+    log.compact()
+    logger.info(f"Snapshot recovery: {len(snapshots)} rooms in log, {len(games)} restored")
+    return games
+
@@ -0,0 +1,143 @@
+"""
+Зрители: публичное состояние партии, сериализованное один раз на версию.
+
+После каждого хода владелец комнаты строит кадр — JSON с состоянием без
+карт в руках (get_game_state без игрока) — и отправляет одну и ту же строку
+в группу spectate_{room_id}. SpectatorConsumer пересылает строку в сокет
+как есть: цена хода не зависит от числа зрителей.
+
+SPECTATOR_DELAY_SECONDS задерживает трансляцию (турниры: зрители не должны
+подсказывать игрокам). Кадры, накопившиеся за задержку, за окно
+loop_lag.coalesce_window() или из-за медленного сокета, склеиваются —
+отправляется только последний: каждый кадр содержит полное состояние.
+
+Последний кадр каждой комнаты кэшируется в процессе (SPECTATOR_FRAME_CACHE
+комнат) для новых зрителей и HTTP-представления.
+"""
+import asyncio
+import collections
+import json
+import threading
+import time
+import typing
+
+from django.conf import settings
+
+from . import metrics
+
+SPECTATOR_FRAMES_ENCODED = metrics.counter(
+    'durak_spectator_frames_encoded',
+    'Spectator state frames serialized (once per room state version).',
+)
+SPECTATOR_FRAMES_COALESCED = metrics.counter(
+    'durak_spectator_frames_coalesced',
+    'Spectator frames skipped in favour of a newer frame.',
+)
+
+_frames: collections.OrderedDict = collections.OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'SPECTATORS_ENABLED', True)
+
+
+def delay_seconds() -> float:
+    return getattr(settings, 'SPECTATOR_DELAY_SECONDS', 0.0)
+
+
+def spectator_group(room_id) -> str:
+    return f'spectate_{room_id}'
+
+
+def _remember(room_id, frame: dict):
+    with _frames_lock:
+        _frames[room_id] = frame
+        _frames.move_to_end(room_id)
+        while len(_frames) > getattr(settings, 'SPECTATOR_FRAME_CACHE', 1000):
+            _frames.popitem(last=False)
+
+
+def frame_for(game, published_at: typing.Optional[float] = None) -> dict:
+    """Кадр текущей версии партии; повторный вызов для той же версии берет кэш."""
+    room_id = game.room.id
+    version = game.game_model_instance.version if game.game_model_instance else 0
+    with _frames_lock:
+        cached = _frames.get(room_id)
+    if cached is not None and cached['version'] == version:
+        return cached
+
+    text = json.dumps({
+        'action': 'spectator_state',
+        'room_id': room_id,
+        'version': version,
+        'game_state': game.get_game_state(for_player_user_obj=None),
+    })
+    SPECTATOR_FRAMES_ENCODED.inc()
+    frame = {'type': 'spectator_frame', 'room_id': room_id, 'version': version, 'text': text,
+             'published_at': published_at if published_at is not None else time.time()}
+    _remember(room_id, frame)
+    return frame
+
+
+def spectator_event(game) -> tuple[str, dict]:
+    """(группа, событие) для broadcast_room_events рядом с state_changed."""
+    return spectator_group(game.room.id), frame_for(game)
+
+
+def current_frame(room_id) -> typing.Optional[dict]:
+    """Последний кадр комнаты: из кэша или построенный по состоянию в БД."""
+    with _frames_lock:
+        cached = _frames.get(int(room_id))
+    if cached is not None:
+        return cached
+
+    from .services import load_room_game
+    game = load_room_game(room_id)
+    if game is None:
+        return None
+    model = game.game_model_instance
+    return frame_for(game, published_at=model.updated_at.timestamp() if model else None)
+
+
+class FrameSender:
+    """
+    Очередь кадров одного зрителя: задержка трансляции, склейка и порядок
+    версий. send — корутина отправки текста в сокет.
+    """
+
+    def __init__(self, send: typing.Callable[[str], typing.Awaitable]):
+        self._send = send
+        self._pending: collections.deque = collections.deque(maxlen=getattr(settings, 'SPECTATOR_MAX_PENDING', 1000))
+        self._task: typing.Optional[asyncio.Task] = None
+        self.last_version = -1
+
+    def push(self, frame: dict):
+        if frame['version'] <= self.last_version:
+            return
+        self._pending.append(frame)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        from . import loop_lag
+        while self._pending:
+            delay = delay_seconds()
+            wait = self._pending[0]['published_at'] + delay - time.time()
+            window = loop_lag.coalesce_window()
+            if wait > 0 or window:
+                await asyncio.sleep(max(wait, window))
+
+            frame = self._pending.popleft()
+            # Все уже "созревшие" кадры заменяются последним из них
+            while self._pending and self._pending[0]['published_at'] + delay <= time.time():
+                frame = self._pending.popleft()
+                SPECTATOR_FRAMES_COALESCED.inc()
+            if frame['version'] > self.last_version:
+                self.last_version = frame['version']
+                await self._send(frame['text'])
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
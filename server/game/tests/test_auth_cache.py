@@ -0,0 +1,161 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import game.routing
+from server import auth_cache
+from server.auth_cache import SessionUserCache
+
+from .utils import PASSWORD, fast_passwords, make_player, make_room
+
+
+def _session_queries(queries):
+    return [q['sql'] for q in queries if 'django_session' in q['sql']]
+
+
+@fast_passwords
+class HttpAuthCacheTests(TestCase):
+    def setUp(self):
+        auth_cache.sessions.clear()
+        self.addCleanup(auth_cache.sessions.clear)
+        self.user = make_player('cache-alice')
+        self.client.login(username='cache-alice', password=PASSWORD)
+        self.session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def _get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('game:leaderboard_me'))
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def test_hit_skips_session_and_user_queries(self):
+        miss = self._get()
+        self.assertTrue(_session_queries(miss))
+        self.assertIsNotNone(auth_cache.sessions.get(self.session_key))
+
+        hit = self._get()
+        self.assertEqual(_session_queries(hit), [])
+        self.assertEqual(len(hit), len(miss) - 2)
+
+    def test_cached_user_loads_other_fields_lazily(self):
+        self._get()
+        user = auth_cache.resolve(self.session_key, mock.Mock(side_effect=AssertionError('cache miss')), 'http')
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, 'cache-alice', True))
+        # Все отложенные поля читаются одним запросом при первом обращении
+        with self.assertNumQueries(1):
+            self.assertEqual(user.cash, self.user.cash)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.current_room_id, user.rating), (None, self.user.rating))
+
+    def test_lobby_on_cache_hit(self):
+        make_room(make_player('cache-carol'))
+        self.client.get(reverse('game:lobby'))
+        self.assertIsNotNone(auth_cache.sessions.get(self.session_key))
+
+        # Комнаты лобби и один запрос отложенных полей пользователя (баланс)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('game:lobby'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user_balance'], self.user.cash)
+
+    async def test_auser_uses_the_cache(self):
+        await sync_to_async(self._get)()
+        request = RequestFactory().get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = self.session_key
+        auth_cache.CachedAuthenticationMiddleware(lambda r: None).process_request(request)
+
+        with mock.patch.object(auth_cache, 'django_get_user', side_effect=AssertionError('cache miss')):
+            user = await request.auser()
+            self.assertIs(await request.auser(), user)
+        self.assertEqual((user.pk, user.username), (self.user.pk, 'cache-alice'))
+
+    def test_logout_invalidates_the_session(self):
+        self._get()
+        self.client.logout()
+        self.assertIsNone(auth_cache.sessions.get(self.session_key))
+
+    def test_password_change_invalidates_the_user(self):
+        self._get()
+        self.user.set_password('new-pass-1234')
+        self.user.save()
+        self.assertIsNone(auth_cache.sessions.get(self.session_key))
+
+    def test_saving_uncached_fields_keeps_the_entry(self):
+        self._get()
+        self.user.cash += 10
+        self.user.save(update_fields=['cash'])
+        self.assertIsNotNone(auth_cache.sessions.get(self.session_key))
+
+    def test_deleting_the_user_invalidates_it(self):
+        self._get()
+        self.user.delete()
+        self.assertIsNone(auth_cache.sessions.get(self.session_key))
+
+    @override_settings(AUTH_CACHE_TTL=0)
+    def test_disabled_cache(self):
+        self._get()
+        self.assertIsNone(auth_cache.sessions.get(self.session_key))
+
+
+class SessionUserCacheTests(SimpleTestCase):
+    def _user(self, pk):
+        return mock.Mock(pk=pk, id=pk, username=f'u{pk}', is_active=True, is_staff=False, is_superuser=False)
+
+    def test_entries_expire(self):
+        cache = SessionUserCache()
+        with mock.patch.object(auth_cache.time, 'monotonic', return_value=100.0):
+            cache.put('s1', self._user(1))
+        with mock.patch.object(auth_cache.time, 'monotonic', return_value=100.0 + settings.AUTH_CACHE_TTL + 1):
+            self.assertIsNone(cache.get('s1'))
+
+    def test_least_recently_used_session_is_evicted(self):
+        cache = SessionUserCache(max_entries=2)
+        cache.put('s1', self._user(1))
+        cache.put('s2', self._user(2))
+        cache.get('s1')
+        cache.put('s3', self._user(3))
+        self.assertIsNone(cache.get('s2'))
+        self.assertEqual(cache.get('s1')['username'], 'u1')
+
+    def test_invalidate_user_drops_all_their_sessions(self):
+        cache = SessionUserCache()
+        cache.put('s1', self._user(1))
+        cache.put('s2', self._user(1))
+        cache.put('s3', self._user(2))
+        cache.invalidate_user(1)
+        self.assertEqual([cache.get(key) is None for key in ('s1', 's2', 's3')], [True, True, False])
+
+
+@fast_passwords
+class WebsocketAuthCacheTests(TransactionTestCase):
+    def setUp(self):
+        auth_cache.sessions.clear()
+        self.addCleanup(auth_cache.sessions.clear)
+        self.user = make_player('cache-bob')
+        self.client.login(username='cache-bob', password=PASSWORD)
+        self.session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.app = auth_cache.CachedAuthMiddlewareStack(URLRouter(game.routing.websocket_urlpatterns))
+
+    async def _ping(self):
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.session_key}'.encode()
+        communicator = WebsocketCommunicator(self.app, '/ws/mux/', headers=[(b'cookie', cookie)])
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({'action': 'ping'})
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'pong'})
+        await communicator.disconnect()
+
+    async def test_second_connection_is_served_from_cache(self):
+        await self._ping()
+        self.assertEqual(auth_cache.sessions.get(self.session_key)['id'], self.user.id)
+
+        with mock.patch.object(auth_cache, 'channels_get_user', side_effect=AssertionError('cache miss')):
+            await self._ping()
@@ -0,0 +1,76 @@
+import asyncio
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import TestCase
+
+from game import broadcast
+from game.broadcast import lobby_event, room_event
+
+
+class BroadcastTests(TestCase):
+    def setUp(self):
+        self.layer = get_channel_layer()
+        async_to_sync(self.layer.flush)()
+
+    def _subscribe(self, group):
+        channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(group, channel)
+        return channel
+
+    def _receive(self, channel):
+        return async_to_sync(self.layer.receive)(channel)
+
+    def test_batch_reaches_every_group(self):
+        room = self._subscribe(broadcast.room_group_name(1))
+        lobby = self._subscribe(broadcast.LOBBY_GROUP)
+
+        sent = broadcast.broadcast_room_events([
+            room_event(1, {'action': 'state_changed'}),
+            lobby_event(1, 'playing'),
+        ])
+
+        self.assertEqual(sent, 2)
+        self.assertEqual(self._receive(room)['message']['action'], 'state_changed')
+        self.assertEqual(self._receive(lobby)['message'], {'action': 'lobby_changed', 'room_id': 1, 'status': 'playing'})
+
+    def test_failed_group_does_not_stop_the_rest(self):
+        lobby = self._subscribe(broadcast.LOBBY_GROUP)
+        original = self.layer.group_send
+
+        async def flaky_group_send(group, event):
+            if group == broadcast.room_group_name(2):
+                raise RuntimeError('redis down')
+            await original(group, event)
+
+        with mock.patch.object(self.layer, 'group_send', flaky_group_send):
+            sent = broadcast.broadcast_room_events([room_event(2, {'action': 'state_changed'}), lobby_event(2, 'playing')])
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(self._receive(lobby)['message']['room_id'], 2)
+
+    def test_empty_batch(self):
+        self.assertEqual(broadcast.broadcast_room_events([]), 0)
+
+    def test_events_of_one_group_keep_their_order(self):
+        # Первая отправка медленнее второй: при параллельной рассылке второе событие
+        # обогнало бы первое, и получатель отбросил бы первое как устаревшее по seq
+        room = self._subscribe(broadcast.room_group_name(3))
+        original = self.layer.group_send
+        delays = iter([0.05, 0])
+
+        async def slow_first_group_send(group, event):
+            await asyncio.sleep(next(delays))
+            await original(group, event)
+
+        with mock.patch.object(self.layer, 'group_send', slow_first_group_send):
+            sent = broadcast.broadcast_room_events([
+                room_event(3, {'action': 'state_changed', 'n': 1}),
+                room_event(3, {'action': 'state_changed', 'n': 2}),
+            ])
+
+        self.assertEqual(sent, 2)
+        first, second = self._receive(room)['message'], self._receive(room)['message']
+        self.assertEqual((first['n'], second['n']), (1, 2))
+        self.assertEqual(second['seq'], first['seq'] + 1)
@@ -0,0 +1,53 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase
+
+from server import settings as project_settings
+
+
+class SqliteProfileTests(SimpleTestCase):
+    def _connect(self, config):
+        wrapper = DatabaseWrapper({**config, 'TIME_ZONE': None, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False}, alias='profile_test')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def _pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connection_uses_wal_and_busy_timeout(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with mock.patch.dict(os.environ, {'SQLITE_BUSY_TIMEOUT_MS': '1234'}):
+            config = project_settings._sqlite_database(os.path.join(directory.name, 'profile.sqlite3'))
+
+        wrapper = self._connect(config)
+        self.assertEqual(self._pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self._pragma(wrapper, 'busy_timeout'), 1234)
+        self.assertEqual(self._pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self._pragma(wrapper, 'foreign_keys'), 1)
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+
+class PostgresProfileTests(SimpleTestCase):
+    def _config(self, pool):
+        with mock.patch.dict(os.environ, {'POSTGRES_POOL': pool, 'DB_CONN_MAX_AGE': '60'}):
+            return project_settings._postgres_database()
+
+    def test_persistent_connections_by_default(self):
+        config = self._config('none')
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertNotIn('pool', config['OPTIONS'])
+
+    def test_psycopg_pool_disables_persistent_connections(self):
+        config = self._config('psycopg')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(set(config['OPTIONS']['pool']), {'min_size', 'max_size', 'timeout'})
+
+    def test_pgbouncer_disables_server_side_cursors(self):
+        self.assertTrue(self._config('pgbouncer')['DISABLE_SERVER_SIDE_CURSORS'])
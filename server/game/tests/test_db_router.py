@@ -0,0 +1,81 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from server import db_router
+
+from .utils import PASSWORD, fast_passwords, make_player
+
+REPLICA = 'replica_test'
+
+
+@fast_passwords
+@override_settings(DATABASE_REPLICAS=[REPLICA], DATABASE_REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Вторая база — SQLite-зеркало тестовой 'default' (как реплики из settings в
+    тестах). Алиас добавляется после создания тестовых баз, поэтому и в
+    databases класса попадает только здесь.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[REPLICA] = {**connections.databases['default'], 'TEST': {'MIRROR': 'default'}}
+        cls.databases = {'default', REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = make_player('replica-alice')
+        self.client.login(username='replica-alice', password=PASSWORD)
+
+    def _leaderboard_queries(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(reverse('game:leaderboard'))
+        self.assertEqual(response.status_code, 200)
+
+        def leaderboard(queries):
+            return [q['sql'] for q in queries if 'game_leaderboardentry' in q['sql']]
+        return leaderboard(primary.captured_queries), leaderboard(replica.captured_queries)
+
+    def test_reads_go_to_the_replica(self):
+        primary, replica = self._leaderboard_queries()
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+
+    def test_write_pins_the_user_to_the_primary(self):
+        response = self.client.post(reverse('game:create_room'), {'name': 'pin', 'max_players': 2, 'bet_amount': 10})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(db_router.is_pinned_to_primary(self.user))
+
+        primary, replica = self._leaderboard_queries()
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+
+    def test_pin_expires(self):
+        db_router.pin_to_primary(self.user)
+        self.assertTrue(db_router.is_pinned_to_primary(self.user))
+        # LocMemCache сверяет срок с time.time()
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 6):
+            self.assertFalse(db_router.is_pinned_to_primary(self.user))
+            primary, replica = self._leaderboard_queries()
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+
+    def test_other_users_are_not_pinned(self):
+        db_router.pin_to_primary(make_player('replica-bob'))
+        self.assertFalse(db_router.is_pinned_to_primary(self.user))
@@ -0,0 +1,119 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+import game.routing
+from game import idempotency, sharding
+from game.game_logic import DurakGame
+from game.idempotency import MoveResultCache
+from game.models import Game
+
+from .utils import fast_passwords, make_player, start_room
+
+
+class ActionIdTests(SimpleTestCase):
+    def test_valid_ids(self):
+        self.assertIsNone(idempotency.action_id({}))
+        self.assertEqual(idempotency.action_id({'action_id': 'abc'}), 'abc')
+        self.assertEqual(idempotency.action_id({'action_id': 17}), '17')
+
+    def test_invalid_ids(self):
+        for value in ('', 'x' * (idempotency.ACTION_ID_MAX_LENGTH + 1), True, ['a'], 1.5):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                idempotency.action_id({'action_id': value})
+
+
+class MoveResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_results_are_keyed_by_room_user_and_action(self):
+        results = MoveResultCache()
+        results.put(1, 5, 'a b', {'n': 1})
+        self.assertEqual(results.get(1, 5, 'a b'), {'n': 1})
+        self.assertIsNone(results.get(1, 6, 'a b'))
+        self.assertIsNone(results.get(2, 5, 'a b'))
+        self.assertIsNone(results.get(1, 5, 'a'))
+
+    def test_results_are_shared_through_the_django_cache(self):
+        # Другой процесс — другой экземпляр, но тот же кэш
+        MoveResultCache().put(1, 5, 'a', {'n': 1})
+        self.assertEqual(MoveResultCache().get(1, 5, 'a'), {'n': 1})
+
+    def test_results_expire(self):
+        results = MoveResultCache(ttl=600)
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=1000.0):
+            results.put(1, 5, 'a', {'n': 1})
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=1601.0):
+            self.assertIsNone(results.get(1, 5, 'a'))
+
+
+@fast_passwords
+class DuplicateMoveTests(TestCase):
+    def setUp(self):
+        self.alice = make_player('dup-alice')
+        self.bob = make_player('dup-bob')
+        self.room = start_room(self.alice, self.bob)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _attack(self, action_id):
+        game = DurakGame(self.room)
+        attacker = game.players[game.attacker_index]
+        card = game._get_player_hand(attacker)[0]
+        return attacker, {'action_type': 'attack', 'card_ids': [game.card_id_of(card)], 'action_id': action_id}
+
+    def _move(self, user, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return sharding.dispatch_sync('move', self.room.id, user, data)
+
+    def test_duplicate_action_id_is_applied_once(self):
+        attacker, data = self._attack('move-1')
+        version = Game.objects.get(room=self.room).version
+
+        first, first_status = self._move(attacker, data)
+        second, second_status = self._move(attacker, data)
+
+        self.assertEqual((first_status, second_status), (200, 200))
+        self.assertTrue(first['success'])
+        self.assertNotIn('duplicate', first)
+        self.assertTrue(second['duplicate'])
+        self.assertEqual({key: value for key, value in second.items() if key != 'duplicate'}, first)
+        self.assertEqual(Game.objects.get(room=self.room).version, version + 1)
+        self.assertEqual(len(DurakGame(self.room).table), 1)
+
+    def test_same_action_id_of_another_player_is_not_a_duplicate(self):
+        attacker, data = self._attack('move-1')
+        self._move(attacker, data)
+        other = self.bob if attacker.id == self.alice.id else self.alice
+
+        payload, _status = self._move(other, {'action_type': 'pass_bito', 'action_id': 'move-1'})
+        self.assertNotIn('duplicate', payload)
+
+    def test_invalid_action_id(self):
+        attacker, data = self._attack('')
+        payload, status = self._move(attacker, data)
+        self.assertEqual(status, 400)
+        self.assertFalse(payload['success'])
+
+    def test_non_numeric_room_id(self):
+        self.assertEqual(sharding.dispatch_sync('move', 'lobby', self.alice, {})[1], 404)
+
+
+@fast_passwords
+class NonNumericRoomConsumerTests(TransactionTestCase):
+    async def test_move_to_non_numeric_room(self):
+        communicator = WebsocketCommunicator(URLRouter(game.routing.websocket_urlpatterns), '/ws/game/lobby/')
+        communicator.scope['user'] = await sync_to_async(make_player)('dup-carol')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({'action': 'move', 'action_type': 'take', 'action_id': 'a'})
+        response = await communicator.receive_json_from()
+        self.assertEqual((response['action'], response['status']), ('move_result', 404))
+        await communicator.disconnect()
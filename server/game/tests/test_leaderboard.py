@@ -0,0 +1,72 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from game import leaderboard
+from game.models import LeaderboardEntry
+
+from .utils import PASSWORD, fast_passwords, make_player, make_room
+
+
+@fast_passwords
+class RecordGameResultsTests(TestCase):
+    def test_end_game_creates_then_updates_entries(self):
+        a, b = make_player('a'), make_player('b')
+        make_room(a, b).end_game(winner=a, loser=b)
+        make_room(a, b).end_game(winner=b, loser=a)
+
+        entries = {e.player_id: e for e in LeaderboardEntry.objects.all()}
+        self.assertEqual(set(entries), {a.id, b.id})
+        for player in (a, b):
+            player.refresh_from_db()
+            entry = entries[player.id]
+            self.assertEqual((entry.games_played, entry.games_won), (2, 1))
+            self.assertEqual(entry.score, leaderboard.compute_score(player))
+            self.assertAlmostEqual(entry.win_rate, 50.0)
+
+
+@fast_passwords
+class RankTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Равные score: порядок по games_played, затем по id игрока
+        rows = [(1600, 5), (1600, 5), (1600, 9), (1500, 1), (1700, 0), (1500, 1)]
+        cls.players = []
+        for i, (score, played) in enumerate(rows):
+            player = make_player(f'p{i}')
+            LeaderboardEntry.objects.create(player=player, score=score, games_played=played)
+            cls.players.append(player)
+
+    def test_rank_matches_full_ordering(self):
+        ordered = list(LeaderboardEntry.objects.order_by(*leaderboard.LEADERBOARD_ORDERING))
+        self.assertEqual([leaderboard.rank_of(entry) for entry in ordered], list(range(1, len(ordered) + 1)))
+
+    @skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+    def test_rank_count_uses_the_index(self):
+        plan = leaderboard.rank_queryset(LeaderboardEntry.objects.get(player=self.players[3])).explain()
+        self.assertIn('leaderboard_rank_idx', plan)
+        self.assertNotIn('SCAN game_leaderboardentry', plan)
+
+    def test_pages_continue_ranks(self):
+        self.client.login(username='p0', password=PASSWORD)
+        rows, cursor = [], None
+        while True:
+            params = {'limit': 4, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(reverse('game:leaderboard'), params).json()
+            rows += data['entries']
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        expected = LeaderboardEntry.objects.order_by(*leaderboard.LEADERBOARD_ORDERING).values_list('player_id', flat=True)
+        self.assertEqual([row['player_id'] for row in rows], list(expected))
+        self.assertEqual([row['rank'] for row in rows], list(range(1, len(rows) + 1)))
+
+    def test_me(self):
+        self.client.login(username='p2', password=PASSWORD)
+        self.assertEqual(self.client.get(reverse('game:leaderboard_me')).json()['entry']['rank'], 2)
+
+        make_player('newbie')
+        self.client.login(username='newbie', password=PASSWORD)
+        self.assertIsNone(self.client.get(reverse('game:leaderboard_me')).json()['entry'])
@@ -0,0 +1,61 @@
+import io
+import json
+import logging
+
+from django.test import SimpleTestCase
+
+from server.logging_utils import AsyncQueueHandler, SamplingFilter, log_context
+
+
+class AsyncQueueHandlerTests(SimpleTestCase):
+    def _logger(self, output):
+        stream = io.StringIO()
+        handler = AsyncQueueHandler(output=output, stream=stream)
+        self.addCleanup(handler.close)
+        logger = logging.getLogger(f'test_logging.{self.id()}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger, handler, stream
+
+    def _lines(self, handler, stream):
+        handler.listener.stop()
+        handler.listener = None
+        return stream.getvalue().splitlines()
+
+    def test_args_are_formatted_at_call_time(self):
+        logger, handler, stream = self._logger('json')
+        state = {'table': ['6-hearts']}
+        with log_context(room_id=7):
+            logger.info('state %s', state)
+        state['table'].append('A-spades')
+
+        record = json.loads(self._lines(handler, stream)[0])
+        self.assertEqual(record['msg'], "state {'table': ['6-hearts']}")
+        self.assertEqual(record['room_id'], 7)
+
+    def test_exception_text_survives_the_queue(self):
+        logger, handler, stream = self._logger('json')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.exception('failed')
+        record = json.loads(self._lines(handler, stream)[0])
+        self.assertIn('ValueError: boom', record['exc'])
+
+    def test_text_output(self):
+        logger, handler, stream = self._logger('text')
+        logger.warning('hello %d', 5)
+        self.assertTrue(self._lines(handler, stream)[0].endswith(' [None/None] hello 5'))
+
+
+class SamplingFilterTests(SimpleTestCase):
+    def test_longest_prefix_and_warnings_pass(self):
+        sampling = SamplingFilter({'game': 1.0, 'game.game_logic': 0.0})
+        info = logging.makeLogRecord({'name': 'game.game_logic', 'levelno': logging.INFO})
+        warning = logging.makeLogRecord({'name': 'game.game_logic', 'levelno': logging.WARNING})
+        other = logging.makeLogRecord({'name': 'game.views', 'levelno': logging.INFO})
+        self.assertFalse(sampling.filter(info))
+        self.assertTrue(sampling.filter(warning))
+        self.assertTrue(sampling.filter(other))
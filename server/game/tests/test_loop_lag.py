@@ -0,0 +1,109 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from game import loop_lag
+from game.loop_lag import LAG_DECAY, TIER_COALESCE, TIER_NORMAL, TIER_REJECT, TIER_THROTTLE, LoopLagMonitor
+from game.models import GameRoom
+
+from .utils import PASSWORD, fast_passwords, make_player, make_room
+
+
+@override_settings(
+    LOOP_LAG_TIERS={TIER_THROTTLE: 0.05, TIER_COALESCE: 0.2, TIER_REJECT: 0.5},
+    LOOP_LAG_RECOVERY_RATIO=0.5,
+)
+class LoopLagMonitorTests(SimpleTestCase):
+    def _settle(self, monitor, lag):
+        """Измерение без задержки, после которого сглаженная задержка равна lag."""
+        monitor.lag = lag / LAG_DECAY
+        monitor.observe(0.0)
+        self.assertAlmostEqual(monitor.lag, lag)
+        return monitor.tier
+
+    def test_tiers_rise_with_lag(self):
+        monitor = LoopLagMonitor()
+        steps = [(0.01, TIER_NORMAL), (0.06, TIER_THROTTLE), (0.25, TIER_COALESCE), (0.6, TIER_REJECT)]
+        for lag, expected in steps:
+            monitor.observe(lag)
+            self.assertEqual(monitor.tier, expected, lag)
+
+    def test_lag_decays_between_measurements(self):
+        monitor = LoopLagMonitor()
+        monitor.observe(0.1)
+        monitor.observe(0.0)
+        self.assertAlmostEqual(monitor.lag, 0.1 * LAG_DECAY)
+
+    def test_tiers_fall_only_below_recovery_ratio(self):
+        monitor = LoopLagMonitor()
+        monitor.observe(0.6)
+        self.assertEqual(monitor.tier, TIER_REJECT)
+        # Ниже порога reject (0.5), но выше 0.5 * 0.5 — ступень держится
+        self.assertEqual(self._settle(monitor, 0.3), TIER_REJECT)
+        self.assertEqual(self._settle(monitor, 0.24), TIER_COALESCE)
+        self.assertEqual(self._settle(monitor, 0.15), TIER_COALESCE)
+        self.assertEqual(self._settle(monitor, 0.09), TIER_THROTTLE)
+        self.assertEqual(self._settle(monitor, 0.03), TIER_THROTTLE)
+        self.assertEqual(self._settle(monitor, 0.02), TIER_NORMAL)
+
+    def test_recovery_ratio_does_not_lower_entry_threshold(self):
+        monitor = LoopLagMonitor()
+        # 0.3 держит reject, но не включает его из normal
+        self.assertEqual(self._settle(monitor, 0.3), TIER_COALESCE)
+
+
+class LoadSheddingTests(SimpleTestCase):
+    def test_shed_from_tier(self):
+        counter = loop_lag.LOAD_SHED_EVENTS.labels('test_join')
+        before = counter.value
+        with mock.patch.object(loop_lag.monitor, 'tier', TIER_COALESCE):
+            self.assertFalse(loop_lag.shed('test_join', TIER_REJECT))
+            self.assertTrue(loop_lag.shed('test_join', TIER_THROTTLE))
+        with mock.patch.object(loop_lag.monitor, 'tier', TIER_REJECT):
+            self.assertTrue(loop_lag.shed('test_join', TIER_REJECT))
+        self.assertEqual(counter.value, before + 2)
+
+    @override_settings(LOAD_SHED_TIMER_GRACE=2.0)
+    def test_timer_grace_is_spread(self):
+        with mock.patch.object(loop_lag.random, 'uniform', return_value=3.0) as uniform:
+            self.assertEqual(loop_lag.timer_grace(), 3.0)
+        uniform.assert_called_once_with(2.0, 4.0)
+        for _ in range(20):
+            self.assertTrue(2.0 <= loop_lag.timer_grace() <= 4.0)
+
+
+@fast_passwords
+@override_settings(LOAD_SHED_RETRY_AFTER=7)
+class RejectTierViewTests(TestCase):
+    def setUp(self):
+        self.user = make_player('lag-alice')
+        self.client.login(username='lag-alice', password=PASSWORD)
+        patcher = mock.patch.object(loop_lag.monitor, 'tier', TIER_REJECT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, url, data=None):
+        with self.assertLogs('django.request', 'ERROR'):
+            return self.client.post(url, data or {}, headers={'x-requested-with': 'XMLHttpRequest'})
+
+    def _assert_rejected(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(response.json()['retry_after'], 7)
+
+    def test_create_room(self):
+        response = self._post(reverse('game:create_room'), {'max_players': 2, 'bet_amount': 10})
+        self._assert_rejected(response)
+        self.assertFalse(GameRoom.objects.exists())
+
+    def test_join_game(self):
+        room = make_room(make_player('lag-bob'))
+        response = self._post(reverse('game:join_game', args=[room.id]))
+        self._assert_rejected(response)
+        self.assertEqual(room.players.count(), 1)
+
+    def test_page_form_is_redirected_with_retry_after(self):
+        response = self.client.post(reverse('game:create_room'), {'max_players': 2, 'bet_amount': 10})
+        self.assertRedirects(response, reverse('game:lobby'), fetch_redirect_response=False)
+        self.assertEqual(response['Retry-After'], '7')
@@ -0,0 +1,97 @@
+import collections
+import sys
+import types
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from game import memory, sharding, ws_health
+from game.game_logic import DurakGame
+from game.memory import deep_sizeof
+from game.sharding import LiveRooms
+
+from .utils import PASSWORD, fast_passwords, make_player, start_room
+
+
+class _Slotted:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class DeepSizeofTests(SimpleTestCase):
+    def test_containers_are_summed(self):
+        items = ['a' * 100, 'b' * 200]
+        expected = sys.getsizeof(items) + sum(sys.getsizeof(item) for item in items)
+        self.assertEqual(deep_sizeof(items, set()), expected)
+
+    def test_shared_object_counted_once_across_roots(self):
+        shared = 'x' * 1000
+        seen = set()
+        first = deep_sizeof([shared], seen)
+        second = deep_sizeof([shared], seen)
+        self.assertEqual(second, sys.getsizeof([shared]))
+        self.assertGreater(first, second + 1000)
+
+    def test_excluded_and_opaque_objects_are_skipped(self):
+        big = 'y' * 5000
+        self.assertEqual(deep_sizeof([big], set(), frozenset({id(big)})), sys.getsizeof([big]))
+        self.assertEqual(deep_sizeof([len, deep_sizeof], set()), sys.getsizeof([len, deep_sizeof]))
+
+    def test_slots_and_deques_are_followed(self):
+        payload = 'z' * 3000
+        self.assertGreater(deep_sizeof(_Slotted(payload), set()), 3000)
+        self.assertGreater(deep_sizeof(collections.deque([payload]), set()), 3000)
+
+    def test_walk_is_bounded(self):
+        items = ['a' * 1000, 'b' * 1000]
+        with mock.patch.object(memory, 'MAX_OBJECTS_PER_ROOT', 1):
+            self.assertEqual(deep_sizeof(items, set()), sys.getsizeof(items))
+
+
+@fast_passwords
+class RoomMemoryTests(TestCase):
+    def setUp(self):
+        self.room = start_room(make_player('mem-a'), make_player('mem-b'))
+        self.live_rooms = LiveRooms(10)
+        patcher = mock.patch.object(sharding.router, 'live_rooms', self.live_rooms)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(ROOM_SHARDING=True)
+    def test_shard_engine_is_counted(self):
+        self.live_rooms.put(self.room.id, DurakGame(self.room))
+        report = memory.room_memory()
+
+        row = report['rooms'][0]
+        self.assertEqual(row['room_id'], str(self.room.id))
+        self.assertGreater(row['shard_engine_bytes'], 1000)
+        self.assertEqual(row['total_bytes'], row['shard_engine_bytes'] + row['consumer_bytes'] + (row['queued_bytes'] or 0))
+        self.assertEqual((report['totals']['sharding'], report['totals']['shard_engines']), (True, 1))
+
+    @override_settings(ROOM_SHARDING=False)
+    def test_without_sharding_only_consumers_are_counted(self):
+        consumer = types.SimpleNamespace(channel_name='test.nochannel', scope={'room': 'x' * 2000})
+        with mock.patch.object(ws_health, 'live_consumers', return_value={str(self.room.id): [consumer]}):
+            report = memory.room_memory()
+
+        row = report['rooms'][0]
+        self.assertEqual((row['shard_engine_bytes'], row['consumers']), (0, 1))
+        self.assertEqual((report['totals']['sharding'], report['totals']['shard_engines']), (False, 0))
+
+
+@fast_passwords
+class MemoryViewTests(TestCase):
+    def setUp(self):
+        self.user = make_player('mem-admin')
+        self.client.login(username='mem-admin', password=PASSWORD)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(reverse('debug_memory')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('debug_memory'), {'top': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('shard_engines', response.json()['totals'])
@@ -0,0 +1,93 @@
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from game import metrics
+from game.metrics import Counter, Gauge, Histogram, Registry
+
+from .utils import PASSWORD, fast_passwords, make_player, make_room
+
+
+class HistogramTests(SimpleTestCase):
+    def test_bucket_bounds_are_inclusive(self):
+        histogram = Histogram('t_seconds', 'Test.', buckets=(0.1, 1.0))
+        for value in (0.1, 0.5, 1.0, 1.5):
+            histogram.observe(value)
+
+        child = histogram.labels()
+        # le="0.1" включает 0.1, le="1.0" — 0.5 и 1.0, +Inf — остальное
+        self.assertEqual(child.counts, [1, 2, 1])
+        self.assertEqual((child.count, child.sum), (4, 3.1))
+
+    def test_buckets_are_sorted(self):
+        self.assertEqual(Histogram('t_seconds', 'Test.', buckets=(1.0, 0.1)).buckets, (0.1, 1.0))
+
+    def test_render(self):
+        histogram = Histogram('t_seconds', 'Test.', ('op',), buckets=(0.1, 1.0))
+        histogram.labels('move').observe(0.5)
+        self.assertEqual(histogram.render(), '\n'.join([
+            '# HELP t_seconds Test.',
+            '# TYPE t_seconds histogram',
+            't_seconds_bucket{op="move",le="0.1"} 0',
+            't_seconds_bucket{op="move",le="1.0"} 1',
+            't_seconds_bucket{op="move",le="+Inf"} 1',
+            't_seconds_sum{op="move"} 0.5',
+            't_seconds_count{op="move"} 1',
+        ]))
+
+
+class LabelTests(SimpleTestCase):
+    def test_label_values_share_a_child(self):
+        counter = Counter('t_events', 'Test.', ('room',))
+        counter.labels(1).inc()
+        counter.labels('1').inc(2)
+        self.assertEqual(counter.labels('1').value, 3)
+
+    def test_wrong_label_count(self):
+        counter = Counter('t_events', 'Test.', ('op', 'result'))
+        with self.assertRaises(ValueError):
+            counter.labels('move')
+
+    def test_label_values_are_escaped(self):
+        counter = Counter('t_events', 'Test.', ('name',))
+        counter.labels('a"b\\c\nd').inc()
+        self.assertIn('t_events_total{name="a\\"b\\\\c\\nd"} 1.0', counter.render())
+
+    def test_metric_base_is_abstract(self):
+        with self.assertRaises(TypeError):
+            metrics._Metric('t_events', 'Test.')
+
+
+class ExpositionTests(SimpleTestCase):
+    def test_registry_render(self):
+        registry = Registry()
+        registry.register(Counter('t_events', 'Events.')).inc()
+        registry.register(Gauge('t_rooms', 'Rooms.', ('status',), callback=lambda: {('playing',): 3}))
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP t_events Events.',
+            '# TYPE t_events counter',
+            't_events_total 1.0',
+            '# HELP t_rooms Rooms.',
+            '# TYPE t_rooms gauge',
+            't_rooms{status="playing"} 3',
+        ]) + '\n')
+
+    def test_duplicate_name(self):
+        registry = Registry()
+        registry.register(Counter('t_events', 'Events.'))
+        with self.assertRaises(ValueError):
+            registry.register(Gauge('t_events', 'Events.'))
+
+
+@fast_passwords
+class PingPhasesTests(TestCase):
+    def test_ping_observes_its_phases(self):
+        user = make_player('ping-alice')
+        room = make_room(user)
+        self.client.login(username='ping-alice', password=PASSWORD)
+        before = {phase: metrics.PHASE_SECONDS.labels('ping', phase, '').count for phase in ('load', 'update', 'respond')}
+
+        response = self.client.post(reverse('game:ping', args=[room.id]))
+
+        self.assertEqual(response.status_code, 200)
+        for phase, count in before.items():
+            self.assertEqual(metrics.PHASE_SECONDS.labels('ping', phase, '').count, count + 1, phase)
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+import game.routing
+from game import loop_lag
+from game.broadcast import lobby_event, send_events
+from game.consumers import CLOSE_CODE_WRONG_USER
+
+from .utils import fast_passwords, make_player
+
+
+@fast_passwords
+@override_settings(LOAD_SHED_COALESCE_SECONDS=0.05)
+class MuxConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.app = URLRouter(game.routing.websocket_urlpatterns)
+        self.user = make_player('mux-alice')
+
+    async def _connect(self, path='/ws/mux/'):
+        communicator = WebsocketCommunicator(self.app, path)
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _subscribe_lobby(self):
+        communicator = await self._connect()
+        await communicator.send_json_to({'action': 'subscribe', 'topic': 'lobby'})
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'subscribe_result', 'topic': 'lobby', 'success': True})
+        return communicator
+
+    async def test_session_of_another_user_is_closed(self):
+        other = await sync_to_async(make_player)('mux-bob')
+        communicator = await self._connect(f'/ws/mux/?user={other.id}')
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': CLOSE_CODE_WRONG_USER})
+
+    async def test_expected_user_is_accepted(self):
+        communicator = await self._connect(f'/ws/mux/?user={self.user.id}')
+        await communicator.send_json_to({'action': 'ping'})
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'pong'})
+        await communicator.disconnect()
+
+    def test_lobby_page_subscribes_instead_of_polling(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('game:lobby'))
+        self.assertContains(response, 'id="rooms-list"')
+        self.assertContains(response, 'js/lobby.js')
+        self.assertContains(response, 'js/mux_worker.js')
+
+    async def test_lobby_events_pass_through_without_load(self):
+        communicator = await self._subscribe_lobby()
+        await send_events([lobby_event(1, 'waiting')])
+        self.assertEqual(await communicator.receive_json_from(),
+                         {'topic': 'lobby', 'action': 'lobby_changed', 'room_id': 1, 'status': 'waiting'})
+        await communicator.disconnect()
+
+    async def test_lobby_events_are_coalesced_under_load(self):
+        communicator = await self._subscribe_lobby()
+        with mock.patch.object(loop_lag.monitor, 'tier', loop_lag.TIER_THROTTLE):
+            await send_events([lobby_event(1, 'waiting')])
+            await send_events([lobby_event(2, 'waiting')])
+            await send_events([lobby_event(1, 'playing')])
+            self.assertTrue(await communicator.receive_nothing(timeout=0.01))
+
+            first = await communicator.receive_json_from()
+            second = await communicator.receive_json_from()
+        # Ничего не потеряно: по каждой комнате пришло последнее состояние
+        self.assertEqual([(first['room_id'], first['status']), (second['room_id'], second['status'])],
+                         [(2, 'waiting'), (1, 'playing')])
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+        await communicator.disconnect()
@@ -0,0 +1,87 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from game import outbound
+from game.outbound import OutboundQueue
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+
+    async def _send(self, frame):
+        self.sent.append(frame)
+
+    async def _drained(self, queue):
+        while len(queue):
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return [json.loads(frame) if frame.startswith('{') else frame for frame in self.sent]
+
+    async def test_messages_are_sent_in_order(self):
+        queue = OutboundQueue(self._send, 'test')
+        for n in range(3):
+            self.assertTrue(queue.put({'action': 'player_joined', 'n': n}))
+        self.assertEqual([m['n'] for m in await self._drained(queue)], [0, 1, 2])
+
+    async def test_newer_state_replaces_queued_one(self):
+        queue = OutboundQueue(self._send, 'test')
+        queue.put({'action': 'state_changed', 'room_id': 1, 'seq': 1})
+        queue.put({'action': 'player_joined', 'room_id': 1, 'seq': 2})
+        queue.put({'action': 'state_changed', 'room_id': 2, 'seq': 1})
+        queue.put({'action': 'state_changed', 'room_id': 1, 'seq': 3})
+        self.assertEqual(len(queue), 3)
+
+        sent = await self._drained(queue)
+        # Остальные события не переупорядочиваются; последнее состояние комнаты 1 идет после них
+        self.assertEqual([(m['action'], m['room_id'], m['seq']) for m in sent], [
+            ('player_joined', 1, 2),
+            ('state_changed', 2, 1),
+            ('state_changed', 1, 3),
+        ])
+
+    async def test_sent_state_is_not_replaced(self):
+        queue = OutboundQueue(self._send, 'test')
+        queue.put({'action': 'state_changed', 'room_id': 1, 'seq': 1})
+        await self._drained(queue)
+        queue.put({'action': 'state_changed', 'room_id': 1, 'seq': 2})
+        self.assertEqual([m['seq'] for m in await self._drained(queue)], [1, 2])
+
+    async def test_encoded_frames_pass_through(self):
+        queue = OutboundQueue(self._send, 'test', encode=lambda message: 'encoded')
+        queue.put('{"action": "spectator_state"}')
+        queue.put({'action': 'pong'})
+        self.assertEqual(await self._drained(queue), [{'action': 'spectator_state'}, 'encoded'])
+
+    @override_settings(WS_OUTBOUND_MAX_MESSAGES=2)
+    async def test_too_many_queued_messages(self):
+        queue = OutboundQueue(self._send, 'test')
+        self.assertTrue(queue.put({'action': 'a'}))
+        self.assertTrue(queue.put({'action': 'b'}))
+        self.assertFalse(queue.put({'action': 'c'}))
+
+    @override_settings(WS_OUTBOUND_LAG_BUDGET=5.0)
+    async def test_lag_budget(self):
+        queue = OutboundQueue(self._send, 'test')
+        with mock.patch.object(outbound.time, 'monotonic', return_value=100.0):
+            queue.put({'action': 'a'})
+        with mock.patch.object(outbound.time, 'monotonic', return_value=104.0):
+            self.assertFalse(queue.is_lagging())
+        with mock.patch.object(outbound.time, 'monotonic', return_value=106.0):
+            self.assertTrue(queue.is_lagging())
+            self.assertFalse(queue.put({'action': 'b'}))
+        queue.close()
+
+    async def test_failed_send_drops_the_rest(self):
+        async def broken_send(frame):
+            raise ConnectionError('closed')
+
+        queue = OutboundQueue(broken_send, 'test')
+        queue.put({'action': 'a'})
+        queue.put({'action': 'b'})
+        await asyncio.sleep(0)
+        self.assertEqual(len(queue), 0)
+        self.assertFalse(queue.is_lagging())
@@ -0,0 +1,108 @@
+import datetime
+
+from django.db.models import Q
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from game.models import GameRoom
+from game.pagination import decode_cursor, encode_cursor, keyset_q, paginate_keyset
+
+from .utils import PASSWORD, fast_passwords, make_player, make_room
+
+
+class CursorTests(TestCase):
+    def test_round_trip(self):
+        cursor = encode_cursor(['2024-01-01T00:00:00+00:00', 5])
+        self.assertEqual(decode_cursor(cursor, 2), ['2024-01-01T00:00:00+00:00', '5'])
+
+    def test_damaged_cursor_is_ignored(self):
+        self.assertIsNone(decode_cursor('not base64!', 2))
+        self.assertIsNone(decode_cursor(encode_cursor([1, 2, 3]), 2))
+        self.assertIsNone(decode_cursor('', 2))
+
+    def test_keyset_condition(self):
+        q = keyset_q(['-created_at', '-id'], ['t', 5])
+        self.assertEqual(q, Q(created_at__lt='t') | (Q(created_at='t') & Q(id__lt=5)))
+
+@fast_passwords
+class PaginateKeysetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = make_player('creator')
+        # Одинаковое время создания у нескольких комнат: порядок решает id
+        same_time = timezone.now() - datetime.timedelta(hours=1)
+        cls.rooms = []
+        for i in range(7):
+            room = GameRoom.objects.create(creator=cls.creator, bet_amount=i % 3)
+            GameRoom.objects.filter(id=room.id).update(created_at=same_time + datetime.timedelta(minutes=i // 3))
+            cls.rooms.append(room)
+
+    def _pages(self, ordering, page_size):
+        fields = [f.lstrip('-') for f in ordering]
+        cursor, pages = None, []
+        while True:
+            items, cursor = paginate_keyset(
+                GameRoom.objects.all(), ordering, cursor, page_size,
+                lambda room: [getattr(room, f) for f in fields],
+            )
+            pages.append([room.id for room in items])
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_all_rows_once_with_ties(self):
+        for ordering in (['-created_at', '-id'], ['bet_amount', 'id'], ['-bet_amount', '-id']):
+            for page_size in (1, 2, 3, 7, 10):
+                with self.subTest(ordering=ordering, page_size=page_size):
+                    pages = self._pages(ordering, page_size)
+                    flat = [room_id for page in pages for room_id in page]
+                    expected = list(GameRoom.objects.order_by(*ordering).values_list('id', flat=True))
+                    self.assertEqual(flat, expected)
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        items, cursor = paginate_keyset(GameRoom.objects.all(), ['-id'], None, 7, lambda r: [r.id])
+        self.assertEqual(len(items), 7)
+        self.assertIsNone(cursor)
+
+    def test_invalid_cursor_starts_from_beginning(self):
+        items, _ = paginate_keyset(GameRoom.objects.all(), ['-id'], 'garbage', 2, lambda r: [r.id])
+        self.assertEqual([r.id for r in items], sorted((r.id for r in self.rooms), reverse=True)[:2])
+
+
+@fast_passwords
+class RoomSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_player('searcher')
+        cls.other = make_player('host')
+        cls.open_rooms = [make_room(cls.other, bet_amount=bet, max_players=3) for bet in (10, 50, 50, 100)]
+        full = make_room(cls.other, make_player('guest'), max_players=2)
+        own = make_room(cls.user)
+        cls.hidden = {full.id, own.id}
+
+    def setUp(self):
+        self.client.login(username='searcher', password=PASSWORD)
+
+    def _search(self, **params):
+        response = self.client.get(reverse('game:room_search'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_walks_all_pages_without_full_or_own_rooms(self):
+        seen, cursor = [], None
+        while True:
+            data = self._search(sort='bet_asc', limit=1, **({'cursor': cursor} if cursor else {}))
+            seen += [(room['bet_amount'], room['id']) for room in data['rooms']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted((r.bet_amount, r.id) for r in self.open_rooms))
+        self.assertFalse(self.hidden & {room_id for _, room_id in seen})
+
+    def test_bet_range_and_open_seats(self):
+        data = self._search(min_bet=50, max_bet=50, open_seats=2)
+        self.assertEqual(len(data['rooms']), 2)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(reverse('game:room_search'), {'sort': 'rating'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('game:room_search'), {'min_bet': 'x'}).status_code, 400)
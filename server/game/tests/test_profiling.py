@@ -0,0 +1,100 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from server import profiling
+
+from .utils import PASSWORD, fast_passwords, make_player
+
+
+class ProfileGateTests(SimpleTestCase):
+    @override_settings(PROFILE_TOKEN='secret')
+    def test_token_or_staff(self):
+        staff, player = mock.Mock(is_staff=True), mock.Mock(is_staff=False)
+        self.assertTrue(profiling._authorized('secret', None))
+        self.assertTrue(profiling._authorized('secret', player))
+        self.assertFalse(profiling._authorized('wrong', player))
+        self.assertTrue(profiling._authorized('1', staff))
+        # Без заголовка не профилируется даже staff
+        self.assertFalse(profiling._authorized('', staff))
+
+    @override_settings(PROFILE_TOKEN='')
+    def test_empty_token_is_not_a_password(self):
+        self.assertFalse(profiling._authorized('x', mock.Mock(is_staff=False)))
+
+    @override_settings(PROFILE_THRESHOLDS={'game_status': 0.05}, PROFILE_THRESHOLD_DEFAULT=0.25)
+    def test_threshold_for(self):
+        self.assertEqual(profiling.threshold_for('game_status'), 0.05)
+        self.assertEqual(profiling.threshold_for('lobby_view'), 0.25)
+
+
+class RotationTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def test_only_newest_files_are_kept(self):
+        for n in range(4):
+            path = os.path.join(self.dir.name, f'p{n}')
+            open(path, 'w').close()
+            os.utime(path, (1000 + n, 1000 + n))
+        profiling._rotate(self.dir.name, 2)
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['p2', 'p3'])
+
+    def test_save_rotates(self):
+        with override_settings(PROFILE_DIR=self.dir.name, PROFILE_MAX_FILES=2):
+            for n in range(3):
+                with profiling.Profile('cprofile') as profile:
+                    pass
+                with mock.patch.object(profiling.time, 'strftime', return_value=f'2026-{n}'):
+                    profile.save('view')
+        self.assertEqual(len(os.listdir(self.dir.name)), 2)
+
+
+@fast_passwords
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        override = override_settings(PROFILE_DIR=self.dir.name, PROFILE_MODE='cprofile', PROFILE_TOKEN='secret',
+                                     PROFILE_SAMPLE_RATE=0.0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = make_player('prof-alice')
+        self.client.login(username='prof-alice', password=PASSWORD)
+
+    def _get(self, name='leaderboard_me', **headers):
+        response = self.client.get(reverse(f'game:{name}'), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_token_header_profiles_and_names_the_file(self):
+        response = self._get(x_profile='secret')
+        self.assertEqual(os.listdir(self.dir.name), [response['X-Profile-File']])
+        self.assertIn('leaderboard_me', response['X-Profile-File'])
+
+    def test_wrong_token_is_ignored(self):
+        response = self._get(x_profile='guess')
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    def test_staff_header(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIn('X-Profile-File', self._get(x_profile='1'))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_THRESHOLD_DEFAULT=60.0,
+                       PROFILE_THRESHOLDS={'leaderboard_view': 0.0})
+    def test_sampled_requests_are_kept_above_view_threshold(self):
+        self._get('leaderboard_me')
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+        response = self._get('leaderboard')
+        # Выборочный профиль сохраняется молча, без заголовка в ответе
+        self.assertNotIn('X-Profile-File', response)
+        files = os.listdir(self.dir.name)
+        self.assertEqual(len(files), 1)
+        self.assertIn('leaderboard_view', files[0])
@@ -0,0 +1,125 @@
+"""
+Каждое представление с @query_budget проходит свой самый тяжелый путь в
+строгом режиме. TransactionTestCase — чтобы транзакции считались как в
+работе (BEGIN/COMMIT), а не как точки сохранения тестовой транзакции.
+"""
+import json
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from game.game_logic import DurakGame
+from game.models import GameRoom, LeaderboardEntry
+from server.query_profile import QueryBudgetExceeded, query_budget
+
+from .utils import PASSWORD, fast_passwords, make_player, make_room, start_room, strict_query_budgets
+
+
+class QueryBudgetDecoratorTests(SimpleTestCase):
+    databases = {'default'}
+
+    @query_budget(1)
+    def _two_queries(self, request):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.execute('SELECT 2')
+        return 'ok'
+
+    @strict_query_budgets
+    def test_strict_mode_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self._two_queries(None)
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_default_mode_only_logs(self):
+        with self.assertLogs('server.query_profile', 'WARNING'):
+            self.assertEqual(self._two_queries(None), 'ok')
+
+
+@fast_passwords
+@strict_query_budgets
+class ViewQueryBudgetTests(TransactionTestCase):
+    def setUp(self):
+        self.host = make_player('host', cash=1000)
+        self.guest = make_player('guest', cash=1000)
+        for i in range(5):
+            make_room(make_player(f'other{i}'), bet_amount=10 * i, max_players=3)
+
+    def _login(self, player):
+        self.client.login(username=player.username, password=PASSWORD)
+
+    def _started(self):
+        room = start_room(self.host, self.guest)
+        game = DurakGame(room)
+        return room, game.players[game.attacker_index]
+
+    def test_lobby(self):
+        self._login(self.host)
+        self.assertEqual(self.client.get(reverse('game:lobby')).status_code, 200)
+
+    def test_room_search(self):
+        self._login(self.host)
+        self.assertEqual(self.client.get(reverse('game:room_search'), {'min_bet': 10, 'open_seats': 1}).status_code, 200)
+
+    def test_join_game_that_starts_the_game(self):
+        room = make_room(self.host, bet_amount=50, max_players=2)
+        self._login(self.guest)
+        self.client.post(reverse('game:join_game', args=[room.id]))
+        self.assertEqual(GameRoom.objects.get(id=room.id).status, GameRoom.STATUS_PLAYING)
+
+    def test_game_room(self):
+        room, _ = self._started()
+        self._login(self.host)
+        self.assertEqual(self.client.get(reverse('game:game_room', args=[room.id])).status_code, 200)
+
+    def test_start_game(self):
+        room = make_room(self.host, self.guest, max_players=3)
+        self._login(self.host)
+        self.assertTrue(self.client.post(reverse('game:start_game', args=[room.id])).json()['success'])
+
+    def test_leave_room_as_creator(self):
+        room = make_room(self.host, self.guest, bet_amount=20, max_players=3)
+        self._login(self.host)
+        self.assertTrue(self.client.post(reverse('game:leave_room', args=[room.id])).json()['success'])
+
+    def test_end_game(self):
+        room, _ = self._started()
+        self._login(self.host)
+        response = self.client.post(reverse('game:end_game', args=[room.id]), {'winner_id': self.guest.id})
+        self.assertTrue(response.json()['success'])
+
+    def test_game_status(self):
+        room, _ = self._started()
+        self._login(self.host)
+        self.assertEqual(self.client.get(reverse('game:game_status', args=[room.id])).status_code, 200)
+
+    def test_spectate(self):
+        room, _ = self._started()
+        self._login(make_player('viewer'))
+        self.assertEqual(self.client.get(reverse('game:spectate', args=[room.id])).status_code, 200)
+
+    def test_make_move(self):
+        room, attacker = self._started()
+        card_id = DurakGame.card_id_of(DurakGame(room)._get_player_hand(attacker)[0])
+        self._login(attacker)
+        response = self.client.post(
+            reverse('game:make_move', args=[room.id]),
+            json.dumps({'action_type': 'play_card', 'card_id': card_id}),
+            content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+
+    def test_ping(self):
+        room, _ = self._started()
+        self._login(self.host)
+        for _ in range(2):  # создание и обновление PlayerActivity
+            self.assertEqual(self.client.post(reverse('game:ping', args=[room.id])).status_code, 200)
+
+    def test_leaderboard(self):
+        for player in (self.host, self.guest):
+            LeaderboardEntry.objects.create(player=player, score=1500, games_played=1)
+        self._login(self.host)
+        first = self.client.get(reverse('game:leaderboard'), {'limit': 1}).json()
+        self.client.get(reverse('game:leaderboard'), {'limit': 1, 'cursor': first['next_cursor']})
+        self.assertEqual(self.client.get(reverse('game:leaderboard_me')).status_code, 200)
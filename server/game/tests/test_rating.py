@@ -0,0 +1,93 @@
+import io
+import random
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from game import rating
+from game.models import LeaderboardEntry
+from players.models import Player
+
+from .utils import fast_passwords, make_player, make_room
+
+
+def sequential_replay(games, n_players):
+    """Эталон: партии по одной через rating_deltas."""
+    ratings = [rating.INITIAL_RATING] * n_players
+    for seats, scores in games:
+        deltas = rating.rating_deltas([ratings[p] for p in seats], scores)
+        for p, delta in zip(seats, deltas):
+            ratings[p] += delta
+    return ratings
+
+
+class EloTests(SimpleTestCase):
+    def test_two_players(self):
+        self.assertEqual(rating.rating_deltas([1500, 1500], [1.0, 0.0]), [16.0, -16.0])
+        self.assertEqual(rating.rating_deltas([1500, 1500], [0.5, 0.5]), [0.0, 0.0])
+
+    def test_favourite_gains_less(self):
+        strong, weak = rating.rating_deltas([1800, 1400], [1.0, 0.0])
+        self.assertLess(strong, 16.0)
+        self.assertAlmostEqual(strong, -weak)
+
+    def test_multiplayer_is_zero_sum_and_scaled(self):
+        scores = rating.game_scores([1, 2, 3, 4], winner_id=2, loser_id=4)
+        self.assertEqual(scores, [0.5, 1.0, 0.5, 0.0])
+        deltas = rating.rating_deltas([1500] * 4, scores)
+        self.assertAlmostEqual(sum(deltas), 0.0)
+        # Победитель выигрывает у троих: 3 * 0.5 * K / 3
+        self.assertAlmostEqual(deltas[1], rating.K_FACTOR / 2)
+        self.assertAlmostEqual(deltas[3], -rating.K_FACTOR / 2)
+
+    def test_draw_scores(self):
+        self.assertEqual(rating.game_scores([1, 2, 3], winner_id=1, loser_id=2, is_draw=True), [0.5] * 3)
+
+    def test_assign_waves_keeps_per_player_order(self):
+        self.assertEqual(rating.assign_waves([[0, 1], [2, 3], [1, 2], [0, 4], [3, 4]]), [0, 0, 1, 1, 2])
+
+
+class ReplayTests(SimpleTestCase):
+    def _random_history(self, seed, n_players=30, n_games=400):
+        rng = random.Random(seed)
+        games = []
+        for _ in range(n_games):
+            seats = rng.sample(range(n_players), rng.randint(2, 4))
+            winner, loser = rng.sample(seats, 2)
+            games.append((seats, rating.game_scores(seats, winner_id=winner, loser_id=loser, is_draw=rng.random() < 0.05)))
+        return games
+
+    def test_wave_batching_matches_sequential_replay(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                games = self._random_history(seed)
+                player_idx = [seats + [-1] * (4 - len(seats)) for seats, _ in games]
+                scores = [s + [0.0] * (4 - len(s)) for _, s in games]
+                batched = rating.replay_ratings(player_idx, scores, 30)
+                for got, want in zip(batched, sequential_replay(games, 30)):
+                    self.assertAlmostEqual(got, want, places=9)
+
+    def test_empty_history(self):
+        self.assertEqual(list(rating.replay_ratings([], [], 3)), [rating.INITIAL_RATING] * 3)
+
+
+@fast_passwords
+class RecomputeRatingsCommandTests(TestCase):
+    def test_recompute_matches_online_updates(self):
+        players = [make_player(f'p{i}') for i in range(6)]
+        rng = random.Random(7)
+        for _ in range(25):
+            seats = rng.sample(players, rng.randint(2, 4))
+            for p in seats:
+                p.refresh_from_db()
+            winner, loser = rng.sample(seats, 2)
+            make_room(seats[0], *seats[1:], max_players=4).end_game(winner=winner, loser=loser)
+
+        online = dict(Player.objects.values_list('id', 'rating'))
+        Player.objects.update(rating=rating.INITIAL_RATING)
+        call_command('recompute_ratings', stdout=io.StringIO())
+
+        for player_id, value in Player.objects.values_list('id', 'rating'):
+            self.assertAlmostEqual(value, online[player_id], places=6)
+        for entry in LeaderboardEntry.objects.all():
+            self.assertAlmostEqual(entry.score, round(online[entry.player_id], 4), places=4)
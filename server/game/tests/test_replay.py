@@ -0,0 +1,184 @@
+import asyncio
+from unittest import mock
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+import game.routing
+from game import replay
+from game.broadcast import room_event, room_group_name, send_room_events
+from game.replay import RoomEventBuffer, SeqGate
+
+from .utils import fast_passwords, make_player
+
+
+class RoomEventBufferTests(SimpleTestCase):
+    def test_since_returns_only_contiguous_ranges(self):
+        buffer = RoomEventBuffer(events_per_room=8)
+        for seq in (1, 2, 4):
+            buffer.record(7, seq, {'seq': seq})
+
+        self.assertEqual(buffer.since(7, 0, 2), [{'seq': 1}, {'seq': 2}])
+        self.assertEqual(buffer.since(7, 2, 2), [])
+        self.assertIsNone(buffer.since(7, 2, 4))
+        self.assertIsNone(buffer.since(8, 0, 1))
+
+    def test_out_of_order_and_duplicate_records(self):
+        buffer = RoomEventBuffer(events_per_room=8)
+        for seq in (2, 1, 3, 2):
+            buffer.record(7, seq, {'seq': seq})
+        self.assertEqual([m['seq'] for m in buffer.since(7, 0, 3)], [1, 2, 3])
+
+    def test_full_buffer_loses_oldest_events(self):
+        buffer = RoomEventBuffer(events_per_room=3)
+        for seq in range(1, 6):
+            buffer.record(7, seq, {'seq': seq})
+        self.assertIsNone(buffer.since(7, 1, 5))
+        self.assertEqual([m['seq'] for m in buffer.since(7, 2, 5)], [3, 4, 5])
+
+    def test_rooms_are_evicted_lru(self):
+        buffer = RoomEventBuffer(events_per_room=3, max_rooms=2)
+        buffer.record(1, 1, {})
+        buffer.record(2, 1, {})
+        buffer.record(1, 2, {})
+        buffer.record(3, 1, {})
+        self.assertIsNone(buffer.since(2, 0, 1))
+        self.assertEqual(len(buffer.since(1, 0, 2)), 2)
+
+
+class GameConsumerResumeTests(TransactionTestCase):
+    room_id = 41
+
+    def setUp(self):
+        replay.buffer.forget(self.room_id)
+        self.addCleanup(replay.buffer.forget, self.room_id)
+        self.app = URLRouter(game.routing.websocket_urlpatterns)
+
+    async def _connect(self, query=''):
+        communicator = WebsocketCommunicator(self.app, f'/ws/game/{self.room_id}/{query}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _events(self, *actions):
+        await send_room_events([room_event(self.room_id, {'action': action}) for action in actions])
+
+    async def test_two_events_on_one_group_both_arrive(self):
+        communicator = await self._connect()
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'session', 'seq': 0})
+
+        await self._events('player_joined', 'state_changed')
+
+        first = await communicator.receive_json_from()
+        second = await communicator.receive_json_from()
+        self.assertEqual([(first['action'], first['seq']), (second['action'], second['seq'])],
+                         [('player_joined', 1), ('state_changed', 2)])
+        await communicator.disconnect()
+
+    async def test_resume_replays_only_missed_events(self):
+        await self._events('player_joined', 'game_started', 'state_changed')
+
+        communicator = await self._connect('?last_seq=1')
+        missed = [await communicator.receive_json_from() for _ in range(2)]
+        self.assertEqual([m['seq'] for m in missed], [2, 3])
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_resume_outside_buffer_sends_resync(self):
+        await self._events('state_changed', 'state_changed')
+        replay.buffer.forget(self.room_id)
+
+        communicator = await self._connect('?last_seq=1')
+        # Без пользователя в scope — только номер, с которого продолжать
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'resync', 'seq': 2})
+        await communicator.disconnect()
+
+
+@override_settings(REPLAY_GAP_WAIT_SECONDS=0.02)
+class SeqGateTests(SimpleTestCase):
+    def _gate(self, last_seq=1):
+        self.delivered = []
+
+        async def deliver(message):
+            self.delivered.append(message.get('seq'))
+        return SeqGate(7, last_seq, deliver)
+
+    async def test_late_event_is_put_in_order(self):
+        gate = self._gate()
+        await gate.offer(3, {'seq': 3})
+        self.assertEqual(self.delivered, [])
+        await gate.offer(2, {'seq': 2})
+        await gate.offer(2, {'seq': 2})
+        self.assertEqual(self.delivered, [2, 3])
+        self.assertIsNone(gate._gap_task)
+
+    async def test_missing_event_is_resumed_after_wait(self):
+        gate = self._gate()
+        with mock.patch.object(replay, 'resume', return_value=([{'seq': 2}, {'seq': 3}], 3)) as resume:
+            await gate.offer(3, {'seq': 3})
+            await asyncio.sleep(0.05)
+        resume.assert_called_once_with(7, 1, None)
+        self.assertEqual(self.delivered, [2, 3])
+        await gate.offer(3, {'seq': 3})
+        self.assertEqual(self.delivered, [2, 3])
+
+    async def test_failed_resume_still_delivers_held_events(self):
+        gate = self._gate()
+        with mock.patch.object(replay, 'resume', side_effect=RuntimeError('db down')), self.assertLogs('game.replay', 'ERROR'):
+            await gate.offer(4, {'seq': 4})
+            await gate.offer(3, {'seq': 3})
+            await asyncio.sleep(0.05)
+        self.assertEqual(self.delivered, [3, 4])
+        self.assertEqual(gate.last_seq, 4)
+
+    async def test_new_connection_takes_first_event_as_is(self):
+        gate = self._gate(last_seq=0)
+        await gate.offer(5, {'seq': 5})
+        self.assertEqual(self.delivered, [5])
+
+
+@fast_passwords
+@override_settings(REPLAY_GAP_WAIT_SECONDS=0.05)
+class EventGapTests(TransactionTestCase):
+    room_id = 42
+
+    def setUp(self):
+        replay.buffer.forget(self.room_id)
+        self.addCleanup(replay.buffer.forget, self.room_id)
+        self.app = URLRouter(game.routing.websocket_urlpatterns)
+
+    async def _gap(self):
+        """События 2 и 3 другого процесса: в группу дошло только 3, 2 есть в буфере воркера."""
+        await database_sync_to_async(replay.allocate)(self.room_id, 2)
+        replay.buffer.record(self.room_id, 2, {'action': 'game_started', 'seq': 2})
+        await get_channel_layer().group_send(room_group_name(self.room_id), {
+            'type': 'game_message', 'room_id': self.room_id, 'message': {'action': 'state_changed', 'seq': 3},
+        })
+
+    async def test_game_consumer_fills_gap(self):
+        await send_room_events([room_event(self.room_id, {'action': 'player_joined'})])
+        communicator = WebsocketCommunicator(self.app, f'/ws/game/{self.room_id}/?last_seq=0')
+        await communicator.connect()
+        self.assertEqual((await communicator.receive_json_from())['seq'], 1)
+
+        await self._gap()
+        received = [await communicator.receive_json_from(timeout=1) for _ in range(2)]
+        self.assertEqual([(m['action'], m['seq']) for m in received], [('game_started', 2), ('state_changed', 3)])
+        await communicator.disconnect()
+
+    async def test_mux_consumer_fills_gap(self):
+        communicator = WebsocketCommunicator(self.app, '/ws/mux/')
+        communicator.scope['user'] = await database_sync_to_async(make_player)('gap-alice')
+        await communicator.connect()
+        await send_room_events([room_event(self.room_id, {'action': 'player_joined'})])
+        topic = f'room:{self.room_id}'
+        await communicator.send_json_to({'action': 'subscribe', 'topic': topic, 'last_seq': 1})
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'subscribe_result', 'topic': topic, 'success': True})
+
+        await self._gap()
+        received = [await communicator.receive_json_from(timeout=1) for _ in range(2)]
+        self.assertEqual([(m['topic'], m['seq']) for m in received], [(topic, 2), (topic, 3)])
+        await communicator.disconnect()
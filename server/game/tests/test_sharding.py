@@ -0,0 +1,157 @@
+import asyncio
+from unittest import mock
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from game import services, sharding
+from game.game_logic import DurakGame
+from game.models import ShardWorker
+from game.sharding import HashRing, LiveRooms, ShardRouter
+
+from .utils import fast_passwords, make_player, start_room
+
+
+class HashRingTests(SimpleTestCase):
+    def test_empty_ring_has_no_owner(self):
+        self.assertIsNone(HashRing().owner(1))
+
+    def test_owner_is_stable_and_spread(self):
+        ring = HashRing(['w1', 'w2', 'w3'])
+        owners = [ring.owner(room_id) for room_id in range(3000)]
+        self.assertEqual(owners, [HashRing(['w3', 'w1', 'w2']).owner(room_id) for room_id in range(3000)])
+        for node in ('w1', 'w2', 'w3'):
+            self.assertGreater(owners.count(node), 600)
+
+    def test_new_node_moves_only_its_share(self):
+        before = HashRing(['w1', 'w2', 'w3'])
+        after = HashRing(['w1', 'w2', 'w3', 'w4'])
+        moved = [room_id for room_id in range(4000) if before.owner(room_id) != after.owner(room_id)]
+        # Переезжают только комнаты нового воркера, примерно четверть
+        self.assertTrue(all(after.owner(room_id) == 'w4' for room_id in moved))
+        self.assertLess(len(moved), 4000 * 0.4)
+
+
+class LiveRoomsTests(SimpleTestCase):
+    def test_lru_eviction(self):
+        rooms = LiveRooms(max_size=2)
+        rooms.put(1, 'a')
+        rooms.put(2, 'b')
+        rooms.get(1)
+        rooms.put(3, 'c')
+        self.assertEqual(sorted(rooms.room_ids()), [1, 3])
+
+
+def _router(worker_id):
+    router = ShardRouter()
+    router.worker_id = worker_id
+    router._started = True
+    return router
+
+
+@fast_passwords
+@override_settings(ROOM_SHARDING=True, SHARD_FORWARD_TIMEOUT=0.5)
+class ShardRouterTests(TestCase):
+    def setUp(self):
+        self.attacker, self.defender = make_player('a'), make_player('b')
+        self.room = start_room(self.attacker, self.defender)
+        game = DurakGame(self.room)
+        self.attacker, self.defender = game.players[game.attacker_index], game.players[game.defender_index]
+
+    async def _pair(self):
+        """Два воркера на общем слое; комната принадлежит remote."""
+        ring = HashRing(['w1', 'w2'])
+        remote_id = ring.owner(self.room.id)
+        local, remote = _router('w2' if remote_id == 'w1' else 'w1'), _router(remote_id)
+        layer = get_channel_layer()
+        for router in (local, remote):
+            router.ring = ring
+            router.channel_name = await layer.new_channel(prefix='shard.')
+        local.channels = remote.channels = {local.worker_id: local.channel_name, remote.worker_id: remote.channel_name}
+        return local, remote
+
+    async def test_request_is_forwarded_to_owner(self):
+        local, remote = await self._pair()
+        listener = asyncio.create_task(remote._listen())
+        replies = asyncio.create_task(local._listen())
+        try:
+            payload, status = await local.dispatch('status', self.room.id, self.attacker, {})
+        finally:
+            listener.cancel()
+            replies.cancel()
+
+        self.assertEqual(status, 200, payload)
+        self.assertTrue(payload['game_state']['is_game_initialized'])
+        # Горячее состояние осталось только у владельца
+        self.assertIsNotNone(remote.live_rooms.get(self.room.id))
+        self.assertIsNone(local.live_rooms.get(self.room.id))
+
+    async def test_silent_owner_gives_503(self):
+        local, _remote = await self._pair()
+        replies = asyncio.create_task(local._listen())
+        try:
+            payload, status = await local.dispatch('status', self.room.id, self.attacker, {})
+        finally:
+            replies.cancel()
+        self.assertEqual(status, 503, payload)
+
+    def _make_stale(self, router):
+        stale = services.load_room_game(self.room.id)
+        router.live_rooms.put(self.room.id, stale)
+        first, second = (DurakGame.card_id_of(c) for c in stale._get_player_hand(self.attacker)[:2])
+        payload, status = services.perform_move(self.room.id, self.attacker, {'action_type': 'play_card', 'card_id': first})
+        self.assertTrue(payload['success'], payload)
+        return stale, second
+
+    def test_stale_live_game_is_evicted_and_move_rejected(self):
+        router = _router('w1')
+        stale, second = self._make_stale(router)
+
+        with mock.patch.object(services, 'perform_move', wraps=services.perform_move) as perform_move:
+            payload, status = router._handle_sync('move', self.room.id, self.attacker.id, {'action_type': 'play_card', 'card_id': second})
+
+        # Ход не повторяется за клиента: он получает 409, а партия выброшена из памяти
+        self.assertEqual(perform_move.call_count, 1)
+        self.assertEqual(status, 409, payload)
+        self.assertIsNone(router.live_rooms.get(self.room.id))
+
+        payload, status = router._handle_sync('move', self.room.id, self.attacker.id, {'action_type': 'play_card', 'card_id': second})
+        self.assertEqual(status, 200, payload)
+        self.assertIsNot(router.live_rooms.get(self.room.id), stale)
+
+    def test_stale_live_game_is_evicted_and_status_retried(self):
+        router = _router('w1')
+        stale, _second = self._make_stale(router)
+
+        with mock.patch.object(services, 'game_status', side_effect=[({'success': False}, 409), ({'success': True}, 200)]) as game_status:
+            payload, status = router._handle_sync('status', self.room.id, self.attacker.id, {})
+
+        self.assertEqual(game_status.call_count, 2)
+        self.assertEqual(status, 200, payload)
+        self.assertIsNot(game_status.call_args.kwargs['game'], stale)
+
+    async def test_room_lock_is_released_with_last_holder(self):
+        router = _router('w1')
+        await asyncio.gather(*(router.handle_local('status', self.room.id, self.attacker.id, {}) for _ in range(3)))
+        self.assertEqual(len(router._room_locks), 0)
+
+
+class ShardMembershipTests(TestCase):
+    async def test_heartbeat_rejoins_group_and_prunes_stale_workers(self):
+        await database_sync_to_async(ShardWorker.objects.create)(
+            worker_id='dead', channel_name='shard.dead', heartbeat_at=timezone.now() - timezone.timedelta(hours=1),
+        )
+        router = _router('w1')
+        router.channel_name = await get_channel_layer().new_channel(prefix='shard.')
+        layer = get_channel_layer()
+        with mock.patch.object(layer, 'group_add', wraps=layer.group_add) as group_add:
+            await router._heartbeat_once()
+            await router._heartbeat_once()
+
+        self.assertEqual(group_add.call_count, 2)
+        group_add.assert_called_with(sharding.WORKERS_GROUP, router.channel_name)
+        self.assertEqual(router.ring.nodes, {'w1'})
+        worker_ids = await database_sync_to_async(lambda: sorted(ShardWorker.objects.values_list('worker_id', flat=True)))()
+        self.assertEqual(worker_ids, ['w1'])
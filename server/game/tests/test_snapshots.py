@@ -0,0 +1,105 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from game import services, snapshots
+from game.game_logic import DurakGame
+from game.models import Game, GameRoom
+from game.snapshots import SnapshotLog
+
+from .utils import fast_passwords, make_player, start_room
+
+
+class SnapshotLogTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'w.snap')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_reopen_keeps_latest_and_tombstones(self):
+        log = SnapshotLog(self.path, segment_bytes=4096)
+        log.append(1, 1)
+        log.append(2, 1)
+        log.append(1, 2)
+        log.append(2, 2, live=False)
+        log.close()
+
+        self.assertEqual(SnapshotLog(self.path, segment_bytes=4096).latest(), {1: 2})
+
+    def test_torn_tail_is_ignored(self):
+        log = SnapshotLog(self.path, segment_bytes=4096)
+        log.append(1, 1)
+        end = log._offset
+        log.append(1, 2)
+        # Запись оборвалась посреди данных
+        log._mm[end + snapshots.HEADER.size + 3] ^= 0xFF
+        log.close()
+
+        self.assertEqual(SnapshotLog(self.path, segment_bytes=4096).latest(), {1: 1})
+
+    def test_compaction_grows_segment(self):
+        log = SnapshotLog(self.path, segment_bytes=128, compact_every=3)
+        for version in range(50):
+            log.append(version % 5, version)
+        self.assertEqual(sorted(log.latest()), [0, 1, 2, 3, 4])
+        log.close()
+        self.assertEqual(SnapshotLog(self.path, segment_bytes=128).latest(), {room_id: 45 + room_id for room_id in range(5)})
+
+
+@fast_passwords
+class RestartRecoveryTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        override = override_settings(SNAPSHOT_DIR=self.dir.name, ROOM_SHARDING=True, SHARD_WORKER_ID='w1')
+        override.enable()
+        self.addCleanup(override.disable)
+        self._reset_process()
+
+    def tearDown(self):
+        self._reset_process()
+        self.dir.cleanup()
+
+    def _reset_process(self):
+        """Как после рестарта: журнал открывается заново, recover еще не вызывался."""
+        if snapshots._log is not None:
+            snapshots._log.close()
+        snapshots._log = None
+        snapshots._recovered = False
+
+    def test_recover_rebuilds_live_rooms_from_db(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            live = start_room(make_player('a'), make_player('b'))
+            finished = start_room(make_player('c'), make_player('d'))
+        game = DurakGame(live)
+        attacker = game.players[game.attacker_index]
+        card_id = DurakGame.card_id_of(game._get_player_hand(attacker)[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            payload, _ = services.perform_move(live.id, attacker, {'action_type': 'play_card', 'card_id': card_id})
+        self.assertTrue(payload['success'], payload)
+        GameRoom.objects.filter(id=finished.id).update(status=GameRoom.STATUS_FINISHED)
+        self.assertEqual(snapshots.get_log().latest(), {live.id: 2, finished.id: 1})
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name, 'w1.snap')))
+
+        self._reset_process()
+        games = snapshots.recover()
+
+        self.assertEqual(set(games), {live.id})
+        restored = games[live.id]
+        db_game = Game.objects.get(room=live)
+        self.assertEqual(restored.game_model_instance.version, db_game.version)
+        self.assertEqual(restored.table, db_game.table)
+        # Завершенная комната получила надгробие и после следующего рестарта не читается
+        self.assertEqual(set(snapshots.get_log().latest()), {live.id})
+        self.assertEqual(snapshots.recover(), {})
+
+    def test_log_needs_sharding_and_stable_worker_id(self):
+        for n, overrides in enumerate(({'ROOM_SHARDING': False}, {'SHARD_WORKER_ID': ''})):
+            with self.subTest(**overrides), override_settings(**overrides):
+                self.assertFalse(snapshots.is_enabled())
+                self.assertIsNone(snapshots.get_log())
+                with self.captureOnCommitCallbacks(execute=True):
+                    start_room(make_player(f'a{n}'), make_player(f'b{n}'))
+        self.assertEqual(os.listdir(self.dir.name), [])
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+import game.routing
+from game import services, spectators
+from game.game_logic import DurakGame
+from game.spectators import SPECTATOR_FRAMES_COALESCED, SPECTATOR_FRAMES_ENCODED, FrameSender
+
+from .utils import fast_passwords, make_player, start_room
+
+
+def _frame(version, published_at=None):
+    return {'version': version, 'text': f'v{version}', 'published_at': published_at if published_at is not None else time.time()}
+
+
+class FrameSenderTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+
+    async def _send(self, text):
+        self.sent.append(text)
+
+    @override_settings(SPECTATOR_DELAY_SECONDS=0.1)
+    async def test_delay_is_honored(self):
+        sender = FrameSender(self._send)
+        sender.push(_frame(1))
+        await asyncio.sleep(0.03)
+        self.assertEqual(self.sent, [])
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.sent, ['v1'])
+        sender.close()
+
+    @override_settings(SPECTATOR_DELAY_SECONDS=0.05)
+    async def test_ripe_frames_coalesce_to_newest(self):
+        sender = FrameSender(self._send)
+        coalesced = SPECTATOR_FRAMES_COALESCED.labels().value
+        for version in (1, 2, 3):
+            sender.push(_frame(version))
+        await asyncio.sleep(0.15)
+
+        self.assertEqual(self.sent, ['v3'])
+        self.assertEqual(SPECTATOR_FRAMES_COALESCED.labels().value, coalesced + 2)
+        # Старые версии после отправленной не уходят
+        sender.push(_frame(2))
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.sent, ['v3'])
+        sender.close()
+
+
+@fast_passwords
+class SpectatorBroadcastTests(TransactionTestCase):
+    def setUp(self):
+        spectators._frames.clear()
+        self.addCleanup(spectators._frames.clear)
+        self.app = URLRouter(game.routing.websocket_urlpatterns)
+        self.room = start_room(make_player('spec-a'), make_player('spec-b'))
+        self.viewers = [make_player(f'spec-viewer{i}') for i in range(3)]
+
+    async def _watch(self, viewer):
+        communicator = WebsocketCommunicator(self.app, f'/ws/spectate/{self.room.id}/')
+        communicator.scope['user'] = viewer
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def _move(self):
+        game = DurakGame(self.room)
+        attacker = game.players[game.attacker_index]
+        card_id = DurakGame.card_id_of(game._get_player_hand(attacker)[0])
+        payload, _ = services.perform_move(self.room.id, attacker, {'action_type': 'play_card', 'card_id': card_id})
+        self.assertTrue(payload['success'], payload)
+
+    async def test_frame_is_encoded_once_per_version(self):
+        encoded = SPECTATOR_FRAMES_ENCODED.labels().value
+        watchers = [await self._watch(viewer) for viewer in self.viewers]
+        first = [await w.receive_json_from() for w in watchers]
+        self.assertEqual(len({f['version'] for f in first}), 1)
+        self.assertEqual(SPECTATOR_FRAMES_ENCODED.labels().value, encoded + 1)
+
+        await database_sync_to_async(self._move)()
+        second = [await w.receive_json_from(timeout=1) for w in watchers]
+
+        self.assertEqual({f['version'] for f in second}, {first[0]['version'] + 1})
+        self.assertEqual(SPECTATOR_FRAMES_ENCODED.labels().value, encoded + 2)
+        for w in watchers:
+            await w.disconnect()
@@ -0,0 +1,131 @@
+import asyncio
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from game import services
+from game.game_logic import DurakGame
+from game.models import Game
+from game.timers import TimingWheel, TurnTimers
+
+from .utils import fast_passwords, make_player, start_room
+
+
+class TimingWheelTests(SimpleTestCase):
+    def _wheel(self):
+        # 4 ячейки x 3 уровня: 1, 4, 16 тиков на ячейку, всего 64 тика
+        return TimingWheel(tick=1.0, slots=4, levels=3)
+
+    def _run(self, wheel, ticks):
+        for _ in range(ticks):
+            wheel.advance()
+
+    def test_fires_on_exact_tick_across_levels(self):
+        wheel = self._wheel()
+        self._run(wheel, 5)  # колесо уже не в нулевой позиции
+        fired = []
+        for delay in range(1, 59):
+            wheel.add(delay, lambda d=delay: fired.append((d, wheel.current)))
+        self._run(wheel, 64)
+        self.assertEqual(fired, [(d, 5 + d) for d in range(1, 59)])
+        self.assertEqual(wheel.pending, 0)
+
+    def test_fractional_delay_rounds_up(self):
+        wheel = TimingWheel(tick=0.1, slots=4, levels=3)
+        fired = []
+        wheel.add(0.25, lambda: fired.append(wheel.current))
+        self._run(wheel, 5)
+        self.assertEqual(fired, [3])
+
+    def test_cancelled_timers_do_not_fire(self):
+        wheel = self._wheel()
+        fired = []
+        short = wheel.add(2, fired.append, 'short')
+        long = wheel.add(40, fired.append, 'long')  # на старшем уровне
+        wheel.add(41, fired.append, 'kept')
+        short.cancel()
+        long.cancel()
+        self._run(wheel, 50)
+        self.assertEqual(fired, ['kept'])
+        self.assertEqual(wheel.pending, 0)
+
+    def test_delay_beyond_range(self):
+        with self.assertRaises(ValueError):
+            self._wheel().add(64, lambda: None)
+
+    def test_failing_callback_does_not_stop_others(self):
+        wheel = self._wheel()
+        fired = []
+        wheel.add(1, lambda: 1 / 0)
+        wheel.add(1, fired.append, 'ok')
+        self.assertEqual(wheel.advance(), 2)
+        self.assertEqual(fired, ['ok'])
+
+
+class TurnTimersTests(SimpleTestCase):
+    async def _timers(self):
+        timers = TurnTimers()
+        timers.loop = asyncio.get_running_loop()
+        timers.wheel = TimingWheel(tick=1.0, slots=4, levels=3)
+        return timers
+
+    async def _advance(self, timers, ticks):
+        for _ in range(ticks):
+            timers.wheel.advance()
+        await asyncio.sleep(0)
+
+    @override_settings(DURAK_TURN_TIMEOUT_SECONDS=3)
+    async def test_new_save_replaces_timer(self):
+        timers = await self._timers()
+        with mock.patch.object(timers, '_apply_timeout', mock.AsyncMock()) as apply_timeout:
+            timers.game_saved(1, 1, playing=True)
+            await asyncio.sleep(0)
+            await self._advance(timers, 2)
+            timers.game_saved(1, 2, playing=True)
+            await asyncio.sleep(0)
+            await self._advance(timers, 2)
+            apply_timeout.assert_not_called()
+            await self._advance(timers, 1)
+        apply_timeout.assert_awaited_once_with(1, 2)
+        self.assertEqual(len(timers), 0)
+
+    @override_settings(DURAK_TURN_TIMEOUT_SECONDS=3)
+    async def test_finished_game_cancels_timer(self):
+        timers = await self._timers()
+        with mock.patch.object(timers, '_apply_timeout', mock.AsyncMock()) as apply_timeout:
+            timers.game_saved(1, 1, playing=True)
+            timers.game_saved(1, 2, playing=False)
+            await asyncio.sleep(0)
+            await self._advance(timers, 10)
+        apply_timeout.assert_not_called()
+
+    async def test_disabled_by_default(self):
+        timers = TurnTimers()
+        await timers.start()
+        self.assertIsNone(timers.wheel)
+
+
+@fast_passwords
+class TurnTimeoutTests(TestCase):
+    def test_timeout_acts_once_per_version(self):
+        room = start_room(make_player('a'), make_player('b'))
+        version = Game.objects.get(room=room).version
+
+        payload, _ = services.perform_turn_timeout(room.id, version)
+        self.assertTrue(payload['success'], payload)
+        self.assertEqual(len(DurakGame(room).table), 1)
+
+        # Таймер старой версии ничего не делает
+        payload, _ = services.perform_turn_timeout(room.id, version)
+        self.assertTrue(payload.get('skipped'), payload)
+
+    @override_settings(DURAK_TURN_TIMEOUT_SECONDS=60)
+    async def test_start_restores_playing_rooms(self):
+        room = await sync_to_async(start_room)(await sync_to_async(make_player)('a'), await sync_to_async(make_player)('b'))
+        timers = TurnTimers()
+        await timers.start(owns=lambda room_id: room_id == room.id)
+        try:
+            self.assertEqual(len(timers), 1)
+        finally:
+            timers._task.cancel()
@@ -0,0 +1,84 @@
+import json
+
+import msgpack
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+import game.routing
+from game import wire
+
+
+class WireCodecTests(SimpleTestCase):
+    def test_move_round_trip(self):
+        move = {'action': 'move', 'topic': 'room:5', 'action_type': 'defend',
+                'attack_card_id': '6-hearts', 'defense_card_id': 'A-hearts', 'action_id': 'abc'}
+        frame = wire.MsgpackCodec().encode(move)
+
+        self.assertIsInstance(frame, bytes)
+        self.assertEqual(wire.decode(bytes_data=frame), move)
+        # Известные ключи сжаты тегами, неизвестные переданы как есть
+        self.assertEqual(set(msgpack.unpackb(frame)), {'a', 'topic', 'y', 'ati', 'dci', 'x'})
+
+    def test_cards_are_packed_as_numbers(self):
+        state = {'game_state': {
+            'trump_card_revealed': {'rank': 'A', 'suit': 'spades', 'id': 'A-spades', 'image_url': '/x.png'},
+            'table': [{'attack_card': {'rank': '6', 'suit': 'hearts'}, 'defense_card': None}],
+            'players': [{'id': 3, 'cards': [{'rank': '10', 'suit': 'diamonds', 'hand_index': 0}]}],
+        }}
+        packed = msgpack.unpackb(wire.MsgpackCodec().encode(state))['g']
+
+        self.assertEqual(packed['tc'], 3 * 9 + 8)
+        self.assertEqual(packed['t'], [{'ac': 0, 'dd': None}])
+        self.assertEqual(packed['p'], [{'i': 3, 'c': [1 * 9 + 4]}])
+        self.assertLess(len(wire.MsgpackCodec().encode(state)), len(wire.JsonCodec().encode(state)))
+
+    def test_unknown_card_is_not_packed(self):
+        self.assertIsNone(wire.card_id({'rank': '5', 'suit': 'hearts'}))
+        self.assertEqual(wire._compact({'rank': '5', 'suit': 'hearts'}), {'rank': '5', 'suit': 'hearts'})
+
+    def test_every_card_has_its_own_number(self):
+        ids = {wire.card_id({'rank': rank, 'suit': suit}) for suit in wire.CARD_SUITS for rank in wire.CARD_RANKS}
+        self.assertEqual(ids, set(range(36)))
+
+    def test_text_frames_are_json(self):
+        self.assertEqual(wire.decode(text_data='{"action": "ping"}'), {'action': 'ping'})
+        self.assertEqual(json.loads(wire.JsonCodec().encode({'action': 'pong'})), {'action': 'pong'})
+
+    def test_binary_frame_must_be_a_dict(self):
+        with self.assertRaises(ValueError):
+            wire.decode(bytes_data=msgpack.packb([1, 2]))
+
+
+class NegotiateTests(SimpleTestCase):
+    def test_msgpack_when_offered(self):
+        codec = wire.negotiate({'subprotocols': [wire.SUBPROTOCOL_MSGPACK, wire.SUBPROTOCOL_JSON]})
+        self.assertIsInstance(codec, wire.MsgpackCodec)
+        self.assertEqual(codec.subprotocol, wire.SUBPROTOCOL_MSGPACK)
+
+    def test_json_without_subprotocols(self):
+        codec = wire.negotiate({})
+        self.assertIsInstance(codec, wire.JsonCodec)
+        self.assertIsNone(codec.subprotocol)
+
+    def test_explicit_json_is_confirmed(self):
+        self.assertEqual(wire.negotiate({'subprotocols': [wire.SUBPROTOCOL_JSON]}).subprotocol, wire.SUBPROTOCOL_JSON)
+
+    @override_settings(WS_MSGPACK_ENABLED=False)
+    def test_msgpack_can_be_disabled(self):
+        codec = wire.negotiate({'subprotocols': [wire.SUBPROTOCOL_MSGPACK, wire.SUBPROTOCOL_JSON]})
+        self.assertIsInstance(codec, wire.JsonCodec)
+        self.assertEqual(codec.subprotocol, wire.SUBPROTOCOL_JSON)
+
+
+class MsgpackConsumerTests(TransactionTestCase):
+    async def test_consumer_sends_binary_frames(self):
+        communicator = WebsocketCommunicator(URLRouter(game.routing.websocket_urlpatterns), '/ws/game/42/',
+                                             subprotocols=[wire.SUBPROTOCOL_MSGPACK, wire.SUBPROTOCOL_JSON])
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, wire.SUBPROTOCOL_MSGPACK)
+
+        frame = await communicator.receive_from()
+        self.assertEqual(wire.decode(bytes_data=frame), {'action': 'session', 'seq': 0})
+        await communicator.disconnect()
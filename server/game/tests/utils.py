@@ -0,0 +1,31 @@
+"""Общие заготовки для тестов приложения game."""
+from django.test import override_settings
+
+from game.models import GameRoom
+from players.models import Player
+
+# pbkdf2 на каждом create_user заметно замедляет набор тестов
+fast_passwords = override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+PASSWORD = 'pass-1234'
+
+
+def make_player(username, **fields) -> Player:
+    return Player.objects.create_user(username, password=PASSWORD, **fields)
+
+
+def make_room(creator, *players, **fields) -> GameRoom:
+    """Комната creator-а с игроками players (создатель тоже за столом)."""
+    room = GameRoom.objects.create(creator=creator, **fields)
+    room.players.add(creator, *players)
+    return room
+
+
+def start_room(creator, *players, **fields) -> GameRoom:
+    room = make_room(creator, *players, **fields)
+    assert room.start_game(), 'партия не началась'
+    room.refresh_from_db()
+    return room
+
+# Превышение @query_budget валит тест, а не только пишется в лог
+strict_query_budgets = override_settings(QUERY_BUDGET_STRICT=True)
@@ -0,0 +1,194 @@
+"""
+Таймеры ходов (DURAK_TURN_TIMEOUT_SECONDS).
+
+После каждого зафиксированного сохранения партии (DurakGame.save_game_state)
+для комнаты заводится таймер на версию Game.version. Если за отведенное время
+состояние не изменилось, за зависшего игрока выполняется действие по
+умолчанию (services.perform_turn_timeout): защищающийся берет карты,
+атакующий говорит "бито"/"пас", а на пустой стол выкладывается младшая карта.
+
+Все таймеры процесса живут в одном иерархическом колесе (TimingWheel) в
+event loop: добавление, отмена и тик стоят O(1) независимо от числа таймеров,
+БД не опрашивается. При старте процесса таймеры играющих комнат
+восстанавливаются одним запросом по Game.updated_at.
+
+Срабатывание идет через sharding.dispatch, то есть выполняется владельцем
+комнаты; устаревший таймер (версия уже другая) ничего не делает.
+"""
+import asyncio
+import logging
+import math
+import typing
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import loop_lag
+
+logger = logging.getLogger(__name__)
+
+
+def turn_timeout_seconds() -> float:
+    return getattr(settings, 'DURAK_TURN_TIMEOUT_SECONDS', 0)
+
+
+def is_enabled() -> bool:
+    return turn_timeout_seconds() > 0
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline: int, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimingWheel:
+    """
+    Иерархическое колесо таймеров: levels уровней по slots ячеек.
+    Уровень l хранит таймеры, до срабатывания которых от slots**l до
+    slots**(l+1) тиков; при обороте младшего уровня ячейка старшего
+    перераспределяется вниз. Отмена ленивая — флаг на таймере.
+    """
+
+    def __init__(self, tick: float, slots: int = 64, levels: int = 4):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = 0
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._spans = [slots ** level for level in range(levels + 1)]
+        self.pending = 0
+
+    def add(self, delay: float, callback, *args) -> Timer:
+        ticks = max(1, math.ceil(delay / self.tick))
+        if ticks >= self._spans[self.levels]:
+            raise ValueError(f"Timer delay {delay}s exceeds wheel range {self._spans[self.levels] * self.tick}s")
+        timer = Timer(self.current + ticks, callback, args)
+        self._place(timer)
+        self.pending += 1
+        return timer
+
+    def _place(self, timer: Timer):
+        delta = timer.deadline - self.current
+        for level in range(self.levels):
+            if delta < self._spans[level + 1]:
+                slot = (timer.deadline // self._spans[level]) % self.slots
+                self._wheels[level][slot].append(timer)
+                return
+
+    def advance(self) -> int:
+        """Один тик: перераспределяет старшие уровни и вызывает истекшие таймеры."""
+        self.current += 1
+        for level in range(self.levels - 1, 0, -1):
+            if self.current % self._spans[level] == 0:
+                slot = (self.current // self._spans[level]) % self.slots
+                bucket, self._wheels[level][slot] = self._wheels[level][slot], []
+                for timer in bucket:
+                    if timer.cancelled:
+                        self.pending -= 1
+                    else:
+                        self._place(timer)
+
+        slot = self.current % self.slots
+        bucket, self._wheels[0][slot] = self._wheels[0][slot], []
+        fired = 0
+        for timer in bucket:
+            self.pending -= 1
+            if timer.cancelled:
+                continue
+            fired += 1
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                logger.error(f"Timer callback {timer.callback!r} failed: {e}", exc_info=True)
+        return fired
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            # Догоняем пропущенные тики, если loop был занят
+            target = started + (self.current + 1) * self.tick
+            delay = target - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.advance()
+
+
+class TurnTimers:
+    """Таймеры ходов процесса. Методы schedule/cancel можно вызывать из любого потока."""
+
+    def __init__(self):
+        self.wheel: typing.Optional[TimingWheel] = None
+        self.loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._by_room: dict[int, Timer] = {}
+        self._task: typing.Optional[asyncio.Task] = None
+
+    async def start(self, owns: typing.Callable[[int], bool] = lambda room_id: True):
+        if self.wheel is not None or not is_enabled():
+            return
+        self.loop = asyncio.get_running_loop()
+        self.wheel = TimingWheel(getattr(settings, 'DURAK_TIMER_TICK_SECONDS', 0.1))
+        self._task = asyncio.create_task(self.wheel.run())
+
+        timeout = turn_timeout_seconds()
+        now = timezone.now()
+        playing = await database_sync_to_async(self._playing_games)()
+        for room_id, version, updated_at in playing:
+            if owns(room_id):
+                remaining = timeout - (now - updated_at).total_seconds()
+                self._schedule(room_id, version, max(remaining, 0))
+        logger.info(f"Turn timers started: {len(self._by_room)} rooms, timeout {timeout}s")
+
+    @staticmethod
+    def _playing_games():
+        from .models import Game, GameRoom
+        return list(Game.objects.filter(status=GameRoom.STATUS_PLAYING).values_list('room_id', 'version', 'updated_at'))
+
+    def game_saved(self, room_id: int, version: int, playing: bool):
+        """Вызывается после коммита сохранения партии."""
+        if self.loop is None:
+            return
+        if playing:
+            self.loop.call_soon_threadsafe(self._schedule, room_id, version, turn_timeout_seconds())
+        else:
+            self.loop.call_soon_threadsafe(self._cancel, room_id)
+
+    def _schedule(self, room_id, version, delay):
+        self._cancel(room_id)
+        self._by_room[room_id] = self.wheel.add(delay, self._expired, room_id, version)
+
+    def _cancel(self, room_id):
+        timer = self._by_room.pop(room_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _expired(self, room_id, version):
+        self._by_room.pop(room_id, None)
+        if loop_lag.shed('turn_timeout', loop_lag.TIER_COALESCE):
+            self._schedule(room_id, version, loop_lag.timer_grace())
+            return
+        asyncio.create_task(self._apply_timeout(room_id, version))
+
+    async def _apply_timeout(self, room_id, version):
+        from . import sharding
+        try:
+            payload, status = await sharding.dispatch('timeout', room_id, None, {'version': version})
+            if payload.get('success'):
+                logger.info(f"Turn timeout in room {room_id} (v{version}): {payload.get('action_type')}")
+        except Exception as e:
+            logger.error(f"Turn timeout for room {room_id} failed: {e}", exc_info=True)
+
+    def __len__(self):
+        return len(self._by_room)
+
+
+turn_timers = TurnTimers()
@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     # Основные маршруты
     path('', views.lobby_view, name='lobby'),
+    path('search/', views.room_search, name='room_search'),
     path('create/', views.create_room, name='create_room'),
     #path('find/', views.find_game, name='find_game'),
     path('join/<int:game_id>/', views.join_game, name='join_game'),
@@ -21,4 +22,9 @@ urlpatterns = [
     path('status/<int:room_id>/', views.game_status, name='game_status'),
     path('ping/<int:room_id>/', views.ping, name='ping'),
     path('room/<int:room_id>/make_move/', views.make_move_view, name='make_move'),
+    path('spectate/<int:room_id>/', views.spectate_view, name='spectate'),
+
+    # Таблица лидеров
+    path('leaderboard/', views.leaderboard_view, name='leaderboard'),
+    path('leaderboard/me/', views.leaderboard_me, name='leaderboard_me'),
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
@@ -8,9 +9,15 @@ from django.db import transaction, models
 from django.db.models import Count
 from django.contrib import messages
 from django.forms import Form, IntegerField, CharField
-from .models import GameRoom, PlayerActivity
+from .models import GameRoom, PlayerActivity, LeaderboardEntry
 from players.models import Player
 from .game_logic import DurakGame
+from .pagination import paginate_keyset
+from .broadcast import broadcast_room_events, lobby_event, room_event
+from . import loop_lag, memory, metrics, sharding, spectators
+from server.db_router import read_from_replica
+from server.query_profile import query_budget
+from . import leaderboard
 import logging
 import json
 logger = logging.getLogger(__name__)
@@ -20,23 +27,195 @@ class CreateRoomForm(Form):
     max_players = IntegerField(min_value=2, max_value=4, label="Количество игроков")
     bet_amount = IntegerField(min_value=0, label="Ставка")
 
+LOBBY_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE_MAX = 100
+
+# Допустимые сортировки поиска: ключ -> поля keyset-упорядочивания.
+# Каждая опирается на составной индекс (status, created_at) или (status, bet_amount).
+ROOM_SEARCH_ORDERINGS = {
+    'new': ['-created_at', '-id'],
+    'bet_asc': ['bet_amount', 'id'],
+    'bet_desc': ['-bet_amount', '-id'],
+}
+
+
+def _open_rooms_queryset(user):
+    """Ожидающие комнаты со свободными местами, в которых пользователя еще нет."""
+    return GameRoom.objects.filter(status=GameRoom.STATUS_WAITING)\
+                           .select_related('creator')\
+                           .annotate(players_count=Count('players'))\
+                           .filter(players_count__lt=models.F('max_players'))\
+                           .exclude(players=user)
+
+
+def _room_cursor_key(ordering):
+    fields = [f.lstrip('-') for f in ordering]
+    return lambda room: [getattr(room, f) for f in fields]
+
+
 @login_required
+@read_from_replica
+@query_budget(2)
 def lobby_view(request):
-    rooms = GameRoom.objects.filter(status=GameRoom.STATUS_WAITING)\
-                            .annotate(players_count=Count('players'))\
-                            .filter(players_count__lt=models.F('max_players'))\
-                            .exclude(players=request.user)\
-                            .order_by('-created_at')[:20]
+    phases = metrics.PhaseTimer(metrics.PHASE_SECONDS, 'lobby')
+    ordering = ROOM_SEARCH_ORDERINGS['new']
+    rooms, next_cursor = paginate_keyset(
+        _open_rooms_queryset(request.user),
+        ordering,
+        request.GET.get('cursor'),
+        LOBBY_PAGE_SIZE,
+        _room_cursor_key(ordering),
+    )
+    phases.mark('query')
 
     context = {
         'rooms': rooms,
+        'next_cursor': next_cursor,
         'user_balance': request.user.cash,
     }
-    return render(request, 'game/lobby.html', context)
+    response = render(request, 'game/lobby.html', context)
+    phases.mark('render')
+    return response
+
+
+def metrics_view(request):
+    """Метрики процесса в формате Prometheus. Доступ: METRICS_ALLOWED_IPS или staff."""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not request.user.is_staff:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def memory_view(request):
+    """Приблизительная память живых комнат этого процесса (только staff). ?top=N"""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Доступ запрещен.'}, status=403)
+    try:
+        top = _parse_int_param(request.GET, 'top')
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **memory.room_memory(top=top)})
+
+
+TRACEMALLOC_ACTIONS = {
+    'start': lambda limit: memory.start(),
+    'stop': lambda limit: memory.stop(),
+    'snapshot': memory.snapshot,
+    'diff': memory.diff,
+}
+
+
+def tracemalloc_view(request):
+    """
+    Снимки tracemalloc по модулям (только staff).
+    GET — состояние трассировки; POST action=start|snapshot|diff|stop, limit=N.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Доступ запрещен.'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'success': True, **memory.tracing_status()})
+
+    action = TRACEMALLOC_ACTIONS.get(request.POST.get('action'))
+    if action is None:
+        return JsonResponse({'success': False, 'error': 'Неизвестное действие.'}, status=400)
+    try:
+        limit = _parse_int_param(request.POST, 'limit') or 30
+        result = action(limit)
+    except (ValueError, RuntimeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **result})
+
+
+def _parse_int_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Параметр {name} должен быть числом.")
+
+
+@login_required
+@read_from_replica
+@query_budget(2)
+def room_search(request):
+    """
+    Поиск открытых комнат с keyset-пагинацией.
+
+    GET-параметры: min_bet, max_bet, max_players (размер стола), open_seats
+    (минимум свободных мест), sort (new | bet_asc | bet_desc), limit, cursor.
+    """
+    sort = request.GET.get('sort', 'new')
+    ordering = ROOM_SEARCH_ORDERINGS.get(sort)
+    if ordering is None:
+        return JsonResponse({'success': False, 'error': 'Неизвестный тип сортировки.'}, status=400)
+
+    try:
+        min_bet = _parse_int_param(request.GET, 'min_bet')
+        max_bet = _parse_int_param(request.GET, 'max_bet')
+        max_players = _parse_int_param(request.GET, 'max_players')
+        open_seats = _parse_int_param(request.GET, 'open_seats')
+        limit = _parse_int_param(request.GET, 'limit') or LOBBY_PAGE_SIZE
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    rooms_qs = _open_rooms_queryset(request.user)
+    if min_bet is not None:
+        rooms_qs = rooms_qs.filter(bet_amount__gte=min_bet)
+    if max_bet is not None:
+        rooms_qs = rooms_qs.filter(bet_amount__lte=max_bet)
+    if max_players is not None:
+        rooms_qs = rooms_qs.filter(max_players=max_players)
+    if open_seats:
+        rooms_qs = rooms_qs.filter(players_count__lte=models.F('max_players') - open_seats)
+
+    rooms, next_cursor = paginate_keyset(
+        rooms_qs,
+        ordering,
+        request.GET.get('cursor'),
+        max(1, min(limit, SEARCH_PAGE_SIZE_MAX)),
+        _room_cursor_key(ordering),
+    )
+
+    return JsonResponse({
+        'success': True,
+        'rooms': [
+            {
+                'id': room.id,
+                'name': room.name,
+                'creator_username': room.creator.username,
+                'creator_rating': round(room.creator.rating),
+                'players_count': room.players_count,
+                'max_players': room.max_players,
+                'bet_amount': room.bet_amount,
+                'created_at': room.created_at.isoformat(),
+            }
+            for room in rooms
+        ],
+        'next_cursor': next_cursor,
+        'poll_after': loop_lag.lobby_poll_seconds(),
+    })
+
+
+def _overloaded_response(request):
+    """Отказ во входе в комнату, пока воркер сбрасывает нагрузку (game.loop_lag)."""
+    retry_after = loop_lag.retry_after()
+    error = 'Сервер перегружен, попробуйте через несколько секунд.'
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        response = JsonResponse({'success': False, 'error': error, 'retry_after': retry_after}, status=503)
+    else:
+        messages.error(request, error)
+        response = redirect('game:lobby')
+    response['Retry-After'] = str(retry_after)
+    return response
+
 
 @login_required
 def create_room(request):
     if request.method == 'POST':
+        if loop_lag.shed('create_room', loop_lag.TIER_REJECT):
+            return _overloaded_response(request)
         form = CreateRoomForm(request.POST)
         if form.is_valid():
             max_players = form.cleaned_data['max_players']
@@ -79,6 +258,7 @@ def create_room(request):
                         is_active=True
                     )
                     
+                    transaction.on_commit(lambda: broadcast_room_events([lobby_event(room.id, room.status)]))
                     messages.success(request, f'Комната "{room.name}" успешно создана!')
                     return redirect('game:game_room', room_id=room.id)
             except Exception as e:
@@ -104,10 +284,13 @@ def create_room(request):
 
 @login_required
 @transaction.atomic
+@query_budget(28)
 def join_game(request, game_id):
     if request.method != 'POST':
         messages.error(request, "Неверный метод запроса для присоединения к игре.")
         return redirect('game:lobby')
+    if loop_lag.shed('join_game', loop_lag.TIER_REJECT):
+        return _overloaded_response(request)
 
     room = get_object_or_404(GameRoom, id=game_id)
     user = request.user
@@ -116,11 +299,12 @@ def join_game(request, game_id):
         messages.error(request, 'Игра уже началась или завершена.')
         return redirect('game:lobby')
         
-    if user in room.players.all():
+    if room.players.filter(id=user.id).exists():
         messages.info(request, 'Вы уже находитесь в этой комнате.')
         return redirect('game:game_room', room_id=room.id)
         
-    if room.players.count() >= room.max_players:
+    players_count = room.players.count()
+    if players_count >= room.max_players:
         messages.error(request, 'Комната заполнена.')
         return redirect('game:lobby')
         
@@ -144,7 +328,7 @@ def join_game(request, game_id):
         messages.success(request, f'Вы успешно присоединились к комнате "{room.name}"!')
         
         game_started_auto = False
-        if room.players.count() >= room.max_players:
+        if players_count + 1 >= room.max_players:
             # room.start_game() is a method on GameRoom model
             # It should handle DurakGame initialization and card dealing.
             if room.start_game(): 
@@ -155,6 +339,12 @@ def join_game(request, game_id):
                 # or some other internal error during game setup.
                 messages.error(request, "Не удалось автоматически начать игру, хотя комната заполнена.")
         
+        events = [room_event(room.id, {'action': 'player_joined', 'player': {'id': user.id, 'username': user.username}})]
+        if game_started_auto:
+            events.append(room_event(room.id, {'action': 'game_started', 'room_id': room.id}))
+        events.append(lobby_event(room.id, GameRoom.STATUS_PLAYING if game_started_auto else GameRoom.STATUS_WAITING))
+        transaction.on_commit(lambda: broadcast_room_events(events))
+
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({
                 'success': True,
@@ -172,6 +362,7 @@ def join_game(request, game_id):
 
 
 @login_required
+@query_budget(10)
 def game_room(request, room_id):
     try:
         room = GameRoom.objects.select_related('creator').prefetch_related('players').get(id=room_id)
@@ -195,7 +386,7 @@ def game_room(request, room_id):
     try:
         # DurakGame constructor will load existing game state if Game model exists for this room,
         # or will be in a pre-initialized state if not (e.g., waiting for start).
-        game_instance_logic = DurakGame(room)
+        game_instance_logic = DurakGame(room, players=sorted(room.players.all(), key=lambda p: p.id))
         game_state_for_template = game_instance_logic.get_game_state(for_player_user_obj=request.user)
     except Exception as e:
         logger.error(f"Ошибка при инициализации/загрузке DurakGame для комнаты {room.id}: {e}")
@@ -220,9 +411,10 @@ def game_room(request, room_id):
 
 @login_required
 @require_POST
+@query_budget(24)
 def start_game(request, room_id):
     room = get_object_or_404(GameRoom, id=room_id)
-    if request.user != room.creator:
+    if request.user.id != room.creator_id:
         return JsonResponse({'success': False, 'error': 'Только создатель может начать игру.'}, status=403)
     
     if room.status != GameRoom.STATUS_WAITING:
@@ -232,6 +424,10 @@ def start_game(request, room_id):
         return JsonResponse({'success': False, 'error': f'Недостаточно игроков (минимум {getattr(room, "min_players_for_start", 2)}).'})
     
     if room.start_game():
+        broadcast_room_events([
+            room_event(room.id, {'action': 'game_started', 'room_id': room.id}),
+            lobby_event(room.id, GameRoom.STATUS_PLAYING),
+        ])
         return JsonResponse({'success': True, 'message': 'Игра успешно начата!'})
     else:
         return JsonResponse({'success': False, 'error': 'Не удалось начать игру. Проверьте логи сервера.'})
@@ -240,11 +436,12 @@ def start_game(request, room_id):
 @login_required
 @require_POST
 @transaction.atomic
+@query_budget(16)
 def leave_room(request, room_id):
     room = get_object_or_404(GameRoom, id=room_id)
     user = request.user
     
-    if user not in room.players.all():
+    if not room.players.filter(id=user.id).exists():
         return JsonResponse({'success': False, 'error': 'Вы не в этой комнате.'}, status=403)
     
     try:
@@ -255,7 +452,7 @@ def leave_room(request, room_id):
             returned_bet = True
         
         room.players.remove(user)
-        if user.current_room == room:
+        if user.current_room_id == room.id:
             user.current_room = None
             user.save(update_fields=['current_room'])
 
@@ -266,7 +463,7 @@ def leave_room(request, room_id):
             message += " Ваша ставка возвращена."
 
         room_canceled_by_leave = False
-        if user == room.creator:
+        if user.id == room.creator_id:
             if hasattr(room, 'cancel_game'): # Assumes cancel_game method on GameRoom model
                 room.cancel_game() 
                 room_canceled_by_leave = True
@@ -302,6 +499,11 @@ def leave_room(request, room_id):
             # Example: game_logic = DurakGame(room); game_logic.handle_player_quit(user);
             pass # Placeholder for more complex logic
 
+        left_event = room_event(room.id, {'action': 'player_left', 'player': {'id': user.id, 'username': user.username}, 'room_canceled': room_canceled_by_leave})
+        room_status_event = lobby_event(room.id, room.status)
+        transaction.on_commit(lambda: broadcast_room_events([left_event, room_status_event]))
+        transaction.on_commit(lambda: sharding.invalidate_room(room.id))
+
         return JsonResponse({'success': True, 'message': message, 'room_canceled': room_canceled_by_leave})
     
     except Exception as e:
@@ -312,10 +514,11 @@ def leave_room(request, room_id):
 @login_required
 @require_POST
 @transaction.atomic
+@query_budget(24)
 def end_game(request, room_id):
     room = get_object_or_404(GameRoom, id=room_id)
     
-    if not (request.user == room.creator or request.user.is_staff):
+    if not (request.user.id == room.creator_id or request.user.is_staff):
         return JsonResponse({'success': False, 'error': 'У вас нет прав для завершения этой игры.'}, status=403)
     
     if room.status != GameRoom.STATUS_PLAYING:
@@ -341,7 +544,7 @@ def end_game(request, room_id):
             # Pot distribution logic would be here if not in model method
             room.save()
 
-        # Optionally, send a WebSocket message about game end
+        transaction.on_commit(lambda: sharding.invalidate_room(room.id))
         return JsonResponse({
             'success': True,
             'message': f'Игра в комнате "{room.name}" завершена.',
@@ -353,116 +556,49 @@ def end_game(request, room_id):
 
 
 @login_required
+@read_from_replica
+@query_budget(4)
 def game_status(request, room_id):
-    try:
-        room = GameRoom.objects.select_related('creator').prefetch_related('players').get(id=room_id)
-    except GameRoom.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Комната не найдена.'}, status=404)
+    payload, status = sharding.dispatch_sync('status', room_id, request.user)
+    return JsonResponse(payload, status=status)
 
-    if request.user not in room.players.all():
-        return JsonResponse({'success': False, 'error': 'Вы не участник этой игры.'}, status=403)
-    
-    game_state_data = None
-    try:
-        # DurakGame constructor handles loading or pre-init state.
-        game_logic = DurakGame(room)
-        game_state_data = game_logic.get_game_state(for_player_user_obj=request.user)
-            
-    except Exception as e:
-        logger.error(f"Ошибка при получении статуса игры для комнаты {room.id}: {e}")
-        return JsonResponse({'success': False, 'error': 'Ошибка при получении состояния игры.'}, status=500)
-            
-    return JsonResponse({'success': True, 'game_state': game_state_data})
+
+@login_required
+@read_from_replica
+@query_budget(4)
+def spectate_view(request, room_id):
+    """Публичное состояние партии для зрителей — та же строка, что уходит в WebSocket."""
+    if not spectators.is_enabled():
+        return JsonResponse({'success': False, 'error': 'Режим зрителя отключен.'}, status=404)
+    if spectators.delay_seconds() > 0:
+        return JsonResponse({'success': False, 'error': 'Трансляция с задержкой доступна только через WebSocket.'}, status=403)
+    frame = spectators.current_frame(room_id)
+    if frame is None:
+        return JsonResponse({'success': False, 'error': 'Комната не найдена'}, status=404)
+    return HttpResponse(frame['text'], content_type='application/json')
 
 
 @login_required
 @require_POST
-@transaction.atomic
+@query_budget(24)
 def make_move_view(request, room_id):
-    room = get_object_or_404(GameRoom, id=room_id)
-    user = request.user
-
-    if user not in room.players.all():
-        return JsonResponse({'success': False, 'error': 'Вы не являетесь участником этой игры.'}, status=403)
-
-    if room.status != GameRoom.STATUS_PLAYING:
-        return JsonResponse({'success': False, 'error': 'Игра не активна.'}, status=400)
-
+    # Транзакция открывается в services.perform_move на воркере-владельце комнаты
     try:
         data = json.loads(request.body)
-        action_type = data.get('action_type')
-        
-        game_logic = DurakGame(room)
-
-        if not game_logic.game_model_instance:
-             logger.warning(f"make_move_view: Game model instance for room {room.id} not found/initialized in DurakGame.")
-             return JsonResponse({'success': False, 'error': 'Состояние игры не найдено или не инициализировано в DurakGame.'}, status=500)
-
-        response_data = {'success': False, 'message': 'Неизвестное действие или ошибка.'}
-
-        if action_type == 'play_card':
-            card_hand_index_str = data.get('card_hand_index')
-            if card_hand_index_str is None:
-                return JsonResponse({'success': False, 'error': 'Не указан индекс карты для хода.'}, status=400)
-            try:
-                card_hand_index = int(card_hand_index_str)
-            except ValueError:
-                 return JsonResponse({'success': False, 'error': 'Индекс карты должен быть числом.'}, status=400)
-            
-            result = game_logic.play_card(user, card_hand_index)
-            response_data.update(result)
-        
-        elif action_type == 'attack':
-            card_indices_str = data.get('card_indices') 
-            if card_indices_str is None or not isinstance(card_indices_str, list):
-                return JsonResponse({'success': False, 'error': 'Не указаны карты для атаки (ожидался список).'}, status=400)
-            
-            try:
-                card_indices = [int(idx) for idx in card_indices_str]
-                if not card_indices:
-                    return JsonResponse({'success': False, 'error': 'Список карт для атаки пуст.'}, status=400)
-                result = game_logic.attack(user, card_indices[0])
-            except ValueError:
-                return JsonResponse({'success': False, 'error': 'Индексы карт должны быть числами.'}, status=400)
-            response_data.update(result)
-
-        elif action_type == 'defend':
-            attack_card_table_index_str = data.get('attack_card_table_index')
-            defense_card_hand_index_str = data.get('defense_card_hand_index')
-            if attack_card_table_index_str is None or defense_card_hand_index_str is None:
-                 return JsonResponse({'success': False, 'error': 'Не указаны карты для защиты.'}, status=400)
-            try:
-                attack_card_table_index = int(attack_card_table_index_str)
-                defense_card_hand_index = int(defense_card_hand_index_str)
-            except ValueError:
-                return JsonResponse({'success': False, 'error': 'Индексы карт должны быть числами.'}, status=400)
-
-            result = game_logic.defend(user, attack_card_table_index, defense_card_hand_index)
-            response_data.update(result)
-
-        elif action_type == 'pass_bito':
-            result = game_logic.pass_or_bito_action(user)
-            response_data.update(result)
-            
-        elif action_type == 'take':
-            result = game_logic.take_cards_action(user)
-            response_data.update(result)
-        else:
-            logger.warning(f"Неизвестный action_type '{action_type}' от пользователя {user.username} в комнате {room_id}")
-            return JsonResponse({'success': False, 'error': 'Неизвестный тип действия.'}, status=400)
-
-        return JsonResponse(response_data)
-
     except json.JSONDecodeError:
         logger.warning(f"Ошибка JSONDecodeError в make_move_view для комнаты {room_id}", exc_info=True)
         return JsonResponse({'success': False, 'error': 'Некорректный JSON в теле запроса.'}, status=400)
-    except Exception as e:
-        logger.error(f"Ошибка при обработке хода в комнате {room_id} игроком {user.username}: {e}", exc_info=True)
-        return JsonResponse({'success': False, 'error': 'Внутренняя ошибка сервера при обработке хода.'}, status=500)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'error': 'Некорректный JSON в теле запроса.'}, status=400)
+
+    payload, status = sharding.dispatch_sync('move', room_id, request.user, data)
+    return JsonResponse(payload, status=status)
 
 @login_required
 @require_POST
+@query_budget(7)
 def ping(request, room_id):
+    phases = metrics.PhaseTimer(metrics.PHASE_SECONDS, 'ping')
     try:
         room = GameRoom.objects.get(id=room_id)
     except GameRoom.DoesNotExist:
@@ -470,11 +606,70 @@ def ping(request, room_id):
 
     if not room.players.filter(id=request.user.id).exists():
         return JsonResponse({'success': False, 'error': 'Вы не участник этой комнаты.'}, status=403) 
+    phases.mark('load')
     
     PlayerActivity.objects.update_or_create(
         player=request.user,
         room_id=room_id,
         defaults={'is_active': True, 'last_ping': timezone.now()}
     )
+    phases.mark('update')
+
+    response = JsonResponse({'success': True, 'message': 'Ping successful'})
+    phases.mark('respond')
+    return response
+
+
+def _leaderboard_row(entry, rank):
+    return {
+        'rank': rank,
+        'player_id': entry.player_id,
+        'username': entry.player.username,
+        'score': entry.score,
+        'win_rate': round(entry.win_rate, 2),
+        'games_played': entry.games_played,
+        'games_won': entry.games_won,
+    }
+
+
+@login_required
+@read_from_replica
+@query_budget(2)
+def leaderboard_view(request):
+    """Страница таблицы лидеров (keyset-пагинация по индексу leaderboard_rank_idx)."""
+    try:
+        limit = _parse_int_param(request.GET, 'limit') or LOBBY_PAGE_SIZE
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    cursor = request.GET.get('cursor')
+    entries, next_cursor = paginate_keyset(
+        LeaderboardEntry.objects.select_related('player'),
+        leaderboard.LEADERBOARD_ORDERING,
+        cursor,
+        max(1, min(limit, SEARCH_PAGE_SIZE_MAX)),
+        leaderboard.entry_key,
+    )
+
+    first_rank = 1
+    if cursor and entries:
+        first_rank = leaderboard.rank_of(entries[0])
+
+    return JsonResponse({
+        'success': True,
+        'entries': [_leaderboard_row(e, first_rank + i) for i, e in enumerate(entries)],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+@read_from_replica
+@query_budget(3)
+def leaderboard_me(request):
+    """Место текущего игрока в таблице лидеров."""
+    try:
+        entry = LeaderboardEntry.objects.select_related('player').get(player=request.user)
+    except LeaderboardEntry.DoesNotExist:
+        return JsonResponse({'success': True, 'entry': None, 'message': 'Вы еще не сыграли ни одной партии.'})
 
-    return JsonResponse({'success': True, 'message': 'Ping successful'})
\ No newline at end of file
+    return JsonResponse({'success': True, 'entry': _leaderboard_row(entry, leaderboard.rank_of(entry))})
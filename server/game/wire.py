@@ -0,0 +1,161 @@
+"""
+Формат WebSocket-кадров: JSON (по умолчанию) или MessagePack.
+
+Клиент выбирает формат подпротоколом при подключении:
+    new WebSocket(url, ['durak.msgpack.v1', 'durak.json'])
+Если msgpack не установлен или клиент его не предложил, соединение
+остается на JSON-тексте, как раньше.
+
+В durak.msgpack.v1 сообщение — тот же словарь, но:
+  * известные ключи заменены короткими тегами (FIELD_TAGS), остальные
+    передаются как есть;
+  * карта ({'rank', 'suit', ...}) передается целым числом
+    suit_index * len(CARD_RANKS) + rank_index. id и image_url карты
+    восстанавливаются по масти и достоинству, hand_index — позиция в списке.
+Входящие бинарные кадры декодируются обратно в обычные словари, так что
+обработчики consumer-ов не знают о формате.
+"""
+import json
+import typing
+
+from django.conf import settings
+
+from . import metrics
+
+try:
+    import msgpack
+except ImportError:  # идет с channels_redis; без него доступен только JSON
+    msgpack = None
+
+SUBPROTOCOL_JSON = 'durak.json'
+SUBPROTOCOL_MSGPACK = 'durak.msgpack.v1'
+
+CARD_SUITS = ('hearts', 'diamonds', 'clubs', 'spades')
+CARD_RANKS = ('6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+_SUIT_INDEX = {suit: i for i, suit in enumerate(CARD_SUITS)}
+_RANK_INDEX = {rank: i for i, rank in enumerate(CARD_RANKS)}
+
+FIELD_TAGS = {
+    'action': 'a',
+    'action_type': 'y',
+    'seq': 'q',
+    'room_id': 'r',
+    'status': 's',
+    'success': 'k',
+    'message': 'm',
+    'error': 'e',
+    'version': 'v',
+    'player': 'pl',
+    'game_state': 'g',
+    'players': 'p',
+    'id': 'i',
+    'username': 'u',
+    'card_count': 'n',
+    'is_current_player_for_state': 'me',
+    'cards': 'c',
+    'attacker_id': 'ai',
+    'defender_id': 'di',
+    'attacker_username': 'au',
+    'defender_username': 'du',
+    'trump_suit': 'ts',
+    'trump_card_revealed': 'tc',
+    'deck_count': 'dc',
+    'table': 't',
+    'attack_card': 'ac',
+    'defense_card': 'dd',
+    'winner_username': 'wu',
+    'is_game_over': 'go',
+    'game_over_message': 'gm',
+    'is_game_initialized': 'gi',
+    'card_hand_index': 'h',
+    'card_indices': 'hs',
+    'attack_card_table_index': 'ti',
+    'defense_card_hand_index': 'dh',
+    'card_id': 'ci',
+    'card_ids': 'cs',
+    'attack_card_id': 'ati',
+    'defense_card_id': 'dci',
+    'action_id': 'x',
+    'duplicate': 'dup',
+}
+_FIELD_NAMES = {tag: name for name, tag in FIELD_TAGS.items()}
+assert len(_FIELD_NAMES) == len(FIELD_TAGS), 'FIELD_TAGS: теги должны быть уникальны'
+
+WS_FRAME_BYTES = metrics.histogram(
+    'durak_ws_frame_bytes',
+    'Encoded outbound WebSocket frame size by protocol.',
+    ('protocol',),
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+
+
+def card_id(card: dict) -> typing.Optional[int]:
+    suit = _SUIT_INDEX.get(card.get('suit'))
+    rank = _RANK_INDEX.get(card.get('rank'))
+    if suit is None or rank is None:
+        return None
+    return suit * len(CARD_RANKS) + rank
+
+
+def _compact(value):
+    if isinstance(value, dict):
+        if 'suit' in value and 'rank' in value:
+            packed = card_id(value)
+            if packed is not None:
+                return packed
+        return {FIELD_TAGS.get(key, key): _compact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(item) for item in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        return {_FIELD_NAMES.get(key, key): _expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+class JsonCodec:
+    subprotocol = None
+    label = 'json'
+
+    def encode(self, message: dict) -> str:
+        text = json.dumps(message)
+        WS_FRAME_BYTES.labels(self.label).observe(len(text))
+        return text
+
+
+class MsgpackCodec:
+    subprotocol = SUBPROTOCOL_MSGPACK
+    label = 'msgpack'
+
+    def encode(self, message: dict) -> bytes:
+        data = msgpack.packb(_compact(message), use_bin_type=True)
+        WS_FRAME_BYTES.labels(self.label).observe(len(data))
+        return data
+
+
+def negotiate(scope) -> typing.Union[JsonCodec, MsgpackCodec]:
+    """Кодек по списку подпротоколов клиента; subprotocol кодека передается в accept()."""
+    offered = scope.get('subprotocols') or []
+    if SUBPROTOCOL_MSGPACK in offered and msgpack is not None and getattr(settings, 'WS_MSGPACK_ENABLED', True):
+        return MsgpackCodec()
+    codec = JsonCodec()
+    if SUBPROTOCOL_JSON in offered:
+        # Клиент явно просил JSON — подтверждаем, иначе браузер закроет соединение
+        codec.subprotocol = SUBPROTOCOL_JSON
+    return codec
+
+
+def decode(text_data=None, bytes_data=None) -> dict:
+    """Входящий кадр: текст — JSON, бинарный — durak.msgpack.v1."""
+    if text_data is not None:
+        return json.loads(text_data)
+    if msgpack is None:
+        raise ValueError('Бинарные кадры не поддерживаются: msgpack не установлен.')
+    message = msgpack.unpackb(bytes_data, raw=False)
+    if not isinstance(message, dict):
+        raise ValueError('Ожидался словарь.')
+    return _expand(message)
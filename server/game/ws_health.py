@@ -0,0 +1,164 @@
+"""
+Здоровье WebSocket-соединений и channel layer.
+
+Считает открытые соединения (по процессу и по комнате), входящие и
+исходящие сообщения, ошибки отправки, размер рассылки в группу, глубину
+очередей каналов и сообщения, потерянные из-за переполнения канала.
+
+Глубина очередей и потери видны только у InMemoryChannelLayer: он молча
+выбрасывает сообщение group_send, если очередь канала заполнена (capacity).
+Перед рассылкой мы проверяем очереди получателей и засчитываем такие
+потери, а медленных потребителей (очередь заполнена больше чем на
+SLOW_CONSUMER_QUEUE_RATIO) пишем в лог. Для Redis-слоя размер группы и
+очереди без дополнительных запросов к Redis неизвестны — эти метрики
+остаются пустыми.
+"""
+import logging
+import time
+import weakref
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Не чаще одного предупреждения о медленном канале за столько секунд
+SLOW_CONSUMER_WARN_INTERVAL = 30
+
+WS_CONNECTIONS = metrics.gauge(
+    'durak_ws_connections',
+    'Open WebSocket connections in this worker.',
+    ('consumer',),
+)
+ROOM_CONNECTIONS = metrics.gauge(
+    'durak_room_ws_connections',
+    'Open WebSocket connections per room in this worker.',
+    ('room',),
+)
+WS_MESSAGES_RECEIVED = metrics.counter(
+    'durak_ws_messages_received',
+    'Inbound WebSocket messages.',
+    ('consumer',),
+)
+WS_MESSAGES_SENT = metrics.counter(
+    'durak_ws_messages_sent',
+    'Outbound WebSocket messages.',
+    ('consumer',),
+)
+WS_SEND_FAILURES = metrics.counter(
+    'durak_ws_send_failures',
+    'Outbound WebSocket messages that failed to send.',
+    ('consumer',),
+)
+GROUP_FANOUT = metrics.histogram(
+    'durak_group_fanout_size',
+    'Number of channels in a group at group_send (in-memory layer only).',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+CHANNEL_DROPPED = metrics.counter(
+    'durak_channel_dropped_messages',
+    'Group messages dropped because the receiving channel was full (in-memory layer only).',
+)
+
+
+def _queue_depths():
+    from channels.layers import get_channel_layer
+    channels = getattr(get_channel_layer(), 'channels', None)
+    if channels is None:
+        return {}
+    depths = [queue.qsize() for queue in list(channels.values())]
+    return {('max',): max(depths, default=0), ('total',): sum(depths), ('channels',): len(depths)}
+
+
+CHANNEL_QUEUE_DEPTH = metrics.gauge(
+    'durak_channel_queue_depth',
+    'Queued channel layer messages in this worker: max per channel, total, channel count (in-memory layer only).',
+    ('stat',),
+    callback=_queue_depths,
+)
+
+_room_counts: dict[str, int] = {}
+_room_consumers: dict[str, weakref.WeakSet] = {}
+_last_slow_warning: dict[str, float] = {}
+
+
+def connection_opened(consumer: str, room_id, instance=None):
+    WS_CONNECTIONS.labels(consumer).inc()
+    if room_id is None:
+        # Соединение без комнаты (мультиплексор game.consumers.MuxConsumer)
+        return
+    room = str(room_id)
+    _room_counts[room] = _room_counts.get(room, 0) + 1
+    ROOM_CONNECTIONS.labels(room).set(_room_counts[room])
+    if instance is not None:
+        _room_consumers.setdefault(room, weakref.WeakSet()).add(instance)
+
+
+def connection_closed(consumer: str, room_id, instance=None):
+    WS_CONNECTIONS.labels(consumer).dec()
+    if room_id is None:
+        return
+    room = str(room_id)
+    consumers = _room_consumers.get(room)
+    if consumers is not None:
+        consumers.discard(instance)
+        if not consumers:
+            del _room_consumers[room]
+    count = _room_counts.get(room, 0) - 1
+    if count > 0:
+        _room_counts[room] = count
+        ROOM_CONNECTIONS.labels(room).set(count)
+    else:
+        # Закрытые комнаты не копят серии в /metrics
+        _room_counts.pop(room, None)
+        ROOM_CONNECTIONS.remove(room)
+
+
+def live_consumers() -> dict[str, list]:
+    """Подключенные consumer-ы по комнатам (для game.memory)."""
+    return {room: list(consumers) for room, consumers in list(_room_consumers.items()) if consumers}
+
+
+def message_received(consumer: str):
+    WS_MESSAGES_RECEIVED.labels(consumer).inc()
+
+
+def message_sent(consumer: str):
+    WS_MESSAGES_SENT.labels(consumer).inc()
+
+
+def send_failed(consumer: str, error: Exception):
+    WS_SEND_FAILURES.labels(consumer).inc()
+    logger.warning(f"WebSocket send failed in {consumer} consumer: {error!r}")
+
+
+def before_group_send(layer, group: str):
+    """Размер рассылки и будущие потери (для InMemoryChannelLayer) перед group_send."""
+    groups = getattr(layer, 'groups', None)
+    channels = getattr(layer, 'channels', None)
+    if groups is None or channels is None:
+        return
+    members = list(groups.get(group, ()))
+    GROUP_FANOUT.observe(len(members))
+
+    ratio = getattr(settings, 'SLOW_CONSUMER_QUEUE_RATIO', 0.5)
+    for channel in members:
+        queue = channels.get(channel)
+        if queue is None or not queue.maxsize:
+            continue
+        depth = queue.qsize()
+        if depth >= queue.maxsize:
+            CHANNEL_DROPPED.inc()
+        if depth >= queue.maxsize * ratio:
+            _warn_slow_consumer(channel, group, depth, queue.maxsize)
+
+
+def _warn_slow_consumer(channel, group, depth, capacity):
+    now = time.monotonic()
+    if now - _last_slow_warning.get(channel, 0) < SLOW_CONSUMER_WARN_INTERVAL:
+        return
+    _last_slow_warning[channel] = now
+    if len(_last_slow_warning) > 10000:
+        _last_slow_warning.clear()
+    logger.warning(f"Slow consumer {channel} in {group}: {depth}/{capacity} messages queued")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('players', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='rating',
+            field=models.FloatField(default=1500.0, help_text='Рейтинг силы игрока (Elo), см. game.rating'),
+        ),
+    ]
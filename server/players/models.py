@@ -13,19 +13,28 @@ class Player(AbstractUser):
 
     games_played = models.IntegerField(default=0)
     games_won = models.IntegerField(default=0)
+    rating = models.FloatField(default=1500.0, help_text="Рейтинг силы игрока (Elo), см. game.rating")
 
     def __str__(self):
         return self.username
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Отложенные поля читаются одним запросом при первом обращении к любому
+        # из них, а не запросом на поле (пользователь из server.auth_cache)
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
     @property
     def win_rate(self):
         return (self.games_won / self.games_played * 100) if self.games_played > 0 else 0
 
     def join_room(self, room):
-        if self.current_room and self.current_room != room:
+        if self.current_room_id and self.current_room_id != room.id:
             return False, "Вы уже в другой комнате."
 
-        if self.current_room == room:
+        if self.current_room_id == room.id:
             return True, "Вы уже в этой комнате."
 
         if room.players.count() >= room.max_players:
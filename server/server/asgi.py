@@ -1,18 +1,21 @@
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import game.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 django_asgi_app = get_asgi_application()
 
-application = ProtocolTypeRouter({
+# Модули приложений импортируются только после инициализации Django
+import game.routing  # noqa: E402
+from game.sharding import ShardingMiddleware  # noqa: E402
+from server.auth_cache import CachedAuthMiddlewareStack  # noqa: E402
+
+application = ShardingMiddleware(ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": AuthMiddlewareStack(
+    "websocket": CachedAuthMiddlewareStack(
         URLRouter(
             game.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+}))
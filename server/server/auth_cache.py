@@ -0,0 +1,197 @@
+"""
+Кэш определения пользователя по сессии для HTTP и WebSocket.
+
+Обычный путь — чтение сессии из БД (django_session) и загрузка строки
+Player — стоит двух запросов на каждый опрос game_status, ping и каждое
+подключение WebSocket. Здесь результат кэшируется в памяти процесса:
+ключ сессии -> id и поля, нужные для проверок доступа (CACHED_FIELDS).
+
+Пользователь собирается из кэша без запросов. Остальные поля (cash,
+current_room, rating, ...) остаются отложенными (deferred) и читаются из БД
+одним запросом при первом обращении к любому из них (Player.refresh_from_db),
+поэтому баланс и текущая комната никогда не бывают устаревшими —
+представления, которые их меняют, работают со свежими значениями.
+
+Запись живет AUTH_CACHE_TTL секунд. Сброс: выход из системы
+(user_logged_out), сохранение пользователя с изменением полей доступа или
+пароля, удаление пользователя. Другие процессы узнают об изменениях не
+позже чем через TTL — это предел, на который выход или блокировка
+пользователя могут запаздывать на соседнем воркере.
+
+Сессия при попадании в кэш не читается вовсе; если представление само
+обращается к request.session, она загружается как обычно.
+"""
+import collections
+import functools
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from channels.auth import AuthMiddleware, get_user as channels_get_user
+from channels.sessions import CookieMiddleware, SessionMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user as django_get_user, get_user_model, user_logged_out
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import SimpleLazyObject
+
+from game import metrics
+
+# Поля пользователя, нужные для аутентификации и проверок доступа
+CACHED_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+# Изменение этих полей сбрасывает кэш пользователя
+AUTH_FIELDS = frozenset(CACHED_FIELDS) | {'password'}
+
+AUTH_CACHE_LOOKUPS = metrics.counter(
+    'durak_auth_cache_lookups',
+    'Session to user resolutions by cache result.',
+    ('transport', 'result'),
+)
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'AUTH_CACHE_TTL', 30) > 0
+
+
+class SessionUserCache:
+    """LRU: ключ сессии -> (срок, {поле: значение}); индекс по id пользователя для сброса."""
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries: collections.OrderedDict[str, tuple] = collections.OrderedDict()
+        self._keys_by_user: dict[int, set] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_key):
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                self._drop(session_key)
+                return None
+            self._entries.move_to_end(session_key)
+            return values
+
+    def put(self, session_key, user):
+        values = {field: getattr(user, field) for field in CACHED_FIELDS}
+        with self._lock:
+            self._drop(session_key)
+            self._entries[session_key] = (time.monotonic() + getattr(settings, 'AUTH_CACHE_TTL', 30), values)
+            self._keys_by_user.setdefault(user.pk, set()).add(session_key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, session_key):
+        entry = self._entries.pop(session_key, None)
+        if entry is not None:
+            user_id = entry[1]['id']
+            keys = self._keys_by_user.get(user_id)
+            if keys is not None:
+                keys.discard(session_key)
+                if not keys:
+                    del self._keys_by_user[user_id]
+
+    def invalidate_session(self, session_key):
+        with self._lock:
+            self._drop(session_key)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for session_key in list(self._keys_by_user.get(user_id, ())):
+                self._drop(session_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+
+sessions = SessionUserCache(getattr(settings, 'AUTH_CACHE_MAX_ENTRIES', 50000))
+
+
+def _build_user(values: dict):
+    """Пользователь из кэша: CACHED_FIELDS заполнены, остальные поля отложены."""
+    model = get_user_model()
+    # from_db ждет значения в порядке полей модели
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db('default', names, [values[name] for name in names])
+
+
+def resolve(session_key, load_user, transport: str):
+    """Пользователь по ключу сессии; load_user() — обычный путь через БД при промахе."""
+    if not session_key or not is_enabled():
+        return load_user()
+    values = sessions.get(session_key)
+    if values is not None:
+        AUTH_CACHE_LOOKUPS.labels(transport, 'hit').inc()
+        return _build_user(values)
+    AUTH_CACHE_LOOKUPS.labels(transport, 'miss').inc()
+    user = load_user()
+    # Анонимов не кэшируем: вход сменит ключ сессии, а пустых ключей слишком много
+    if user.is_authenticated:
+        sessions.put(session_key, user)
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware с кэшем сессий (подкласс — для проверок admin)."""
+
+    def process_request(self, request):
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        request.user = SimpleLazyObject(lambda: resolve(session_key, lambda: django_get_user(request), 'http'))
+        request.auser = functools.partial(_auser, request, session_key)
+
+
+async def _auser(request, session_key):
+    """request.auser() для асинхронных представлений — через тот же кэш."""
+    if not hasattr(request, '_acached_user'):
+        request._acached_user = await sync_to_async(resolve)(session_key, lambda: django_get_user(request), 'http')
+    return request._acached_user
+
+
+class CachedAuthMiddleware(AuthMiddleware):
+    """AuthMiddleware из channels, который сначала смотрит в кэш сессий."""
+
+    async def resolve_scope(self, scope):
+        session_key = scope['session'].session_key
+        values = sessions.get(session_key) if session_key and is_enabled() else None
+        if values is not None:
+            AUTH_CACHE_LOOKUPS.labels('ws', 'hit').inc()
+            scope['user']._wrapped = _build_user(values)
+            return
+
+        user = await channels_get_user(scope)
+        if session_key and is_enabled():
+            AUTH_CACHE_LOOKUPS.labels('ws', 'miss').inc()
+            if user.is_authenticated:
+                sessions.put(session_key, user)
+        scope['user']._wrapped = user
+
+
+def CachedAuthMiddlewareStack(inner):
+    """Как channels.auth.AuthMiddlewareStack, но с CachedAuthMiddleware."""
+    return CookieMiddleware(SessionMiddleware(CachedAuthMiddleware(inner)))
+
+
+def _on_logout(sender, request, user, **kwargs):
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        sessions.invalidate_session(session.session_key)
+
+
+def _on_user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not AUTH_FIELDS.intersection(update_fields):
+        # Изменились только баланс, комната, статистика — они не кэшируются
+        return
+    sessions.invalidate_user(instance.pk)
+
+
+def _on_user_deleted(sender, instance, **kwargs):
+    sessions.invalidate_user(instance.pk)
+
+
+user_logged_out.connect(_on_logout, dispatch_uid='auth_cache_logout')
+post_save.connect(_on_user_saved, sender=settings.AUTH_USER_MODEL, dispatch_uid='auth_cache_user_saved')
+post_delete.connect(_on_user_deleted, sender=settings.AUTH_USER_MODEL, dispatch_uid='auth_cache_user_deleted')
@@ -0,0 +1,100 @@
+"""
+Маршрутизация чтений на реплики.
+
+Реплики перечислены в settings.DATABASE_REPLICAS (алиасы из DATABASES).
+По умолчанию все запросы идут в 'default'; на реплику попадают только
+чтения внутри представлений, помеченных @read_from_replica.
+
+Read-your-writes: если пользователь что-то записал (любая запись через
+роутер во время его запроса), он на DATABASE_REPLICA_PIN_SECONDS
+закрепляется за основной базой, чтобы сразу увидеть собственный ход.
+Метка хранится в кэше Django — для нескольких процессов нужен общий кэш
+(CACHE_BACKEND=redis, см. settings).
+"""
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+_read_alias: contextvars.ContextVar = contextvars.ContextVar('db_read_alias', default=None)
+_wrote: contextvars.ContextVar = contextvars.ContextVar('db_wrote', default=False)
+
+PIN_CACHE_KEY = 'db-primary-pin:{user_id}'
+
+
+def _pin_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5)
+
+
+def is_pinned_to_primary(user) -> bool:
+    if not user.is_authenticated:
+        return False
+    return cache.get(PIN_CACHE_KEY.format(user_id=user.pk)) is not None
+
+
+def pin_to_primary(user) -> None:
+    if user.is_authenticated:
+        cache.set(PIN_CACHE_KEY.format(user_id=user.pk), 1, _pin_seconds())
+
+
+def choose_replica():
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    return random.choice(replicas) if replicas else None
+
+
+def read_from_replica(view_func):
+    """
+    Помечает представление как только читающее: его ORM-чтения (включая
+    чтения сериализаторов и связанных менеджеров) уходят на реплику, если
+    пользователь не закреплен за основной базой.
+    """
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        alias = None
+        if request.method in ('GET', 'HEAD') and not is_pinned_to_primary(request.user):
+            alias = choose_replica()
+        if alias is None:
+            return view_func(request, *args, **kwargs)
+
+        token = _read_alias.set(alias)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class PrimaryPinMiddleware:
+    """Закрепляет пользователя за основной базой после запроса с записью."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if user is not None and (_wrote.get() or request.method not in ('GET', 'HEAD', 'OPTIONS')):
+                pin_to_primary(user)
+            return response
+        finally:
+            _wrote.reset(token)
@@ -0,0 +1,182 @@
+"""
+Логирование без блокировки горячего пути.
+
+AsyncQueueHandler подставляет %-аргументы и превращает трейсбек в текст
+сразу (изменяемые аргументы — состояние партии, словари — к моменту вывода
+могли бы уже поменяться), кладет запись в ограниченную очередь, а
+форматирование строки (JSON или текст) и запись в поток выполняет отдельный
+поток QueueListener. При переполнении очереди запись отбрасывается (а не ждет),
+число потерь выводится следующей записью.
+
+CorrelationFilter добавляет к записи request_id, room_id и move_id из
+contextvars (см. log_context и RequestIdMiddleware); asgiref копирует
+контекст в потоки sync_to_async, так что идентификаторы доходят до ORM-кода.
+
+SamplingFilter пропускает лишь долю записей ниже WARNING от частых логгеров
+(LOG_SAMPLING = {'game.game_logic': 0.1}); у пропущенных записей есть поле
+sample_rate, чтобы агрегатор мог восстановить количество.
+"""
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar('log_request_id', default=None)
+_room_id: contextvars.ContextVar = contextvars.ContextVar('log_room_id', default=None)
+_move_id: contextvars.ContextVar = contextvars.ContextVar('log_move_id', default=None)
+
+_CONTEXT_VARS = {'request_id': _request_id, 'room_id': _room_id, 'move_id': _move_id}
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """with log_context(room_id=..., move_id=...): — идентификаторы для всех записей блока."""
+    tokens = [(_CONTEXT_VARS[name], _CONTEXT_VARS[name].set(value)) for name, value in fields.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record):
+        for name, var in _CONTEXT_VARS.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates=None):
+        super().__init__()
+        # Самый длинный префикс имени логгера выигрывает
+        self.rates = sorted((rates or {}).items(), key=lambda item: -len(item[0]))
+
+    def _rate(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    FIELDS = ('request_id', 'room_id', 'move_id', 'sample_rate')
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _DropReportingHandler(logging.Handler):
+    """Цель QueueListener: пишет запись и сообщает о потерянных."""
+
+    def __init__(self, target: logging.Handler, owner: 'AsyncQueueHandler'):
+        super().__init__()
+        self.target = target
+        self.owner = owner
+
+    def handle(self, record):
+        dropped, self.owner.dropped = self.owner.dropped, 0
+        if dropped:
+            self.target.handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': '%d log records dropped: queue full', 'args': (dropped,),
+            }))
+        return self.target.handle(record)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Обработчик для LOGGING: {'()': 'server.logging_utils.AsyncQueueHandler',
+    'output': 'text' | 'json', 'queue_size': 10000}.
+    """
+
+    _exception_formatter = logging.Formatter()
+
+    def __init__(self, output='text', queue_size=10000, stream=None):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        # Фильтры обработчика выполняются в вызывающем потоке — там и читаем contextvars
+        self.addFilter(CorrelationFilter())
+        target = logging.StreamHandler(stream or sys.stderr)
+        if output == 'json':
+            target.setFormatter(JsonFormatter())
+        else:
+            target.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(room_id)s/%(move_id)s] %(message)s'))
+        self.listener = logging.handlers.QueueListener(self.queue, _DropReportingHandler(target, self))
+        self.listener.start()
+
+    def prepare(self, record):
+        # Как QueueHandler.prepare, но без форматирования строки: оно остается слушателю
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+class RequestIdMiddleware:
+    """request_id для логов: из заголовка X-Request-ID или новый; возвращается в ответе."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get('X-Request-ID') or new_id()
+        with log_context(request_id=request_id):
+            response = self.get_response(request)
+        response['X-Request-ID'] = request_id
+        return response
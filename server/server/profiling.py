@@ -0,0 +1,217 @@
+"""
+Профилирование отдельных запросов на живом трафике.
+
+ProfilingMiddleware и ProfiledConsumerMixin профилируют долю PROFILE_SAMPLE_RATE
+HTTP-запросов / WebSocket-сообщений, а также все запросы с заголовком
+X-Profile: <PROFILE_TOKEN> (или X-Profile от staff-пользователя). Пока
+профилирование не выбрано, цена — один вызов random.random().
+
+Режимы (PROFILE_MODE):
+  sample   — статистический: отдельный поток раз в PROFILE_INTERVAL секунд
+             снимает стек профилируемого потока (sys._current_frames) и пишет
+             collapsed stacks ("a;b;c 12") для flamegraph.pl / speedscope;
+  cprofile — детерминированный cProfile, файл .pstats для pstats/snakeviz.
+
+Результат сохраняется, только если запрос шел не меньше порога представления
+(PROFILE_THRESHOLDS по имени функции представления или классу consumer-а,
+иначе PROFILE_THRESHOLD_DEFAULT) — так ловятся выбросы хвоста задержек.
+Запросы по заголовку сохраняются всегда, имя файла возвращается в
+X-Profile-File. В PROFILE_DIR хранятся последние PROFILE_MAX_FILES файлов.
+
+В consumer-ах профилируется поток event loop целиком: пока обработчик ждет
+await, в профиль попадают и другие задачи этого цикла.
+"""
+import collections
+import cProfile
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+from .logging_utils import current_request_id
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+# Поток, в котором уже идет профилирование (вложенный cProfile заменил бы внешний)
+_active = threading.local()
+_rotate_lock = threading.Lock()
+
+
+class StackSampler:
+    """Статистический профилировщик одного потока с выводом collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class Profile:
+    """with Profile() as profile: ...; profile.save(name) — профиль текущего потока."""
+
+    def __init__(self, mode: str = None):
+        self.mode = mode or getattr(settings, 'PROFILE_MODE', 'sample')
+        self.duration = 0.0
+        self._profiler = None
+
+    def __enter__(self):
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = StackSampler(threading.get_ident(), getattr(settings, 'PROFILE_INTERVAL', 0.001))
+            self._profiler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self._started
+        if self.mode == 'cprofile':
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+        return False
+
+    def save(self, name: str) -> str:
+        directory = getattr(settings, 'PROFILE_DIR', 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        suffix = 'pstats' if self.mode == 'cprofile' else 'collapsed'
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{self.duration * 1000:.0f}ms-{current_request_id() or os.getpid()}.{suffix}"
+        path = os.path.join(directory, filename)
+        if self.mode == 'cprofile':
+            self._profiler.dump_stats(path)
+        else:
+            self._profiler.write(path)
+        _rotate(directory, getattr(settings, 'PROFILE_MAX_FILES', 200))
+        logger.info(f"Saved {self.mode} profile of {name} ({self.duration * 1000:.1f} ms) to {path}")
+        return filename
+
+
+def _rotate(directory, keep):
+    with _rotate_lock:
+        entries = sorted(os.scandir(directory), key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in entries[keep:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def threshold_for(name: str) -> float:
+    thresholds = getattr(settings, 'PROFILE_THRESHOLDS', {})
+    return thresholds.get(name, getattr(settings, 'PROFILE_THRESHOLD_DEFAULT', 0.0))
+
+
+def _authorized(header_value, user) -> bool:
+    if not header_value:
+        return False
+    token = getattr(settings, 'PROFILE_TOKEN', '')
+    if token and constant_time_compare(header_value, token):
+        return True
+    return bool(user is not None and getattr(user, 'is_staff', False))
+
+
+def _sampled() -> bool:
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def _begin() -> bool:
+    """Помечает поток как профилируемый; False, если профилирование в нем уже идет."""
+    if getattr(_active, 'on', False):
+        return False
+    _active.on = True
+    return True
+
+
+def _end():
+    _active.on = False
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        forced = _authorized(request.headers.get(PROFILE_HEADER), getattr(request, 'user', None))
+        if not (forced or _sampled()) or not _begin():
+            return self.get_response(request)
+
+        try:
+            with Profile() as profile:
+                response = self.get_response(request)
+        finally:
+            _end()
+
+        match = request.resolver_match
+        name = match.func.__name__ if match else 'unresolved'
+        if forced or profile.duration >= threshold_for(name):
+            filename = profile.save(name)
+            if forced:
+                response['X-Profile-File'] = filename
+        return response
+
+
+class ProfiledConsumerMixin:
+    """
+    Профилирование обработки входящих WebSocket-сообщений. Заголовок
+    X-Profile при подключении включает профилирование всех сообщений соединения.
+    """
+    _profile_forced = False
+
+    async def websocket_connect(self, message):
+        headers = dict(self.scope.get('headers', []))
+        header = headers.get(PROFILE_HEADER.lower().encode(), b'').decode('latin1')
+        self._profile_forced = _authorized(header, self.scope.get('user'))
+        await super().websocket_connect(message)
+
+    async def websocket_receive(self, message):
+        if not (self._profile_forced or _sampled()) or not _begin():
+            await super().websocket_receive(message)
+            return
+
+        try:
+            with Profile() as profile:
+                await super().websocket_receive(message)
+        finally:
+            _end()
+
+        name = type(self).__name__
+        if self._profile_forced or profile.duration >= threshold_for(name):
+            profile.save(name)
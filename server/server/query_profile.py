@@ -0,0 +1,131 @@
+"""
+Профилирование SQL-запросов и бюджеты запросов представлений.
+
+QueryProfileMiddleware (включается QUERY_PROFILE, по умолчанию в DEBUG)
+считает запросы каждого HTTP-запроса через execute_wrapper всех соединений
+и добавляет заголовки ответа:
+    X-DB-Query-Count, X-DB-Query-Time-Ms, X-DB-Duplicate-Queries
+Последние QUERY_PROFILE_HISTORY профилей с самыми частыми повторяющимися
+формами запросов доступны staff-пользователям на /debug/queries.
+
+@query_budget(n) объявляет, сколько запросов может сделать представление.
+Превышение пишется в лог, а при QUERY_BUDGET_STRICT поднимает
+QueryBudgetExceeded — тест падает (см. game/tests/test_query_budgets.py).
+"""
+import collections
+import contextlib
+import functools
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def query_shape(sql: str) -> str:
+    """Форма запроса: параметры уже вынесены Django в %s, схлопываем только списки IN."""
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """execute_wrapper, накапливающий число, время и формы запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: collections.Counter = collections.Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def duplicates(self) -> dict:
+        return {shape: n for shape, n in self.shapes.items() if n > 1}
+
+    def summary(self, top: int = 5) -> dict:
+        duplicates = sorted(self.duplicates().items(), key=lambda item: -item[1])[:top]
+        return {
+            'queries': self.count,
+            'time_ms': round(self.duration * 1000, 2),
+            'duplicates': [{'count': n, 'sql': shape} for shape, n in duplicates],
+        }
+
+
+@contextlib.contextmanager
+def record_queries():
+    """Записывает все запросы текущего потока ко всем базам внутри блока."""
+    recorder = QueryRecorder()
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def query_budget(max_queries: int):
+    """Бюджет SQL-запросов представления (считаются запросы самого представления)."""
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            with record_queries() as recorder:
+                response = view_func(request, *args, **kwargs)
+            if recorder.count > max_queries:
+                message = (f"{view_func.__module__}.{view_func.__name__} made {recorder.count} queries, "
+                           f"budget {max_queries}: {recorder.summary()}")
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+_recent: collections.deque = collections.deque(maxlen=getattr(settings, 'QUERY_PROFILE_HISTORY', 100))
+_recent_lock = threading.Lock()
+
+
+class QueryProfileMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_PROFILE', settings.DEBUG)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        duplicates = recorder.duplicates()
+        response['X-DB-Query-Count'] = str(recorder.count)
+        response['X-DB-Query-Time-Ms'] = f'{recorder.duration * 1000:.2f}'
+        response['X-DB-Duplicate-Queries'] = str(sum(duplicates.values()) - len(duplicates))
+        if request.path != '/debug/queries':
+            with _recent_lock:
+                _recent.append({'method': request.method, 'path': request.path, 'status': response.status_code, **recorder.summary()})
+        return response
+
+
+def recent_queries_view(request):
+    """Последние профили запросов (только staff)."""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Доступ запрещен.'}, status=403)
+    with _recent_lock:
+        profiles = list(_recent)
+    return JsonResponse({'success': True, 'profiles': profiles[::-1]})
@@ -2,6 +2,7 @@
 Django settings for server project.
 """
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -30,11 +31,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'server.logging_utils.RequestIdMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'server.auth_cache.CachedAuthenticationMiddleware',
+    'server.db_router.PrimaryPinMiddleware',
+    'server.query_profile.QueryProfileMiddleware',
+    'server.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,12 +67,125 @@ ASGI_APPLICATION = 'server.asgi.application'
 
 
 
-DATABASES = {
-    'default': {
+# Профиль базы данных выбирается переменной окружения DJANGO_DB_PROFILE:
+#   sqlite   (по умолчанию) — файл db.sqlite3 в режиме WAL;
+#   postgres — PostgreSQL с постоянными соединениями и пулом.
+DB_PROFILE = os.getenv('DJANGO_DB_PROFILE', 'sqlite')
+
+
+def _sqlite_database(name):
+    """
+    SQLite, настроенный под конкурентные ходы: WAL позволяет читать во время
+    записи, synchronous=NORMAL убирает fsync на каждый коммит (в WAL это
+    безопасно), busy_timeout и IMMEDIATE-транзакции заменяют мгновенное
+    "database is locked" ожиданием очереди на запись.
+    """
+    busy_timeout_ms = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    return {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': busy_timeout_ms / 1000,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA busy_timeout={busy_timeout_ms};'
+                'PRAGMA foreign_keys=ON;'
+                'PRAGMA temp_store=MEMORY;'
+                f"PRAGMA cache_size=-{os.getenv('SQLITE_CACHE_KB', '20000')};"
+            ),
+        },
     }
-}
+
+
+def _postgres_database(prefix='POSTGRES'):
+    """
+    PostgreSQL. Режим пула задается {prefix}_POOL:
+      none      — постоянные соединения на процесс (CONN_MAX_AGE);
+      psycopg   — пул соединений драйвера psycopg 3 (нужен psycopg[pool]),
+                  CONN_MAX_AGE при этом обязан быть 0;
+      pgbouncer — серверный пул (pgbouncer в transaction mode): постоянные
+                  соединения к пулеру, серверные курсоры отключены.
+    """
+    pool_mode = os.getenv(f'{prefix}_POOL', 'none')
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv(f'{prefix}_DB', 'durak'),
+        'USER': os.getenv(f'{prefix}_USER', 'durak'),
+        'PASSWORD': os.getenv(f'{prefix}_PASSWORD', ''),
+        'HOST': os.getenv(f'{prefix}_HOST', 'localhost'),
+        'PORT': os.getenv(f'{prefix}_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if pool_mode == 'psycopg':
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv(f'{prefix}_POOL_MIN', '2')),
+            'max_size': int(os.getenv(f'{prefix}_POOL_MAX', '20')),
+            'timeout': float(os.getenv(f'{prefix}_POOL_TIMEOUT', '10')),
+        }
+    elif pool_mode == 'pgbouncer':
+        config['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return config
+
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {'default': _postgres_database()}
+elif DB_PROFILE == 'sqlite':
+    DATABASES = {'default': _sqlite_database(os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'))}
+else:
+    raise ValueError(f"Unknown DJANGO_DB_PROFILE: {DB_PROFILE!r} (expected 'sqlite' or 'postgres')")
+
+# Реплики для чтения (лобби, статус игры, таблица лидеров), см. server/db_router.py.
+#   sqlite:   SQLITE_REPLICA_PATHS=/path/replica1.sqlite3,/path/replica2.sqlite3
+#   postgres: POSTGRES_REPLICA_HOSTS=replica1.local,replica2.local
+# В тестах реплики зеркалируют 'default'.
+if DB_PROFILE == 'postgres':
+    _replica_configs = [
+        {**_postgres_database(), 'HOST': host}
+        for host in os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',') if host
+    ]
+else:
+    _replica_configs = [
+        _sqlite_database(path)
+        for path in os.getenv('SQLITE_REPLICA_PATHS', '').split(',') if path
+    ]
+
+DATABASE_REPLICAS = []
+for _i, _config in enumerate(_replica_configs, start=1):
+    _alias = f'replica{_i}'
+    DATABASES[_alias] = {**_config, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['server.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает только из основной базы
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DATABASE_REPLICA_PIN_SECONDS', '5'))
+
+# Кэш Django выбирается CACHE_BACKEND:
+#   locmem (по умолчанию) — в памяти процесса;
+#   redis — общий для всех процессов (REDIS_URL, нужен пакет redis).
+# В кэше хранится закрепление пользователя за основной базой после записи
+# (server/db_router.py). С репликами и несколькими процессами нужен redis:
+# иначе следующий запрос, попавший в другой процесс, прочитает реплику и
+# может не увидеть только что сделанную запись. Там же результаты ходов с
+# action_id (game/idempotency.py): с locmem повтор на другом процессе их не найдет.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+        },
+    }
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+else:
+    raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND!r} (expected 'locmem' or 'redis')")
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -93,23 +211,199 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'lobby'
 LOGOUT_REDIRECT_URL = 'login'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-    },
+# Слой каналов выбирается CHANNEL_LAYER_BACKEND:
+#   memory       (по умолчанию) — только внутри одного процесса, для разработки;
+#   redis        — channels_redis, группы видны всем воркерам daphne;
+#   redis-pubsub — channels_redis на Redis Pub/Sub (меньше задержка, без очередей).
+# REDIS_URL может указывать на Unix-сокет (unix:///run/redis/redis.sock)
+# для нескольких воркеров на одном хосте.
+CHANNEL_LAYER_BACKEND = os.getenv('CHANNEL_LAYER_BACKEND', 'memory')
+_channel_layer_options = {
+    # Сообщений в очереди одного канала, после чего отправка получает ChannelFull
+    'capacity': int(os.getenv('CHANNEL_CAPACITY', '100')),
+    # Сколько секунд непрочитанное сообщение живет в канале
+    'expiry': int(os.getenv('CHANNEL_EXPIRY', '60')),
+    # Сколько секунд канал остается в группе без явного group_discard
+    'group_expiry': int(os.getenv('CHANNEL_GROUP_EXPIRY', '86400')),
+}
+
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [os.getenv('REDIS_URL', 'redis://localhost:6379/0')],
+                'prefix': os.getenv('CHANNEL_PREFIX', 'durak'),
+                **_channel_layer_options,
+            },
+        },
+    }
+elif CHANNEL_LAYER_BACKEND == 'redis-pubsub':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {
+                'hosts': [os.getenv('REDIS_URL', 'redis://localhost:6379/0')],
+                'prefix': os.getenv('CHANNEL_PREFIX', 'durak'),
+            },
+        },
+    }
+elif CHANNEL_LAYER_BACKEND == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': _channel_layer_options,
+        },
+    }
+else:
+    raise ValueError(f"Unknown CHANNEL_LAYER_BACKEND: {CHANNEL_LAYER_BACKEND!r}")
+
+# Доля заполнения очереди канала, после которой потребитель считается
+# медленным (предупреждение в лог, см. game/ws_health.py)
+SLOW_CONSUMER_QUEUE_RATIO = 0.5
+
+# Шардирование комнат по воркерам daphne (game/sharding.py). Для нескольких
+# процессов требует общего channel layer (CHANNEL_LAYER_BACKEND=redis).
+ROOM_SHARDING = os.getenv('ROOM_SHARDING', '0') == '1'
+SHARD_HEARTBEAT_SECONDS = int(os.getenv('SHARD_HEARTBEAT_SECONDS', '5'))
+# Воркер без heartbeat дольше этого считается ушедшим, его комнаты переходят другим
+SHARD_WORKER_TTL = int(os.getenv('SHARD_WORKER_TTL', '15'))
+SHARD_FORWARD_TIMEOUT = float(os.getenv('SHARD_FORWARD_TIMEOUT', '5'))
+SHARD_VNODES = 64
+SHARD_LIVE_ROOMS_MAX = int(os.getenv('SHARD_LIVE_ROOMS_MAX', '5000'))
+# Постоянное имя слота воркера (например, daphne-1, daphne-2). Пустое значение —
+# hostname-pid, новое при каждом рестарте.
+SHARD_WORKER_ID = os.getenv('SHARD_WORKER_ID', '')
+
+# Локальный журнал снимков партий (game/snapshots.py); пустое значение отключает.
+# Работает только вместе с ROOM_SHARDING=1 и заданным SHARD_WORKER_ID: файл
+# журнала называется по нему, и после рестарта слот должен найти свой файл.
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '')
+SNAPSHOT_SEGMENT_BYTES = int(os.getenv('SNAPSHOT_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+SNAPSHOT_COMPACT_EVERY = int(os.getenv('SNAPSHOT_COMPACT_EVERY', '10000'))
+SNAPSHOT_FSYNC = os.getenv('SNAPSHOT_FSYNC', '0') == '1'
+
+# Время на ход (game/timers.py): по истечении за игрока берутся карты / "бито".
+# По умолчанию выключено (0) — включается явно, например 60.
+DURAK_TURN_TIMEOUT_SECONDS = float(os.getenv('DURAK_TURN_TIMEOUT_SECONDS', '0'))
+DURAK_TIMER_TICK_SECONDS = 0.1
+
+# Задержка event loop и сброс нагрузки (game/loop_lag.py). Пороги сглаженной
+# задержки в секундах: 1 — реже опрос лобби, 2 — склейка обновлений зрителей и
+# отсрочка таймеров ходов, 3 — отказ в новых входах в комнаты с Retry-After.
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.05'))
+LOOP_LAG_TIERS = {
+    1: float(os.getenv('LOOP_LAG_THROTTLE', '0.05')),
+    2: float(os.getenv('LOOP_LAG_COALESCE', '0.2')),
+    3: float(os.getenv('LOOP_LAG_REJECT', '0.5')),
+}
+LOOP_LAG_RECOVERY_RATIO = 0.5
+LOBBY_POLL_SECONDS = 5
+LOAD_SHED_LOBBY_POLL_SECONDS = 15
+LOAD_SHED_COALESCE_SECONDS = 1.0
+LOAD_SHED_RETRY_AFTER = 10
+LOAD_SHED_TIMER_GRACE = 5.0
+
+# Возобновление WebSocket-сессий (game/replay.py): сколько последних событий
+# каждой комнаты хранит воркер для клиентов, переподключившихся с ?last_seq=N.
+REPLAY_BUFFER_EVENTS = int(os.getenv('REPLAY_BUFFER_EVENTS', '256'))
+REPLAY_BUFFER_ROOMS = 10000
+# Сколько сокет ждет событие, пропущенное в нумерации (пришло позже следующего
+# от другого процесса), прежде чем дослать его из буфера или полным состоянием
+REPLAY_GAP_WAIT_SECONDS = float(os.getenv('REPLAY_GAP_WAIT_SECONDS', '0.5'))
+
+# Исходящая очередь GameConsumer (game/outbound.py): клиент, у которого
+# сообщение ждет дольше бюджета или очередь длиннее лимита, отключается (код 4008).
+WS_OUTBOUND_MAX_MESSAGES = 512
+WS_OUTBOUND_LAG_BUDGET = float(os.getenv('WS_OUTBOUND_LAG_BUDGET', '10'))
+
+# Бинарный протокол WebSocket (game/wire.py): клиенты, предложившие подпротокол
+# durak.msgpack.v1, получают MessagePack с короткими ключами; остальные — JSON.
+WS_MSGPACK_ENABLED = os.getenv('WS_MSGPACK_ENABLED', '1') == '1'
+
+# Общее соединение пользователя (ws/mux/, game.consumers.MuxConsumer): лишние
+# соединения одного пользователя в процессе вытесняются, начиная со старых.
+MUX_MAX_CONNECTIONS_PER_USER = int(os.getenv('MUX_MAX_CONNECTIONS_PER_USER', '3'))
+MUX_MAX_TOPICS = 20
+
+# Кэш сессия -> пользователь (server/auth_cache.py) для HTTP и WebSocket.
+# TTL ограничивает, насколько выход или блокировка запаздывают на других
+# воркерах; 0 — отключить кэш.
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', '30'))
+AUTH_CACHE_MAX_ENTRIES = 50000
+
+# Идемпотентные ходы (game/idempotency.py): сколько секунд кэш Django помнит
+# результат хода с action_id, чтобы повтор получил исходный ответ. С несколькими
+# процессами нужен общий кэш (CACHE_BACKEND=redis).
+MOVE_DEDUP_TTL = int(os.getenv('MOVE_DEDUP_TTL', '600'))
+
+# Зрители (game/spectators.py, ws/spectate/<room_id>/): состояние без карт в
+# руках сериализуется один раз на версию. Задержка трансляции для турниров.
+SPECTATORS_ENABLED = os.getenv('SPECTATORS_ENABLED', '1') == '1'
+SPECTATOR_DELAY_SECONDS = float(os.getenv('SPECTATOR_DELAY_SECONDS', '0'))
+SPECTATOR_FRAME_CACHE = 1000
+SPECTATOR_MAX_PENDING = 1000
+
+# Адреса, с которых можно читать /metrics без входа (сборщик Prometheus)
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+
+# Профиль SQL-запросов каждого запроса (server/query_profile.py): заголовки
+# X-DB-Query-* и /debug/queries. Строгий бюджет (QUERY_BUDGET_STRICT=1) вместо
+# предупреждения в лог поднимает исключение; тесты бюджетов включают его сами.
+QUERY_PROFILE = os.getenv('QUERY_PROFILE', '1' if DEBUG else '0') == '1'
+QUERY_PROFILE_HISTORY = 100
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', '0') == '1'
+
+# Профилирование запросов на живом трафике (server/profiling.py): доля
+# PROFILE_SAMPLE_RATE запросов и сообщений WebSocket или запросы с заголовком
+# X-Profile: <PROFILE_TOKEN>. Профиль сохраняется, если запрос дольше порога.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sample')  # sample | cprofile
+PROFILE_INTERVAL = 0.001
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'durak-profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+PROFILE_THRESHOLD_DEFAULT = 0.25
+PROFILE_THRESHOLDS = {
+    'make_move_view': 0.1,
+    'game_status': 0.05,
+    'GameConsumer': 0.1,
+}
+
+# Диагностика памяти (game/memory.py, /debug/memory и /debug/tracemalloc):
+# глубина стека tracemalloc и модули, по которым группируются аллокации.
+MEMORY_TRACE_FRAMES = int(os.getenv('MEMORY_TRACE_FRAMES', '25'))
+MEMORY_TRACE_MODULES = ['game', 'players', 'server', 'channels']
+
+# Логи пишет отдельный поток (server/logging_utils.py): запросы не ждут вывода.
+# LOG_FORMAT=text (по умолчанию) — для разработки, json — по строке JSON с
+# request_id/room_id/move_id для агрегатора. Частые записи движка ниже WARNING
+# сэмплируются (LOG_SAMPLING).
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_SAMPLING = {
+    'game.game_logic': float(os.getenv('LOG_SAMPLE_ENGINE', '0.1')),
 }
 
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'server.logging_utils.SamplingFilter',
+            'rates': LOG_SAMPLING,
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            '()': 'server.logging_utils.AsyncQueueHandler',
+            'output': LOG_FORMAT,
+            'queue_size': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+            'filters': ['sampling'],
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': os.getenv('LOG_LEVEL', 'INFO'),
     },
     'loggers': {
         'django': {
@@ -118,4 +412,4 @@ LOGGING = {
             'propagate': False,
         },
     },
-}
\ No newline at end of file
+}
@@ -3,10 +3,15 @@ from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from players import views as player_views
 from game import views as game_views
+from server import query_profile
 
 urlpatterns = [
     path('', game_views.lobby_view, name='lobby'),
     path('admin/', admin.site.urls),
+    path('metrics', game_views.metrics_view, name='metrics'),
+    path('debug/queries', query_profile.recent_queries_view, name='debug_queries'),
+    path('debug/memory', game_views.memory_view, name='debug_memory'),
+    path('debug/tracemalloc', game_views.tracemalloc_view, name='debug_tracemalloc'),
 
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='login'), name='logout'),
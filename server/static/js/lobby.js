@@ -1,23 +1,44 @@
 $(document).ready(function() {
-  // Функция для обновления списка игр
+  // Список комнат перерисовывается по событиям темы lobby общего соединения
+  // пользователя (static/js/websocket.js), а не опросом сервера по таймеру.
+  // Пачка изменений (создание, вход, старт) дает одну перезагрузку списка.
+  const LOBBY_REFRESH_DELAY = 300;
+  let refreshTimer = null;
+  let subscribed = false;
+
   function updateGamesList() {
-      $.get('/game/list/', function(data) {
-          $('#games-list').empty();
-          if (data.games.length === 0) {
-              $('#games-list').append('<div class="no-games">Нет активных игр</div>');
-          } else {
-              data.games.forEach(function(game) {
-                  const gameItem = `
-                      <div class="game-item">
-                          <span>Игра #${game.id} (${game.players_count}/${game.max_players})</span>
-                          <button class="join-game" data-game-id="${game.id}">Присоединиться</button>
-                      </div>
-                  `;
-                  $('#games-list').append(gameItem);
-              });
+      $.get(window.location.href, function(html) {
+          const fresh = $('<div>').append($.parseHTML(html)).find('#rooms-list');
+          if (fresh.length) {
+              $('#rooms-list').replaceWith(fresh);
+          }
+      });
+  }
+
+  function scheduleUpdate() {
+      if (refreshTimer === null) {
+          refreshTimer = setTimeout(function() {
+              refreshTimer = null;
+              updateGamesList();
+          }, LOBBY_REFRESH_DELAY);
+      }
+  }
+
+  if ($('#rooms-list').length && typeof MuxConnection !== 'undefined') {
+      const userId = JSON.parse(document.getElementById('user-id-data').textContent);
+      const mux = new MuxConnection(MUX_WORKER_URL, userId);
+      mux.subscribe('lobby', function(data) {
+          if (data.action === 'logged_out') {
+              window.location.reload();
+          } else if (data.action === 'lobby_changed') {
+              scheduleUpdate();
+          } else if (data.action === 'subscribe_result' && data.success) {
+              // После переподключения изменения, прошедшие мимо, подтягиваются заново
+              if (subscribed) {
+                  scheduleUpdate();
+              }
+              subscribed = true;
           }
-      }).fail(function() {
-          alert('Ошибка при загрузке списка игр');
       });
   }
 
@@ -116,10 +137,4 @@ $(document).ready(function() {
       }
       return cookieValue;
   }
-
-  // Первоначальная загрузка списка игр
-  updateGamesList();
-  
-  // Обновляем список каждые 5 секунд
-  setInterval(updateGamesList, 5000);
-});
\ No newline at end of file
+}); 
\ No newline at end of file
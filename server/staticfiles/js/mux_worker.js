@@ -0,0 +1,168 @@
+// Общее соединение ws/mux/ для всех вкладок пользователя.
+// Запускается как SharedWorker (одно соединение на браузер) или, если он не
+// поддерживается, как обычный Worker вкладки — протокол тот же.
+// Вкладки присылают {type: 'subscribe' | 'unsubscribe', topic},
+// {type: 'send', message} и {type: 'close'}; worker держит одну подписку на
+// тему и помнит last_seq комнат, чтобы после обрыва получить только пропущенное.
+//
+// Worker создается с именем mux:<user_id> (см. MuxConnection), так что у
+// разных пользователей одного браузера разные worker-ы и соединения. Сервер
+// закрывает соединение с кодом 4003, если сессия уже принадлежит другому
+// пользователю (выход и вход), — тогда worker не переподключается.
+
+const subscribers = new Map();  // тема -> Set(port)
+const lastSeq = new Map();      // room:<id> -> последний номер события
+const ports = new Set();
+const userId = self.name.startsWith('mux:') ? self.name.slice(4) : '';
+// Сообщения вкладок, отправленные без соединения; уходят после переподключения
+const outgoing = [];
+const OUTGOING_LIMIT = 100;
+let socket = null;
+let retryDelay = 1000;
+let retryTimer = null;
+
+function socketUrl() {
+    const scheme = self.location.protocol === 'https:' ? 'wss' : 'ws';
+    const query = userId ? `?user=${encodeURIComponent(userId)}` : '';
+    return `${scheme}://${self.location.host}/ws/mux/${query}`;
+}
+
+function isOpen() {
+    return socket !== null && socket.readyState === WebSocket.OPEN;
+}
+
+// Подписки не копятся: после подключения они отправляются заново по subscribers
+function sendToServer(message) {
+    if (isOpen()) {
+        socket.send(JSON.stringify(message));
+    }
+}
+
+function sendOrQueue(message) {
+    if (isOpen()) {
+        socket.send(JSON.stringify(message));
+        return;
+    }
+    if (outgoing.length >= OUTGOING_LIMIT) {
+        outgoing.shift();
+    }
+    outgoing.push(message);
+}
+
+function sendSubscribe(topic) {
+    const message = {action: 'subscribe', topic};
+    if (lastSeq.has(topic)) {
+        message.last_seq = lastSeq.get(topic);
+    }
+    sendToServer(message);
+}
+
+function connect() {
+    retryTimer = null;
+    socket = new WebSocket(socketUrl());
+    socket.onopen = function() {
+        retryDelay = 1000;
+        for (const topic of subscribers.keys()) {
+            sendSubscribe(topic);
+        }
+        for (const message of outgoing.splice(0)) {
+            socket.send(JSON.stringify(message));
+        }
+    };
+    socket.onmessage = function(e) {
+        const data = JSON.parse(e.data);
+        // Кадры зрителя приходят готовым JSON без topic
+        const topic = data.topic || (data.action === 'spectator_state' ? `spectate:${data.room_id}` : null);
+        if (topic && topic.startsWith('room:') && typeof data.seq === 'number') {
+            lastSeq.set(topic, data.seq);
+        }
+        const targets = topic ? (subscribers.get(topic) || []) : ports;
+        targets.forEach(port => port.postMessage(data));
+    };
+    socket.onclose = function(e) {
+        if (e.target !== socket) {
+            return;  // соединение закрыто намеренно (shutdown), новое уже могло открыться
+        }
+        socket = null;
+        if (e.code === 4009) {
+            // Соединение вытеснено более новым (другой браузер пользователя)
+            ports.forEach(port => port.postMessage({action: 'replaced'}));
+            return;
+        }
+        if (e.code === 4003) {
+            // Сессия браузера принадлежит другому пользователю: данные этого не показываем
+            outgoing.length = 0;
+            ports.forEach(port => port.postMessage({action: 'logged_out'}));
+            return;
+        }
+        if (ports.size > 0) {
+            retryTimer = setTimeout(connect, retryDelay + Math.random() * 1000);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        }
+    };
+}
+
+// Последняя вкладка закрылась: соединение больше никому не нужно
+function shutdown() {
+    if (retryTimer !== null) {
+        clearTimeout(retryTimer);
+        retryTimer = null;
+    }
+    outgoing.length = 0;
+    if (socket) {
+        const closing = socket;
+        socket = null;
+        closing.close();
+    }
+}
+
+function handle(port, data) {
+    if (data.type === 'subscribe') {
+        let topicPorts = subscribers.get(data.topic);
+        if (!topicPorts) {
+            topicPorts = new Set();
+            subscribers.set(data.topic, topicPorts);
+            sendSubscribe(data.topic);
+        }
+        topicPorts.add(port);
+    } else if (data.type === 'unsubscribe') {
+        unsubscribe(port, data.topic);
+    } else if (data.type === 'send') {
+        sendOrQueue(data.message);
+    } else if (data.type === 'close') {
+        for (const topic of [...subscribers.keys()]) {
+            unsubscribe(port, topic);
+        }
+        ports.delete(port);
+        if (ports.size === 0) {
+            shutdown();
+        }
+    }
+}
+
+function unsubscribe(port, topic) {
+    const topicPorts = subscribers.get(topic);
+    if (!topicPorts) {
+        return;
+    }
+    topicPorts.delete(port);
+    if (topicPorts.size === 0) {
+        subscribers.delete(topic);
+        lastSeq.delete(topic);
+        sendToServer({action: 'unsubscribe', topic});
+    }
+}
+
+function addPort(port) {
+    ports.add(port);
+    port.onmessage = e => handle(port, e.data);
+    if (!socket && retryTimer === null) {
+        connect();
+    }
+}
+
+if ('onconnect' in self) {
+    self.onconnect = e => addPort(e.ports[0]);
+} else {
+    addPort(self);
+}
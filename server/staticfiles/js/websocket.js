@@ -1,13 +1,50 @@
+// Одно соединение ws/mux/ на пользователя: вкладки делят его через
+// SharedWorker (static/js/mux_worker.js) и подписываются на темы
+// lobby, room:<id>, spectate:<id>. Worker именуется по пользователю: после
+// выхода и входа под другим именем вкладки не получают чужое соединение.
+class MuxConnection {
+    constructor(workerUrl = '/static/js/mux_worker.js', userId = '') {
+        this.handlers = new Map();
+        const options = {name: `mux:${userId}`};
+        if (window.SharedWorker) {
+            this.port = new SharedWorker(workerUrl, options).port;
+        } else {
+            this.port = new Worker(workerUrl, options);
+        }
+        this.port.onmessage = (e) => this.dispatch(e.data);
+        window.addEventListener('beforeunload', () => this.port.postMessage({type: 'close'}));
+    }
+
+    dispatch(data) {
+        const topic = data.topic || (data.action === 'spectator_state' ? `spectate:${data.room_id}` : null);
+        const handler = topic ? this.handlers.get(topic) : null;
+        if (handler) {
+            handler(data);
+        } else {
+            this.handlers.forEach(h => h(data));
+        }
+    }
+
+    subscribe(topic, handler) {
+        this.handlers.set(topic, handler);
+        this.port.postMessage({type: 'subscribe', topic});
+    }
+
+    unsubscribe(topic) {
+        this.handlers.delete(topic);
+        this.port.postMessage({type: 'unsubscribe', topic});
+    }
+
+    send(message) {
+        this.port.postMessage({type: 'send', message});
+    }
+}
+
 class GameConnection {
-    constructor(roomId) {
-        this.socket = new WebSocket(
-            `ws://${window.location.host}/ws/game/${roomId}/`
-        );
-        
-        this.socket.onmessage = (e) => {
-            const data = JSON.parse(e.data);
-            this.handleMessage(data);
-        };
+    constructor(roomId, mux = new MuxConnection()) {
+        this.topic = `room:${roomId}`;
+        this.mux = mux;
+        this.mux.subscribe(this.topic, (data) => this.handleMessage(data));
     }
 
     handleMessage(data) {
@@ -23,9 +60,10 @@ class GameConnection {
     }
 
     sendAction(action, data = {}) {
-        this.socket.send(JSON.stringify({
+        this.mux.send({
             action,
+            topic: this.topic,
             ...data
-        }));
+        });
     }
-}
\ No newline at end of file
+}